@@ -3,13 +3,8 @@
 # This code is licensed under the MIT License. See LICENSE file for details.
 
 import os
-import logging.config
 from dotenv import load_dotenv
 
-from db.setup import create_database_and_tables
-
-logging.config.fileConfig("logging.conf")
-
 # Load environment variables from .env file
 load_dotenv()
 
@@ -25,6 +20,72 @@ DATABASE_CONFIG = {
     "PORT": os.getenv("DB_PORT", "5432"),
 }
 
-create_database_and_tables(DATABASE_CONFIG)
-
 incremental_learning_batch = 50
+# The ml/create_model_* scripts train with this profile of ml.model.TRAINING_PROFILES,
+# XGBoost's defaults if unset
+training_profile = os.getenv("TRAINING_PROFILE")
+# "numpy" serves predictions from models compiled by ml.compiled instead of XGBoost
+serving_backend = os.getenv("SERVING_BACKEND", "xgboost")
+
+# Background jobs for long-running bot callbacks
+prediction_workers = 4
+job_queue_max_depth = 100
+job_queue_max_per_chat = 3
+
+# A prediction waits this many seconds for player histories; late players get stats
+# imputed from earlier fetches, the training data or hero averages
+prediction_deadline = 60
+# The reply shows how many player histories are fetched, edited at most this often
+progress_edit_interval = 1.0
+match_training_data_path = "dataset/train_data/all_data_match_predict.csv"
+hero_pick_training_data_path = "dataset/train_data/all_data_hero_pick.csv"
+
+# OpenDota requests that came back missing (404), empty (private profiles) or failing
+# after every retry are not repeated for this many seconds
+negative_cache_ttl_not_found = 21600
+negative_cache_ttl_empty = 3600
+negative_cache_ttl_failed = 300
+# Players' averages are built from the projected fields of this many recent matches
+match_cache_size = 2000
+
+# Upstream calls time out after http_timeout seconds. An endpoint's circuit opens after
+# this many consecutive failed or slow calls and is probed again after the reset timeout
+http_timeout = 10
+circuit_failure_threshold = 5
+circuit_slow_call_seconds = 5
+circuit_reset_timeout = 30
+# Slow player and match GETs are sent a second time once they run past the p95 latency
+# of their endpoint, for at most 5% of requests
+hedge_percentile = 95
+hedge_budget = 0.05
+hedge_min_samples = 20
+hedge_workers = 32
+# Hero stats are shared by every hero and reused for this many seconds
+hero_stats_max_age = 600
+
+# Match and hero-pick predictions of live matches are computed in the background
+prewarm_workers = 2
+prewarm_refresh_interval = 60
+prediction_cache_max_age = 3600
+
+# Raw OpenDota data for the training datasets is collected on this many threads into
+# a local warehouse, from which the datasets are rebuilt
+dataset_workers = 8
+dataset_warehouse_path = "dataset/warehouse.sqlite"
+
+# Live win-probability tracking
+max_tracked_matches = 1000
+# Each match is polled every 10-60 seconds depending on how eventful the game is,
+# within a budget of polls per minute shared by all tracked matches
+dota_plus_poll_interval = 60
+tracker_min_poll_interval = 10
+tracker_feed_refresh_interval = 10
+tracker_poll_budget = 600
+tracker_http_concurrency = 8
+tracker_telegram_concurrency = 4
+
+# Live messages are edited when the Radiant win probability moves by this much or
+# the game clock advances by this many seconds, at most once a second per chat
+tracker_edit_threshold = 0.01
+tracker_edit_time_step = 300
+tracker_edit_interval = 1.0
@@ -0,0 +1,171 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import csv
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import requests
+
+from config import dataset_workers, opendota_key
+from structure import http_client
+from structure.opendota import OpenDotaApi
+
+logger = logging.getLogger(__name__)
+
+OPENDOTA_URL = "https://api.opendota.com/api"
+
+# The premium leagues the training datasets are generated from
+LEAGUES = [
+    "ESL One Kuala Lumpur powered by Intel",
+    "BetBoom Dacha Dubai 2024",
+    "DreamLeague Season 22 powered by Intel",
+    "Elite League Season 2 Main Event – presented by ESB",
+    "ESL One Birmingham 2024 Powered by Intel",
+    "DreamLeague Season 23 powered by Intel",
+    "Riyadh Masters 2024 at Esports World Cup",
+    "Clavision DOTA League S1 : Snow-Ruyi",
+    "The International 2024",
+    "PGL Wallachia 2024 Season 1",
+    "The International 2023",
+    "Riyadh Masters 2023 by Gamers8",
+    "BetBoom Dacha",
+    "DreamLeague Season 21 powered by Intel",
+    "The Bali Major",
+    "DreamLeague Season 20 powered by Intel",
+    "ESL One The Berlin Major powered by Intel",
+    "DreamLeague Season 19 powered by Intel",
+    "Lima Major 2023",
+    "The International 2022",
+    "ESL One Malaysia 2022 powered by Intel",
+    "PGL Arlington Major 2022",
+    "Riyadh Masters by Gamers8",
+    "ESL One Stockholm Major 2022 powered by Intel",
+    "Gamers Galaxy: Dota 2 Invitational Series Dubai 2022",
+    "The International 2021",
+    "SAPPHIRE OGA DOTA PIT INVITATIONAL",
+    "ESL One Fall 2021 powered by Intel",
+    "ESL One Summer 2021 powered by Intel",
+]
+
+
+class PartitionedWriter:
+    """
+    Writes rows with a fixed set of `columns` to one CSV partition per league in
+    `directory`, replacing earlier partitions. Each row is appended as it comes.
+    """
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+        self.files = {}
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".csv"):
+                os.remove(os.path.join(directory, name))
+
+    def path(self, partition):
+        return os.path.join(self.directory, f"{partition.replace(' ', '_')}.csv")
+
+    def write(self, partition, row):
+        if partition not in self.files:
+            file = open(self.path(partition), "w", newline="")
+            writer = csv.DictWriter(file, self.columns, lineterminator="\n")
+            writer.writeheader()
+            self.files[partition] = (file, writer)
+        self.files[partition][1].writerow(row)
+
+    def close(self):
+        for file, _ in self.files.values():
+            file.close()
+        self.files.clear()
+
+
+def fetch(url, endpoint):
+    """The JSON document at an OpenDota `url`, None if it can't be fetched."""
+    try:
+        response = http_client.get(f"{url}?api_key={opendota_key}", endpoint)
+    except requests.RequestException as e:
+        logger.warning(f"Fetching {url} failed: {e}")
+        return None
+    if response.status_code != 200:
+        logger.warning(f"Fetching {url} failed: {response.status_code}")
+        return None
+    return response.json()
+
+
+def collect_league(warehouse, league):
+    match_list = fetch(
+        f"{OPENDOTA_URL}/leagues/{league['leagueid']}/matches", "league_matches"
+    )
+    if match_list is not None:
+        warehouse.add_league(league["leagueid"], league["name"], match_list)
+
+
+def collect_match(warehouse, match_id):
+    match = fetch(f"{OPENDOTA_URL}/matches/{match_id}", "match")
+    if match is not None:
+        warehouse.add_match(match)
+
+
+def collect_matchups(warehouse, hero_id):
+    matchups = fetch(f"{OPENDOTA_URL}/heroes/{hero_id}/matchups", "hero_matchups")
+    if matchups is not None:
+        warehouse.add_hero_matchups(hero_id, matchups)
+
+
+def run(pool, task, items, what):
+    """Runs `task` for each item on `pool`, logging progress."""
+    futures = [pool.submit(task, item) for item in items]
+    for done, future in enumerate(as_completed(futures), 1):
+        future.result()
+        if done % 100 == 0 or done == len(futures):
+            logger.info(f"Collected {done} of {len(futures)} {what}")
+
+
+def collect(warehouse, leagues=LEAGUES, workers=dataset_workers):
+    """
+    Downloads the match lists, match details, hero stats and hero matchups of
+    `leagues` into `warehouse` on a pool of `workers` threads.
+
+    Whatever is already in the warehouse is not fetched again, so an interrupted
+    collection resumes where it stopped and failed requests are retried by the next.
+    """
+    pending = [
+        league
+        for league in OpenDotaApi().set_premium_leagues()
+        if league["name"] in leagues and not warehouse.has_league(league["leagueid"])
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        run(pool, partial(collect_league, warehouse), pending, "league match lists")
+        run(
+            pool,
+            partial(collect_match, warehouse),
+            warehouse.missing_matches(),
+            "matches",
+        )
+        if not warehouse.has_hero_stats():
+            hero_stats = fetch(f"{OPENDOTA_URL}/heroStats", "hero_stats")
+            if hero_stats is not None:
+                warehouse.add_hero_stats(hero_stats)
+        run(
+            pool,
+            partial(collect_matchups, warehouse),
+            warehouse.missing_matchups(),
+            "hero matchups",
+        )
+
+
+def write_dataset(rows, columns, directory):
+    """Writes `(league, row)` pairs to `directory`, one CSV partition per league."""
+    writer = PartitionedWriter(directory, columns)
+    count = 0
+    try:
+        for count, (league, row) in enumerate(rows, 1):
+            writer.write(league, row)
+    finally:
+        writer.close()
+    logger.info(f"Wrote {count} rows to {directory}")
@@ -8,6 +8,7 @@ import seaborn as sns
 from matplotlib import pyplot as plt
 
 from structure.helpers import prepare_hero_pick_data
+from structure.columnar import load_training_data
 
 
 pd.set_option("display.max_columns", None)
@@ -16,7 +17,7 @@ file_path = os.path.join("..", "dataset", "train_data", "all_data_hero_pick.csv"
 # scaler_path = "../scaler.pkl"
 
 # Load and prepare the dataset
-df = pd.read_csv(file_path)
+df = load_training_data(file_path)
 df = prepare_hero_pick_data(df)
 
 # Specify the features and target column
@@ -7,6 +7,7 @@ import seaborn as sns
 from matplotlib import pyplot as plt
 
 from structure.helpers import prepare_match_prediction_data
+from structure.columnar import load_training_data
 
 
 pd.set_option("display.max_columns", None)
@@ -15,7 +16,7 @@ file_path = os.path.join("..", "dataset", "train_data", "all_data_match_predict.
 scaler_path = "../scaler.pkl"
 
 # Load and prepare the dataset
-df = pd.read_csv(file_path)
+df = load_training_data(file_path)
 df = prepare_match_prediction_data(df, scaler_path)
 
 # Specify the features and target column
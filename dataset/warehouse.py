@@ -0,0 +1,295 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import json
+import logging
+import sqlite3
+import zlib
+from itertools import groupby
+from threading import Lock
+
+from structure.projection import MATCH_PLAYER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Per-player stats kept as columns; the whole match is kept in matches.payload
+PLAYER_STATS = [field for field in MATCH_PLAYER_FIELDS if field != "account_id"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS leagues (
+    league_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS league_matches (
+    match_id INTEGER PRIMARY KEY,
+    league_id INTEGER NOT NULL,
+    radiant_team_id INTEGER,
+    dire_team_id INTEGER,
+    radiant_win INTEGER
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id INTEGER PRIMARY KEY,
+    radiant_team_id INTEGER,
+    radiant_name TEXT,
+    dire_team_id INTEGER,
+    dire_name TEXT,
+    radiant_win INTEGER,
+    payload BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL,
+    player_slot INTEGER NOT NULL,
+    is_radiant INTEGER NOT NULL,
+    account_id INTEGER,
+    name TEXT,
+    hero_id INTEGER,
+    {", ".join(f"{stat} REAL" for stat in PLAYER_STATS)},
+    PRIMARY KEY (match_id, player_slot)
+);
+CREATE TABLE IF NOT EXISTS hero_stats (
+    hero_id INTEGER PRIMARY KEY,
+    name TEXT,
+    pro_win INTEGER,
+    pro_pick INTEGER,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hero_matchups (
+    hero_id INTEGER NOT NULL,
+    against_hero_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    games_played INTEGER,
+    wins INTEGER,
+    PRIMARY KEY (hero_id, against_hero_id)
+);
+"""
+
+# Each player's hero against every enemy hero, in the order OpenDota lists matchups
+COUNTER_PICKS = """
+SELECT p.match_id, p.player_slot, m.position,
+       CASE WHEN m.games_played > 0 THEN CAST(m.wins AS REAL) / m.games_played
+            ELSE 0 END AS win_rate
+FROM match_players p
+JOIN match_players e ON e.match_id = p.match_id AND e.is_radiant != p.is_radiant
+JOIN hero_matchups m ON m.hero_id = p.hero_id AND m.against_hero_id = e.hero_id
+"""
+
+MATCH_COLUMNS = [
+    "match_id",
+    "radiant_team_id",
+    "radiant_team_name",
+    "dire_team_id",
+    "dire_team_name",
+    "radiant_win",
+]
+PLAYER_COLUMNS = ["id", "name", "hero_id", "hero_name", "hero_winrate"] + PLAYER_STATS
+INSERT_PLAYER = (
+    f"INSERT INTO match_players VALUES ({', '.join('?' * (6 + len(PLAYER_STATS)))})"
+)
+
+
+class Warehouse:
+    """
+    Raw OpenDota data collected for the training datasets, kept in SQLite so the
+    datasets can be rebuilt offline.
+
+    League match lists, match details, hero stats and hero matchups are stored as
+    tables for set-based queries; whole match payloads are kept compressed for
+    features that need more than the stored columns. Writes are safe from any thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def _write(self, sql, rows):
+        with self.lock, self.connection:
+            self.connection.executemany(sql, rows)
+
+    def add_league(self, league_id, name, match_list):
+        self._write(
+            "INSERT OR REPLACE INTO league_matches VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    info["match_id"],
+                    league_id,
+                    info.get("radiant_team_id"),
+                    info.get("dire_team_id"),
+                    info.get("radiant_win"),
+                )
+                for info in match_list
+            ],
+        )
+        # The league is stored last, marking its match list as complete
+        self._write("INSERT OR REPLACE INTO leagues VALUES (?, ?)", [(league_id, name)])
+
+    def add_match(self, match):
+        players = [
+            (
+                match["match_id"],
+                player["player_slot"],
+                player["isRadiant"],
+                player.get("account_id"),
+                player.get("name"),
+                player.get("hero_id"),
+                *(player.get(stat, 0) for stat in PLAYER_STATS),
+            )
+            for player in match.get("players", [])
+        ]
+        payload = zlib.compress(json.dumps(match).encode())
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM match_players WHERE match_id = ?", (match["match_id"],)
+            )
+            self.connection.executemany(INSERT_PLAYER, players)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    match["match_id"],
+                    match.get("radiant_team_id"),
+                    match.get("radiant_name"),
+                    match.get("dire_team_id"),
+                    match.get("dire_name"),
+                    match.get("radiant_win"),
+                    payload,
+                ),
+            )
+
+    def add_hero_stats(self, hero_stats):
+        self._write(
+            "INSERT OR REPLACE INTO hero_stats VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    hero["id"],
+                    hero.get("localized_name"),
+                    hero.get("pro_win", 0),
+                    hero.get("pro_pick", 0),
+                    json.dumps(hero),
+                )
+                for hero in hero_stats
+            ],
+        )
+
+    def add_hero_matchups(self, hero_id, matchups):
+        self._write(
+            "INSERT OR REPLACE INTO hero_matchups VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    hero_id,
+                    matchup["hero_id"],
+                    position,
+                    matchup["games_played"],
+                    matchup["wins"],
+                )
+                for position, matchup in enumerate(matchups)
+            ],
+        )
+
+    def has_league(self, league_id):
+        return bool(
+            self._query("SELECT 1 FROM leagues WHERE league_id = ?", (league_id,))
+        )
+
+    def has_hero_stats(self):
+        return bool(self._query("SELECT 1 FROM hero_stats LIMIT 1"))
+
+    def missing_matches(self):
+        """Ids of listed matches whose details are not collected yet."""
+        return [
+            row["match_id"]
+            for row in self._query(
+                "SELECT l.match_id FROM league_matches l "
+                "LEFT JOIN matches m ON m.match_id = l.match_id "
+                "WHERE m.match_id IS NULL ORDER BY l.match_id"
+            )
+        ]
+
+    def missing_matchups(self):
+        """Ids of the heroes played in collected matches whose matchups are not."""
+        return [
+            row["hero_id"]
+            for row in self._query(
+                "SELECT DISTINCT p.hero_id FROM match_players p "
+                "WHERE p.hero_id IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM hero_matchups m WHERE m.hero_id = p.hero_id) "
+                "ORDER BY p.hero_id"
+            )
+        ]
+
+    def payloads(self):
+        """Streams the whole collected match payloads, for features not in columns."""
+        cursor = self.connection.execute("SELECT payload FROM matches")
+        for (payload,) in cursor:
+            yield json.loads(zlib.decompress(payload))
+
+    def matches(self, leagues, counter_picks=False):
+        """
+        Streams `(league, match, players)` for the collected 5v5 matches of `leagues`.
+
+        `match` has the MATCH_COLUMNS and each player the PLAYER_COLUMNS, with the
+        radiant players first in slot order. With `counter_picks`, each player also
+        has the `counter_picks` win rates of their hero against the enemy heroes.
+        """
+        if counter_picks:
+            counter_pick = "c.win_rate"
+            counter_pick_join = (
+                f"LEFT JOIN ({COUNTER_PICKS}) c "
+                "ON c.match_id = p.match_id AND c.player_slot = p.player_slot"
+            )
+            counter_pick_order = ", c.position"
+        else:
+            counter_pick, counter_pick_join, counter_pick_order = "NULL", "", ""
+        cursor = self.connection.execute(
+            f"""
+            SELECT l.name AS league, m.match_id, m.radiant_team_id,
+                   m.radiant_name AS radiant_team_name, m.dire_team_id,
+                   m.dire_name AS dire_team_name, m.radiant_win,
+                   p.player_slot, p.account_id AS id, p.name, p.hero_id,
+                   COALESCE(h.name, 'Unknown Hero') AS hero_name,
+                   CASE WHEN h.pro_pick > 0 THEN CAST(h.pro_win AS REAL) / h.pro_pick
+                        ELSE 0 END AS hero_winrate,
+                   {", ".join(f"p.{stat}" for stat in PLAYER_STATS)},
+                   {counter_pick} AS counter_pick
+            FROM matches m
+            JOIN league_matches lm ON lm.match_id = m.match_id
+            JOIN leagues l ON l.league_id = lm.league_id
+            JOIN match_players p ON p.match_id = m.match_id
+            LEFT JOIN hero_stats h ON h.hero_id = p.hero_id
+            {counter_pick_join}
+            WHERE l.name IN ({", ".join("?" * len(leagues))})
+              AND m.match_id IN (
+                  SELECT match_id FROM match_players GROUP BY match_id
+                  HAVING COUNT(*) = 10 AND SUM(is_radiant) = 5
+              )
+            ORDER BY m.match_id, p.is_radiant DESC, p.player_slot{counter_pick_order}
+            """,
+            list(leagues),
+        )
+        for _, rows in groupby(cursor, key=lambda row: row["match_id"]):
+            rows = list(rows)
+            match = {column: rows[0][column] for column in MATCH_COLUMNS}
+            match["radiant_win"] = bool(match["radiant_win"])
+            players = []
+            for _, player_rows in groupby(rows, key=lambda row: row["player_slot"]):
+                player_rows = list(player_rows)
+                player = {column: player_rows[0][column] for column in PLAYER_COLUMNS}
+                if counter_picks:
+                    player["counter_picks"] = [
+                        row["counter_pick"]
+                        for row in player_rows
+                        if row["counter_pick"] is not None
+                    ]
+                players.append(player)
+            yield rows[0]["league"], match, players
+
+    def close(self):
+        self.connection.close()
@@ -8,23 +8,30 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 import requests
-from sqlalchemy import create_engine
+from sqlalchemy import func, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 from config import DATABASE_CONFIG, opendota_key
-from db.setup import History, ModelTrainingMetadata
+from structure import http_client, projection
+from structure.http_client import CircuitOpenError
+from db.setup import (
+    History,
+    ModelTrainingMetadata,
+    HISTORY_FEATURE_COLUMNS,
+    create_database_engine,
+    init_database,
+)
 
 logger = logging.getLogger(__name__)
 
 
 def get_database_session():
-    """Creates and returns a database session."""
-    # Create the database URL
-    db_url = f"postgresql://{DATABASE_CONFIG['USER']}:{DATABASE_CONFIG['PASSWORD']}@{DATABASE_CONFIG['HOST']}:{DATABASE_CONFIG['PORT']}/{DATABASE_CONFIG['DB_NAME']}"
+    """Creates and returns a database session, bootstrapping the schema on first use."""
+    init_database(DATABASE_CONFIG)
 
     logger.info("Creating a new database session...")
     # Create the database engine
-    engine = create_engine(db_url)
+    engine = create_database_engine(DATABASE_CONFIG)
 
     # Create a configured "Session" class
     Session = sessionmaker(bind=engine)
@@ -142,6 +149,70 @@ def get_history_data_as_dataframe():
         logger.info("Database session closed after retrieving data.")
 
 
+def load_history_training_data(after_row_id=0, limit=None, chunk_size=1000):
+    """Loads labelled history rows straight into preallocated NumPy arrays.
+
+    Only the id, the label and the feature columns are selected with SQLAlchemy Core,
+    so no ORM objects are built. Call with the defaults to load the whole table for a
+    full retrain.
+
+    Args:
+        after_row_id (int): Only rows with a greater id are loaded.
+        limit (int, optional): Maximum number of rows to load.
+        chunk_size (int): Number of rows fetched from the cursor at once.
+
+    Returns:
+        tuple: Feature matrix (float32, columns in HISTORY_FEATURE_COLUMNS order),
+            label vector (float32) and the matching row ids (int64), ordered by id.
+    """
+    feature_columns = [History.__table__.c[name] for name in HISTORY_FEATURE_COLUMNS]
+    conditions = (History.actual_result.is_not(None), History.id > after_row_id)
+
+    session = get_database_session()
+    try:
+        total = session.execute(
+            select(func.count()).select_from(History).where(*conditions)
+        ).scalar_one()
+        if limit is not None:
+            total = min(total, limit)
+
+        features = np.empty((total, len(feature_columns)), dtype=np.float32)
+        labels = np.empty(total, dtype=np.float32)
+        row_ids = np.empty(total, dtype=np.int64)
+
+        statement = (
+            select(History.id, History.actual_result, *feature_columns)
+            .where(*conditions)
+            .order_by(History.id.asc())
+            .limit(total)
+            .execution_options(yield_per=chunk_size)
+        )
+        filled = 0
+        for rows in session.execute(statement).partitions(chunk_size):
+            # Rows inserted after the count query are cut off by the LIMIT above
+            block = np.asarray(rows, dtype=np.float64)
+            end = filled + len(block)
+            row_ids[filled:end] = block[:, 0]
+            labels[filled:end] = block[:, 1]
+            features[filled:end] = block[:, 2:]
+            filled = end
+
+        logger.info(
+            f"Loaded {filled} labelled history rows after row_id {after_row_id}"
+        )
+        return features[:filled], labels[:filled], row_ids[:filled]
+    except SQLAlchemyError as e:
+        logger.error(f"Error loading history training data: {e}")
+        return (
+            np.empty((0, len(feature_columns)), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+        )
+    finally:
+        session.close()
+        logger.info("Database session closed after loading history training data.")
+
+
 def fetch_and_update_actual_results():
     """Fetches actual results from OpenDota for matches with None actual_result and updates the database."""
     session = get_database_session()
@@ -158,12 +229,25 @@ def fetch_and_update_actual_results():
             logger.info(f"Fetching data for match_id={match_id} from OpenDota API...")
 
             # Fetch match data from OpenDota API
-            response = requests.get(
-                f"https://api.opendota.com/api/matches/{match_id}?api_key={opendota_key}"
-            )
+            try:
+                response = http_client.get(
+                    f"https://api.opendota.com/api/matches/{match_id}?api_key={opendota_key}",
+                    "match",
+                    stream=projection.STREAMING,
+                )
+            except CircuitOpenError as e:
+                # Every other match would fail fast as well
+                logger.warning(f"Not fetching match results: {e}")
+                break
+            except requests.RequestException as e:
+                logger.error(f"Failed to fetch data for match_id={match_id}: {e}")
+                continue
 
             if response.status_code == 200:
-                match_data = response.json()
+                # Only the result is decoded out of the full match payload
+                match_data = projection.decode(
+                    response, projection.MATCH_RESULT_PROJECTION
+                )
                 actual_result = match_data.get(
                     "radiant_win"
                 )  # Example field; adjust based on actual data structure
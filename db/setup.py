@@ -2,7 +2,17 @@
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
 
-from sqlalchemy import create_engine, Column, Integer, DateTime, Float, BigInteger
+from threading import Lock
+
+from sqlalchemy import (
+    create_engine,
+    text,
+    Column,
+    Integer,
+    DateTime,
+    Float,
+    BigInteger,
+)
 from sqlalchemy.ext.declarative import declarative_base
 import logging
 
@@ -10,6 +20,12 @@ logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# Seconds to wait for Postgres before giving up on a connection attempt
+CONNECT_TIMEOUT = 5
+
+_init_lock = Lock()
+_database_initialised = False
+
 
 class History(Base):
     __tablename__ = "history"
@@ -50,6 +66,15 @@ class History(Base):
     dire_avg_kda = Column(Float, nullable=False)
 
 
+# Feature columns in the order the match-predict model was trained on.
+HISTORY_FEATURE_COLUMNS = [
+    column.name
+    for column in History.__table__.columns
+    if column.name
+    not in ("id", "match_id", "model_prediction", "actual_result", "timestamp")
+]
+
+
 class ModelTrainingMetadata(Base):
     __tablename__ = "model_training_metadata"
 
@@ -57,18 +82,54 @@ class ModelTrainingMetadata(Base):
     last_trained_row_id = Column(Integer, nullable=False)
 
 
-def create_database_and_tables(DATABASE_CONFIG):
-    # Create the database URL
+def create_database_engine(DATABASE_CONFIG):
+    """Creates an engine for the configured database without connecting to it."""
     db_url = f"postgresql://{DATABASE_CONFIG['USER']}:{DATABASE_CONFIG['PASSWORD']}@{DATABASE_CONFIG['HOST']}:{DATABASE_CONFIG['PORT']}/{DATABASE_CONFIG['DB_NAME']}"
+    return create_engine(db_url, connect_args={"connect_timeout": CONNECT_TIMEOUT})
+
 
+def create_database_and_tables(DATABASE_CONFIG):
+    """Creates the missing tables. Returns True on success."""
     logger.info("Connecting to the database...")
     try:
         # Create the database engine
-        engine = create_engine(db_url)
+        engine = create_database_engine(DATABASE_CONFIG)
 
         # Create the tables in the database
         Base.metadata.create_all(engine)
 
         logger.info("Database and tables created successfully.")
+        return True
     except Exception as e:
         logger.error("Error occurred while creating database and tables: %s", e)
+        return False
+
+
+def is_database_ready(DATABASE_CONFIG):
+    """Readiness check: the schema is initialised and the database answers a query."""
+    if not _database_initialised:
+        return False
+    try:
+        with create_database_engine(DATABASE_CONFIG).connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.warning("Database is not ready: %s", e)
+        return False
+
+
+def init_database(DATABASE_CONFIG):
+    """
+    Bootstraps the schema once per process.
+
+    Safe to call from any thread and any number of times: after the first successful run
+    it returns immediately, and a failed run is retried on the next call.
+    """
+    global _database_initialised
+
+    if _database_initialised:
+        return True
+    with _init_lock:
+        if not _database_initialised:
+            _database_initialised = create_database_and_tables(DATABASE_CONFIG)
+    return _database_initialised
@@ -0,0 +1,119 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = {"binary:logistic", "reg:logistic"}
+
+
+def _depth(left, right):
+    depth, level = 0, [0]
+    while True:
+        level = [c for node in level for c in (left[node], right[node]) if c != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+class CompiledEnsemble:
+    """
+    A binary XGBoost model compiled into flat NumPy arrays of the nodes of its trees,
+    so that one row or a small batch is scored without XGBoost's per-call overhead.
+    Every tree is walked at once, one level per step. Exposes the predict and
+    predict_proba of the classifier it was compiled from.
+    """
+
+    def __init__(self, booster):
+        model = json.loads(bytes(booster.save_raw("json")))["learner"]
+        objective = model["objective"]["name"]
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Cannot compile a model with the {objective} objective")
+        if model["gradient_booster"]["name"] != "gbtree":
+            raise ValueError("Only gbtree models can be compiled")
+        forest = model["gradient_booster"]["model"]
+        trees = forest["trees"]
+        # Early-stopped models predict with the trees up to the best iteration only
+        best_iteration = model["attributes"].get("best_iteration")
+        if best_iteration is not None:
+            trees = trees[: forest["iteration_indptr"][int(best_iteration) + 1]]
+        if any(tree["categories_nodes"] for tree in trees):
+            raise ValueError("Categorical splits cannot be compiled")
+
+        # Newer XGBoost versions store the base score as a one-element list
+        base_score = float(model["learner_model_param"]["base_score"].strip("[]"))
+        self.base_margin = np.float32(np.log(base_score / (1 - base_score)))
+        self.feature_names = model.get("feature_names") or None
+
+        nodes = max(len(tree["left_children"]) for tree in trees)
+        shape = (len(trees), nodes)
+        self.feature = np.zeros(shape, dtype=np.int32)
+        self.threshold = np.zeros(shape, dtype=np.float32)
+        self.left = np.zeros(shape, dtype=np.int32)
+        self.right = np.zeros(shape, dtype=np.int32)
+        self.default_left = np.zeros(shape, dtype=bool)
+        self.value = np.zeros(shape, dtype=np.float32)
+        self.depth = 0
+        for index, tree in enumerate(trees):
+            left = np.array(tree["left_children"], dtype=np.int32)
+            right = np.array(tree["right_children"], dtype=np.int32)
+            size = len(left)
+            leaf = left == -1
+            # Leaves point back at themselves, so every row can take the same
+            # number of steps whatever the depth of the leaf it ends in
+            self.left[index, :size] = np.where(leaf, np.arange(size), left)
+            self.right[index, :size] = np.where(leaf, np.arange(size), right)
+            self.feature[index, :size] = tree["split_indices"]
+            self.threshold[index, :size] = tree["split_conditions"]
+            self.default_left[index, :size] = tree["default_left"]
+            # A leaf's split condition holds its value
+            self.value[index, :size] = np.where(leaf, tree["split_conditions"], 0)
+            self.depth = max(self.depth, _depth(left, right))
+        # Nodes are looked up in the flattened arrays, at the offset of their tree
+        self._offsets = np.arange(len(trees), dtype=np.int32) * nodes
+        self.left += self._offsets[:, None]
+        self.right += self._offsets[:, None]
+        for name in ("feature", "threshold", "left", "right", "default_left", "value"):
+            setattr(self, name, getattr(self, name).ravel())
+        logger.info(f"Compiled {len(trees)} trees of depth up to {self.depth}")
+
+    @classmethod
+    def from_classifier(cls, classifier):
+        return cls(classifier.get_booster())
+
+    def _rows(self, data):
+        if isinstance(data, pd.DataFrame):
+            if (
+                self.feature_names is not None
+                and list(data.columns) != self.feature_names
+            ):
+                data = data[self.feature_names]
+            data = data.to_numpy(dtype=np.float32)
+        return np.atleast_2d(np.asarray(data, dtype=np.float32))
+
+    def margin(self, data):
+        """The raw scores of the rows, before the sigmoid."""
+        X = self._rows(data)
+        rows = np.arange(len(X))[:, None] * X.shape[1]
+        X = X.ravel()
+        node = np.broadcast_to(self._offsets, (len(rows), len(self._offsets)))
+        for _ in range(self.depth):
+            values = X[rows + self.feature[node]]
+            go_left = np.where(
+                np.isnan(values), self.default_left[node], values < self.threshold[node]
+            )
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node].sum(axis=1) + self.base_margin
+
+    def predict_proba(self, data):
+        positive = 1 / (1 + np.exp(-self.margin(data)))
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, data):
+        return (self.predict_proba(data)[:, 1] > 0.5).astype(int)
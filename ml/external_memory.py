@@ -0,0 +1,112 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from db.database_operations import load_history_training_data
+from db.setup import HISTORY_FEATURE_COLUMNS
+from structure.columnar import read_columns
+
+logger = logging.getLogger(__name__)
+
+
+def holdout_mask(offset, rows, holdout_every):
+    """Which of the rows at positions `offset` onwards are held out for evaluation."""
+    return np.arange(offset, offset + rows) % holdout_every == 0
+
+
+class ChunkIter(xgboost.DataIter):
+    """
+    Hands XGBoost the `(X, y)` chunks of `chunks()` one at a time, so the training
+    data is never loaded whole. Every `holdout_every`-th row is left out for evaluation.
+    """
+
+    def __init__(self, chunks, holdout_every=5, cache_prefix=None):
+        super().__init__(cache_prefix=cache_prefix)
+        self.chunks = chunks
+        self.holdout_every = holdout_every
+        self._iterator = None
+        self._offset = 0
+
+    def next(self, input_data):
+        if self._iterator is None:
+            self._iterator = iter(self.chunks())
+        for X, y in self._iterator:
+            mask = ~holdout_mask(self._offset, len(X), self.holdout_every)
+            self._offset += len(X)
+            if mask.any():
+                input_data(data=X[mask], label=np.asarray(y)[mask])
+                return True
+        return False
+
+    def reset(self):
+        self._iterator = None
+        self._offset = 0
+
+
+def _split(chunk, target, prepare):
+    if prepare is not None:
+        chunk = prepare(chunk)
+    return chunk.drop(columns=[target]), chunk[target]
+
+
+def csv_chunks(path, target, chunk_rows=50000, prepare=None):
+    """
+    `(X, y)` chunks of a training CSV, each chunk passed through `prepare` first.
+    `prepare` must not fit anything to a chunk, e.g. the scaler must already exist.
+    """
+
+    def chunks():
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            yield _split(chunk, target, prepare)
+
+    return chunks
+
+
+def column_store_chunks(path, target, chunk_rows=50000, prepare=None):
+    """`(X, y)` chunks of the rows of a memory-mapped column store."""
+
+    def chunks():
+        df = read_columns(path)
+        for start in range(0, len(df), chunk_rows):
+            end = start + chunk_rows
+            yield _split(df.iloc[start:end].copy(), target, prepare)
+
+    return chunks
+
+
+def history_chunks(chunk_rows=50000):
+    """`(X, y)` chunks of the labelled History rows, paged by row id."""
+
+    def chunks():
+        after_row_id = 0
+        while True:
+            X, y, row_ids = load_history_training_data(
+                after_row_id=after_row_id, limit=chunk_rows
+            )
+            if not len(row_ids):
+                return
+            after_row_id = int(row_ids[-1])
+            yield pd.DataFrame(X, columns=HISTORY_FEATURE_COLUMNS, copy=False), y
+
+    return chunks
+
+
+def training_matrix(chunks, holdout_every=5, cache_dir=None):
+    """
+    The quantised training rows of `chunks()`. With `cache_dir` the pages are kept on
+    disk there instead of in memory.
+    """
+    if cache_dir is None:
+        return xgboost.QuantileDMatrix(ChunkIter(chunks, holdout_every))
+    os.makedirs(cache_dir, exist_ok=True)
+    data = ChunkIter(chunks, holdout_every, cache_prefix=os.path.join(cache_dir, "xgb"))
+    # ExtMemQuantileDMatrix is only in XGBoost 3, earlier ones page a plain DMatrix
+    matrix = getattr(xgboost, "ExtMemQuantileDMatrix", xgboost.DMatrix)
+    return matrix(data)
@@ -2,7 +2,13 @@
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
 
+import os
+import resource
+import time
+
+import numpy as np
 import pandas as pd
+import xgboost
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 from xgboost import XGBClassifier
@@ -10,14 +16,44 @@ import joblib
 import logging
 
 from db.database_operations import (
-    get_database_session,
+    load_history_training_data,
     update_or_create_last_trained_row_id,
     get_current_last_trained_row_id,
 )
-from db.setup import History
+from db.setup import HISTORY_FEATURE_COLUMNS
+from config import serving_backend
+from ml.compiled import CompiledEnsemble
+from ml.external_memory import holdout_mask, training_matrix
 
 logger = logging.getLogger(__name__)
 
+# XGBoost parameters of each training profile. `validation_size` of the training rows
+# is held out to stop adding trees once `early_stopping_rounds` bring no improvement,
+# so `n_estimators` is only the upper limit. "default" keeps XGBoost's defaults.
+TRAINING_PROFILES = {
+    "default": {},
+    "fast": {
+        "tree_method": "hist",
+        "max_depth": 4,
+        "learning_rate": 0.1,
+        "n_estimators": 500,
+        "early_stopping_rounds": 20,
+        "validation_size": 0.1,
+    },
+    "compact": {
+        "tree_method": "hist",
+        "max_depth": 3,
+        "max_bin": 64,
+        "learning_rate": 0.1,
+        "n_estimators": 200,
+        "early_stopping_rounds": 10,
+        "validation_size": 0.1,
+    },
+}
+
+# The modification time and compiled model of each model path, for the "numpy" serving backend
+_compiled_models = {}
+
 
 class MainML:
     """
@@ -31,9 +67,14 @@ class MainML:
         self.xgb_model = XGBClassifier(random_state=42)
         logger.info("MainML instance created.")
 
-    def train_and_save_model(self, features, target):
+    def train_and_save_model(self, features, target, profile=None, n_jobs=None):
         """
         Trains the XGBoost model and saves it to the specified path.
+
+        With a `profile` from TRAINING_PROFILES the model is built from its parameters,
+        trained on `n_jobs` threads (all cores by default) and stopped early on a
+        validation split. Wall time, peak memory, model size and single-row prediction
+        latency are logged with the evaluation.
         """
         logger.info("Starting model training and saving process.")
 
@@ -47,8 +88,22 @@ class MainML:
         )
         logger.info("Data split into training and testing sets.")
 
+        fit_params = {}
+        if profile is not None:
+            params = dict(TRAINING_PROFILES[profile])
+            validation_size = params.pop("validation_size", None)
+            self.xgb_model = XGBClassifier(random_state=42, n_jobs=n_jobs, **params)
+            if validation_size:
+                X_train, X_val, y_train, y_val = train_test_split(
+                    X_train, y_train, test_size=validation_size, random_state=42
+                )
+                fit_params = {"eval_set": [(X_val, y_val)], "verbose": False}
+            logger.info(f"Training with the {profile} profile: {params}")
+
         # Train the model
-        self.xgb_model.fit(X_train, y_train)
+        started = time.perf_counter()
+        self.xgb_model.fit(X_train, y_train, **fit_params)
+        wall_time = time.perf_counter() - started
         logger.info("Model training completed.")
 
         # Save the model
@@ -57,15 +112,80 @@ class MainML:
 
         # Evaluate the model on the test set
         self.evaluate_model(X_test, y_test)
+        self.log_training_costs(wall_time, X_test)
+
+    def log_training_costs(self, wall_time, X_test):
+        """Logs what training took and what the saved model costs to serve."""
+        # Single-row predictions are what the bot makes
+        row = X_test.iloc[[0]]
+        latencies = []
+        for _ in range(50):
+            started = time.perf_counter()
+            self.xgb_model.predict(row)
+            latencies.append(time.perf_counter() - started)
+        model_size = (
+            os.path.getsize(self.model_path) if os.path.exists(self.model_path) else 0
+        )
+        best_iteration = getattr(self.xgb_model, "best_iteration", None)
+        logger.info(
+            f"Training took {wall_time:.2f}s, peak memory "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, "
+            f"model size {model_size / 1024:.0f} KB, single-row latency "
+            f"{np.median(latencies) * 1000:.2f} ms"
+            + (
+                f", best iteration {best_iteration}"
+                if best_iteration is not None
+                else ""
+            )
+        )
+
+    def train_and_save_model_external(self, chunks, holdout_every=5, cache_dir=None):
+        """
+        Trains the XGBoost model on the `(X, y)` chunks of `chunks()` without loading
+        them whole, and saves it to the specified path.
+
+        Every `holdout_every`-th row is held out and the model evaluated on those rows
+        chunk by chunk. See ml.external_memory for chunk sources and `cache_dir`.
+        """
+        logger.info("Starting external memory training.")
+        params = {
+            name: value
+            for name, value in self.xgb_model.get_xgb_params().items()
+            if value is not None
+        }
+        dtrain = training_matrix(chunks, holdout_every, cache_dir)
+        logger.info(f"Training on {dtrain.num_row()} rows of {dtrain.num_col()}.")
+
+        booster = xgboost.train(
+            params, dtrain, num_boost_round=self.xgb_model.n_estimators or 100
+        )
+        # Kept as a classifier like in-memory models, for predict and predict_proba
+        self.xgb_model = XGBClassifier()
+        self.xgb_model.load_model(bytearray(booster.save_raw("json")))
+        logger.info("Model training completed.")
+
+        joblib.dump(self.xgb_model, self.model_path)
+        logger.info(f"Model saved to {self.model_path}")
+
+        y_test, y_pred = [], []
+        offset = 0
+        for X, y in chunks():
+            mask = holdout_mask(offset, len(X), holdout_every)
+            offset += len(X)
+            if mask.any():
+                y_test.append(np.asarray(y)[mask])
+                y_pred.append(self.xgb_model.predict(X[mask]))
+        self.evaluate_model(None, np.concatenate(y_test), np.concatenate(y_pred))
 
-    def evaluate_model(self, X_test, y_test):
+    def evaluate_model(self, X_test, y_test, y_pred=None):
         """
         Evaluates the model on the test data and prints the classification report and confusion matrix.
         """
         logger.info("Starting model evaluation.")
 
         # Make predictions on the test set
-        y_pred = self.xgb_model.predict(X_test)
+        if y_pred is None:
+            y_pred = self.xgb_model.predict(X_test)
 
         # Log classification report and confusion matrix
         logger.info(
@@ -75,10 +195,21 @@ class MainML:
 
     def load_model(self):
         """
-        Loads the model from the specified path.
+        Loads the model from the specified path. With the "numpy" serving backend it
+        is compiled once per saved version and predictions are made by the compiled
+        ensemble.
         """
-        self.xgb_model = joblib.load(self.model_path)
-        logger.info(f"Model loaded from {self.model_path}")
+        if serving_backend != "numpy":
+            self.xgb_model = joblib.load(self.model_path)
+            logger.info(f"Model loaded from {self.model_path}")
+            return
+        modified = os.path.getmtime(self.model_path)
+        compiled = _compiled_models.get(self.model_path)
+        if compiled is None or compiled[0] != modified:
+            model = CompiledEnsemble.from_classifier(joblib.load(self.model_path))
+            compiled = _compiled_models[self.model_path] = (modified, model)
+        self.xgb_model = compiled[1]
+        logger.info(f"Compiled model loaded from {self.model_path}")
 
     def predict(self, new_data):
         """
@@ -93,101 +224,54 @@ class MainML:
         logger.info("Prediction probabilities generated: %s", probability)
         return prediction, probability
 
-    def incremental_train_with_new_data(self, batch_size=50):
+    def incremental_train_with_new_data(self, batch_size=50, catch_up=False):
         """
         Incrementally updates the XGBoost model with new data when `batch_size` rows are available.
+
+        With `catch_up` every pending full batch is consumed in one call: the model is loaded
+        once, boosted batch by batch, saved once and the last consumed row id is recorded.
         """
         logger.info("Checking for new data to update model incrementally.")
 
-        session = get_database_session()
-
-        # Start a new session
-        try:
-            # Fetch new data rows since the last trained row
-            new_data = (
-                session.query(History)
-                .filter(
-                    History.actual_result.is_not(None),
-                    History.id > self.last_trained_row_id,
-                )
-                .order_by(History.id.asc())
-                .limit(batch_size)
-                .all()
-            )
-
-            # Proceed only if there are enough new rows
-            if len(new_data) == batch_size:
-                logger.info(
-                    f"Found {batch_size} new rows. Starting incremental training."
-                )
+        # Fetch new data rows since the last trained row
+        X_new, y_new, row_ids = load_history_training_data(
+            after_row_id=self.last_trained_row_id,
+            limit=None if catch_up else batch_size,
+        )
+        n_batches = len(row_ids) // batch_size
 
-                new_data = [record.__dict__ for record in new_data]
-
-                # Remove SQLAlchemy metadata (e.g., _sa_instance_state)
-                for record in new_data:
-                    record.pop("_sa_instance_state", None)
-
-                # Convert new data to DataFrame
-                new_df = pd.DataFrame(
-                    new_data,
-                    columns=[
-                        "radiant_avg_hero_winrate",
-                        "radiant_avg_roshans_killed",
-                        "radiant_avg_last_hits",
-                        "radiant_avg_denies",
-                        "radiant_avg_hero_damage",
-                        "radiant_avg_gpm",
-                        "radiant_avg_xpm",
-                        "radiant_avg_net_worth",
-                        "radiant_avg_player_level",
-                        "radiant_sum_obs",
-                        "radiant_sum_sen",
-                        "radiant_avg_teamfight_participation_cols",
-                        "dire_avg_hero_winrate",
-                        "dire_avg_roshans_killed",
-                        "dire_avg_last_hits",
-                        "dire_avg_denies",
-                        "dire_avg_hero_damage",
-                        "dire_avg_gpm",
-                        "dire_avg_xpm",
-                        "dire_avg_net_worth",
-                        "dire_avg_player_level",
-                        "dire_sum_obs",
-                        "dire_sum_sen",
-                        "dire_avg_teamfight_participation_cols",
-                        "radiant_avg_kda",
-                        "dire_avg_kda",
-                        "actual_result",
-                    ],
-                )
-                new_df = new_df.rename(columns={"actual_result": "radiant_win"})
+        # Proceed only if there are enough new rows
+        if n_batches:
+            n_rows = n_batches * batch_size
+            logger.info(f"Found {n_rows} new rows. Starting incremental training.")
 
-                features = new_df.columns.drop("radiant_win").tolist()
-                target = "radiant_win"
-                X_new = new_df[features]
-                y_new = new_df[target]
+            # Keep the feature names the loaded booster was trained with
+            X_new = pd.DataFrame(X_new, columns=HISTORY_FEATURE_COLUMNS, copy=False)
 
+            xgb_model = joblib.load(self.model_path)
+            for start in range(0, n_rows, batch_size):
+                batch = slice(start, start + batch_size)
                 new_xgb_model = XGBClassifier(random_state=42)
-                loaded_xgb_model = joblib.load(self.model_path)
-
-                new_xgb_model.fit(X_new, y_new, xgb_model=loaded_xgb_model)
-                # Incrementally train the model
-                self.xgb_model = new_xgb_model
-                logger.info("Incremental model training completed.")
-
-                # Save the updated model
-                joblib.dump(self.xgb_model, self.model_path)
-                logger.info(f"Incrementally updated model saved to {self.model_path}")
-
-                # Update last trained row ID
-                self.last_trained_row_id = new_data[-1]["id"]
-                update_or_create_last_trained_row_id(self.last_trained_row_id)
-                logger.info(
-                    f"Model updated with new data up to row_id {self.last_trained_row_id}"
-                )
-            else:
+                new_xgb_model.fit(X_new.iloc[batch], y_new[batch], xgb_model=xgb_model)
+                xgb_model = new_xgb_model
                 logger.info(
-                    "Not enough new data for incremental training. Waiting for more rows."
+                    f"Trained on batch ending at row_id {row_ids[batch.stop - 1]}"
                 )
-        finally:
-            session.close()
+            # Incrementally train the model
+            self.xgb_model = xgb_model
+            logger.info("Incremental model training completed.")
+
+            # Save the updated model
+            joblib.dump(self.xgb_model, self.model_path)
+            logger.info(f"Incrementally updated model saved to {self.model_path}")
+
+            # Update last trained row ID
+            self.last_trained_row_id = int(row_ids[n_rows - 1])
+            update_or_create_last_trained_row_id(self.last_trained_row_id)
+            logger.info(
+                f"Model updated with new data up to row_id {self.last_trained_row_id}"
+            )
+        else:
+            logger.info(
+                "Not enough new data for incremental training. Waiting for more rows."
+            )
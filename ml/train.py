@@ -0,0 +1,155 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from config import (
+    hero_pick_training_data_path,
+    match_training_data_path,
+    training_profile,
+)
+from ml.model import TRAINING_PROFILES, MainML
+from structure.columnar import load_training_data
+from structure.helpers import (
+    build_match_features,
+    prepare_hero_pick_data,
+    remove_zero_columns,
+    scale_match_features,
+)
+
+logger = logging.getLogger(__name__)
+
+TARGET = "radiant_win"
+MANIFEST_PATH = "training_manifest.json"
+
+# The training data, scaler and saved model of each model, relative to the repo root
+MODELS = {
+    "match_predict": {
+        "data": match_training_data_path,
+        "scaler": "scaler.pkl",
+        "model": "xgb_model.pkl",
+    },
+    "dota_plus": {
+        "data": match_training_data_path,
+        "scaler": "scaler_dota_plus.pkl",
+        "model": "xgb_model_dota_plus.pkl",
+    },
+    "hero_pick": {
+        "data": hero_pick_training_data_path,
+        "model": "xgb_model_hero_pick.pkl",
+    },
+}
+
+
+def load_frames(models):
+    """
+    The prepared training data of each of `models`. Every dataset is read once, and
+    the match models share the unscaled match features.
+    """
+    datasets = {}
+    match_features = None
+    frames = {}
+    for model in models:
+        path = MODELS[model]["data"]
+        if path not in datasets:
+            datasets[path] = load_training_data(path)
+        if model == "hero_pick":
+            frames[model] = prepare_hero_pick_data(datasets[path].copy())
+            continue
+        if match_features is None:
+            match_features = build_match_features(datasets[path].copy())
+        df = scale_match_features(match_features.copy(), MODELS[model]["scaler"])
+        frames[model] = remove_zero_columns(df) if model == "dota_plus" else df
+    return frames
+
+
+def fingerprint(df, profile):
+    """A hash of the training data and the parameters it is trained with."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df).to_numpy())
+    digest.update(json.dumps([list(df.columns), TRAINING_PROFILES[profile]]).encode())
+    return digest.hexdigest()
+
+
+def read_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def train_model(model, df, profile, n_jobs):
+    main_ml = MainML(df, MODELS[model]["model"])
+    features = df.columns.drop(TARGET).tolist()
+    main_ml.train_and_save_model(features, TARGET, profile=profile, n_jobs=n_jobs)
+
+
+def train_models(models=None, profile=None, force=False):
+    """
+    Trains `models` (all by default) concurrently, each on an even share of the cores.
+    A model is skipped when its saved file was trained on the same data and
+    parameters, as recorded in the manifest, unless `force` is set. Returns the
+    models that were trained.
+    """
+    models = list(models or MODELS)
+    profile = profile or "default"
+    frames = load_frames(models)
+    manifest = read_manifest()
+
+    pending = {}
+    for model in models:
+        key = fingerprint(frames[model], profile)
+        if (
+            not force
+            and manifest.get(model) == key
+            and os.path.exists(MODELS[model]["model"])
+        ):
+            logger.info(f"{model} is up to date, not retraining")
+            continue
+        pending[model] = key
+    if not pending:
+        return []
+
+    n_jobs = max(1, (os.cpu_count() or 1) // len(pending))
+    with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+        futures = {
+            pool.submit(train_model, model, frames[model], profile, n_jobs): model
+            for model in pending
+        }
+        trained = []
+        for future in as_completed(futures):
+            model = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Training {model} failed: {e}")
+                continue
+            manifest[model] = pending[model]
+            write_manifest(manifest)
+            trained.append(model)
+    return trained
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    train_models(
+        [arg for arg in sys.argv[1:] if not arg.startswith("--")] or None,
+        profile=training_profile,
+        force="--force" in sys.argv,
+    )
@@ -0,0 +1,188 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import xgboost
+from sklearn.metrics import accuracy_score, log_loss
+from sklearn.model_selection import StratifiedKFold
+from threadpoolctl import threadpool_limits
+
+from ml.train import MODELS, load_frames
+
+logger = logging.getLogger(__name__)
+
+TARGET = "radiant_win"
+TRIALS_DIR = os.path.join("ml", "tuning")
+
+# Every combination is tried
+GRID = {
+    "max_depth": [3, 4, 6],
+    "learning_rate": [0.05, 0.1, 0.3],
+    "n_estimators": [100, 300],
+    "subsample": [0.8, 1.0],
+}
+
+
+def candidates(grid):
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def trial_key(params, data_digest, n_folds):
+    text = json.dumps([params, data_digest, n_folds], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+# Set in each worker process by _init_worker
+_folds = []
+_row = None
+_threads = 1
+
+
+def _init_worker(matrix_path, folds, row, threads):
+    global _folds, _row, _threads
+    threadpool_limits(threads)
+    dmatrix = xgboost.DMatrix(matrix_path)
+    labels = dmatrix.get_label()
+    _folds = [
+        (dmatrix.slice(train), dmatrix.slice(test), labels[test])
+        for train, test in folds
+    ]
+    _row, _threads = row, threads
+
+
+def run_trial(params):
+    """Cross-validates one candidate in a worker, timing single-row predictions."""
+    booster_params = {
+        "objective": "binary:logistic",
+        "tree_method": "hist",
+        "nthread": _threads,
+        "seed": 42,
+        **{name: value for name, value in params.items() if name != "n_estimators"},
+    }
+    started = time.perf_counter()
+    accuracies, losses = [], []
+    for dtrain, dtest, labels in _folds:
+        booster = xgboost.train(
+            booster_params, dtrain, num_boost_round=params["n_estimators"]
+        )
+        probabilities = booster.predict(dtest)
+        accuracies.append(accuracy_score(labels, probabilities > 0.5))
+        losses.append(log_loss(labels, probabilities, labels=[0, 1]))
+    latencies = []
+    for _ in range(50):
+        predicted = time.perf_counter()
+        booster.inplace_predict(_row)
+        latencies.append(time.perf_counter() - predicted)
+    return {
+        "params": params,
+        "accuracy": float(np.mean(accuracies)),
+        "log_loss": float(np.mean(losses)),
+        "latency_ms": float(np.median(latencies) * 1000),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def search(df, trials_path, grid=GRID, n_folds=5, workers=None):
+    """
+    Cross-validates every candidate of `grid` on `df` and returns the trials ranked
+    by log-loss.
+
+    The DMatrix and the fold indices are built once and shared with `workers`
+    processes, each limited to an even share of the cores. Finished trials are
+    appended to `trials_path`, and trials already there are not run again.
+    """
+    X = df.drop(columns=[TARGET]).astype(np.float32)
+    y = df[TARGET].to_numpy()
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df).to_numpy()).hexdigest()
+
+    trials = {}
+    if os.path.exists(trials_path):
+        with open(trials_path) as file:
+            for line in file:
+                trial = json.loads(line)
+                trials[trial["key"]] = trial
+    pending = {
+        key: params
+        for params in candidates(grid)
+        if (key := trial_key(params, digest, n_folds)) not in trials
+    }
+    logger.info(
+        f"{len(pending)} of {len(pending) + len(trials)} trials left in {trials_path}"
+    )
+
+    if pending:
+        workers = workers or os.cpu_count()
+        matrix_path = f"{trials_path}.{digest}.buffer"
+        xgboost.DMatrix(X, label=y).save_binary(matrix_path)
+        folds = list(
+            StratifiedKFold(n_folds, shuffle=True, random_state=42).split(X, y)
+        )
+        threads = max(1, os.cpu_count() // workers)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                # Forked workers could inherit OpenMP state that hangs XGBoost
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(matrix_path, folds, X.iloc[[0]].to_numpy(), threads),
+            ) as pool:
+                futures = {
+                    pool.submit(run_trial, params): key
+                    for key, params in pending.items()
+                }
+                with open(trials_path, "a") as file:
+                    for done, future in enumerate(as_completed(futures), 1):
+                        trial = {"key": futures[future], **future.result()}
+                        file.write(json.dumps(trial) + "\n")
+                        file.flush()
+                        trials[trial["key"]] = trial
+                        logger.info(
+                            f"Trial {done} of {len(pending)}: {trial['params']} "
+                            f"log-loss {trial['log_loss']:.4f}"
+                        )
+        finally:
+            os.remove(matrix_path)
+
+    keys = {trial_key(params, digest, n_folds) for params in candidates(grid)}
+    return sorted(
+        (trials[key] for key in keys),
+        key=lambda trial: (trial["log_loss"], -trial["accuracy"]),
+    )
+
+
+def report(model, trials, top=10):
+    """Logs the best `top` trials of a model."""
+    lines = [f"{'log-loss':>9} {'accuracy':>9} {'latency':>10}  parameters"]
+    for trial in trials[:top]:
+        lines.append(
+            f"{trial['log_loss']:9.4f} {trial['accuracy']:9.4f} "
+            f"{trial['latency_ms']:8.3f}ms  {trial['params']}"
+        )
+    logger.info(f"Best of {len(trials)} {model} trials:\n" + "\n".join(lines))
+
+
+def main(models):
+    os.makedirs(TRIALS_DIR, exist_ok=True)
+    for model, df in load_frames(models).items():
+        trials = search(df, os.path.join(TRIALS_DIR, f"{model}.jsonl"))
+        report(model, trials)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    main(sys.argv[1:] or list(MODELS))
@@ -4,22 +4,112 @@
 
 import ast
 import logging
+import logging.config
 from io import BytesIO
-from threading import Thread
+from threading import Lock, Thread
 
 from telebot import TeleBot
-from config import telegram_key, incremental_learning_batch
+from config import (
+    telegram_key,
+    incremental_learning_batch,
+    DATABASE_CONFIG,
+    prediction_workers,
+    job_queue_max_depth,
+    job_queue_max_per_chat,
+    max_tracked_matches,
+    dota_plus_poll_interval,
+    tracker_http_concurrency,
+    tracker_telegram_concurrency,
+    tracker_edit_threshold,
+    tracker_edit_time_step,
+    tracker_edit_interval,
+    tracker_min_poll_interval,
+    tracker_feed_refresh_interval,
+    tracker_poll_budget,
+    prewarm_workers,
+    prewarm_refresh_interval,
+    prediction_cache_max_age,
+    match_training_data_path,
+)
+from db.setup import init_database, is_database_ready
 from db.database_operations import (
     get_history_data_as_dataframe,
     fetch_and_update_actual_results,
     calculate_win_rate,
 )
 from ml.model import MainML
+from structure.jobs import WorkerPool, QueueFullError
+from structure.imputation import PlayerStatsImputer
+from structure.prewarm import PredictionCache, PredictionRefresher
 from structure.struct import Markups, CallbackTriggers, Icons
+from structure.tracker import TrackerRegistry, TrackerLimitError
 
+logging.config.fileConfig("logging.conf")
 logger = logging.getLogger(__name__)
 bot = TeleBot(telegram_key)
 
+# Slow callbacks run here so the polling thread never blocks on them
+prediction_pool = WorkerPool(
+    "predictions", prediction_workers, job_queue_max_depth, job_queue_max_per_chat
+)
+# One shared live tracker per match, whatever the number of watching chats
+tracker_registry = TrackerRegistry(
+    bot,
+    max_tracked_matches,
+    dota_plus_poll_interval,
+    tracker_http_concurrency,
+    tracker_telegram_concurrency,
+    tracker_edit_threshold,
+    tracker_edit_time_step,
+    tracker_edit_interval,
+    tracker_min_poll_interval,
+    tracker_feed_refresh_interval,
+    tracker_poll_budget,
+)
+# Stand-in stats for players whose history is not fetched in time
+player_imputer = PlayerStatsImputer(match_training_data_path)
+# Predictions of every live match are ready before anyone asks for them
+prediction_cache = PredictionCache(prediction_cache_max_age)
+prediction_refresher = PredictionRefresher(
+    prediction_cache,
+    WorkerPool("prewarm", prewarm_workers, job_queue_max_depth, max_jobs_per_chat=1),
+    prewarm_refresh_interval,
+    player_imputer,
+)
+# Only one worker at a time may update the model file
+training_lock = Lock()
+
+
+def submit_job(pool, chat_id, func, *args):
+    """Queues work on a worker pool, telling the user when the queue is full."""
+    try:
+        pool.submit(chat_id, func, *args)
+    except QueueFullError as e:
+        logger.warning("Rejected %s for chat %s: %s", func.__name__, chat_id, e)
+        bot.send_message(
+            chat_id, "Too many requests in progress. Please try again later."
+        )
+
+
+def submit_prediction(call, kind, func):
+    """Answers straight away from the prediction cache, otherwise queues the job."""
+    chat_id = call.message.chat.id
+    match_id = ast.literal_eval(call.data)[1]
+    prediction = prediction_cache.get(match_id, kind)
+    if prediction is None:
+        submit_job(prediction_pool, chat_id, func, call)
+        return
+
+    Markups(bot).send_prediction(chat_id, kind, prediction)
+    if kind == "match":
+        # The history insert may wait on the database, so it runs on a worker
+        try:
+            prediction_pool.submit(
+                chat_id, Markups.record_match_prediction, match_id, prediction
+            )
+        except QueueFullError as e:
+            logger.warning("Prediction for %s not recorded: %s", match_id, e)
+
 
 class CallbackProcessor:
     @staticmethod
@@ -56,23 +146,39 @@ class CallbackProcessor:
     @staticmethod
     def predict_on_selected_match(call):
         match_id = ast.literal_eval(call.data)[1]
-        Markups(bot).make_prediction_for_selected_match(call, match_id)
+        Markups(bot).make_prediction_for_selected_match(
+            call, match_id, prediction_cache, player_imputer
+        )
 
     @staticmethod
     def predict_on_selected_hero_match(call):
         match_id = ast.literal_eval(call.data)[1]
-        Markups(bot).make_hero_pick_prediction_for_selected_match(call, match_id)
+        Markups(bot).make_hero_pick_prediction_for_selected_match(
+            call, match_id, prediction_cache
+        )
 
     @staticmethod
     def watch_dota_plus_selected_match(call):
         match_id = ast.literal_eval(call.data)[1]
-        Thread(
-            target=Markups(bot).follow_dota_plus_for_selected_match,
-            args=(call, match_id),
-        ).start()
+        try:
+            Markups(bot).follow_dota_plus_for_selected_match(
+                call, match_id, tracker_registry
+            )
+        except TrackerLimitError as e:
+            logger.warning("Cannot track match %s: %s", match_id, e)
+            bot.send_message(
+                call.message.chat.id,
+                "Too many matches are being tracked right now. Please try again later.",
+            )
 
     @staticmethod
     def send_history_csv(call):
+        if not is_database_ready(DATABASE_CONFIG):
+            bot.send_message(
+                chat_id=call.message.chat.id,
+                text="The database is not ready yet. Please try again later.",
+            )
+            return
         try:
             logger.info("Starting to send history CSV...")
 
@@ -118,39 +224,90 @@ class CallbackProcessor:
 @bot.callback_query_handler(func=lambda query: True)
 def callback_query(call):
     if call.data == CallbackTriggers.dota2_get_current_matches_trigger:
-        CallbackProcessor.current_matches(call)
+        submit_job(
+            prediction_pool,
+            call.message.chat.id,
+            CallbackProcessor.current_matches,
+            call,
+        )
     elif call.data == CallbackTriggers.get_history_of_predictions_trigger:
-        CallbackProcessor.send_history_csv(call)
+        submit_job(
+            prediction_pool,
+            call.message.chat.id,
+            CallbackProcessor.send_history_csv,
+            call,
+        )
     elif call.data == CallbackTriggers.predict_by_id_trigger:
-        CallbackProcessor.select_match_list(call)
+        submit_job(
+            prediction_pool,
+            call.message.chat.id,
+            CallbackProcessor.select_match_list,
+            call,
+        )
     elif call.data == CallbackTriggers.predict_pick_analyser_trigger:
-        CallbackProcessor.select_hero_match_list(call)
+        submit_job(
+            prediction_pool,
+            call.message.chat.id,
+            CallbackProcessor.select_hero_match_list,
+            call,
+        )
     elif call.data.startswith(CallbackTriggers.dota_plus_trigger):
-        CallbackProcessor.select_dota_plus_match_list(call)
+        submit_job(
+            prediction_pool,
+            call.message.chat.id,
+            CallbackProcessor.select_dota_plus_match_list,
+            call,
+        )
     elif call.data.startswith(CallbackTriggers.match_trigger):
-        CallbackProcessor.predict_on_selected_match(call)
+        submit_prediction(call, "match", CallbackProcessor.predict_on_selected_match)
     elif call.data.startswith(CallbackTriggers.hero_match_trigger):
-        CallbackProcessor.predict_on_selected_hero_match(call)
+        submit_prediction(
+            call, "hero_pick", CallbackProcessor.predict_on_selected_hero_match
+        )
     elif call.data.startswith(CallbackTriggers.dota_plus_match_trigger):
         CallbackProcessor.watch_dota_plus_selected_match(call)
 
 
-@bot.message_handler(func=lambda message: True)
-def message_handler(message):
-    fetch_and_update_actual_results()
-    win_rate, total_predictions = calculate_win_rate()
-    main_ml = MainML(None, "xgb_model.pkl")
-    main_ml.load_model()
-    main_ml.incremental_train_with_new_data(incremental_learning_batch)
+@bot.message_handler(commands=["cancel"])
+def cancel_handler(message):
+    cancelled = prediction_pool.cancel_chat(message.chat.id)
+    cancelled += tracker_registry.unsubscribe_chat(message.chat.id)
+    bot.send_message(
+        message.chat.id, f"Cancelled {cancelled} running or queued task(s)."
+    )
+
+
+def send_main_screen(message):
+    # Without the database the menu is still shown, just without the statistics
+    if is_database_ready(DATABASE_CONFIG):
+        fetch_and_update_actual_results()
+        win_rate, total_predictions = calculate_win_rate()
+        with training_lock:
+            main_ml = MainML(None, "xgb_model.pkl")
+            main_ml.load_model()
+            main_ml.incremental_train_with_new_data(
+                incremental_learning_batch, catch_up=True
+            )
+        statistics = f"Win Rate: {win_rate:.2%}| {total_predictions} predictions"
+    else:
+        statistics = "Win Rate: unavailable while the database starts"
 
     bot.send_message(
         message.chat.id,
-        "Main screen\n"
-        f"Win Rate: {win_rate:.2%}| {total_predictions} predictions {Icons.statistic}",
+        f"Main screen\n{statistics} {Icons.statistic}",
         reply_markup=Markups(bot).gen_main_markup(
             message.from_user.id, message.chat.id
         ),
     )
 
 
+@bot.message_handler(func=lambda message: True)
+def message_handler(message):
+    submit_job(prediction_pool, message.chat.id, send_main_screen, message)
+
+
+# Bootstrap the schema in the background so a slow database does not delay polling;
+# the first database session waits for it to finish.
+Thread(target=init_database, args=(DATABASE_CONFIG,), daemon=True).start()
+prediction_refresher.start()
 bot.infinity_polling()
@@ -0,0 +1,93 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = "schema.json"
+
+
+def column_type(name, values):
+    """The stored type of a dataset column: names are categories, stats float32."""
+    if values.dtype == bool:
+        return "bool"
+    if not pd.api.types.is_numeric_dtype(values):
+        return "category"
+    if name.endswith("_id"):
+        # Ids need every digit, and missing ones keep the column a float
+        return "int64" if values.notna().all() else "float64"
+    return "float32"
+
+
+def write_columns(df, path):
+    """
+    Writes `df` as a column store: a directory with one .npy file per column and a
+    schema, so that loading can memory-map just the columns it needs.
+    """
+    staging = f"{path}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    schema = {"rows": len(df), "columns": []}
+    for index, name in enumerate(df.columns):
+        values = df[name]
+        kind = column_type(name, values)
+        entry = {"name": name, "type": kind, "file": f"{index}.npy"}
+        if kind == "category":
+            categorical = values.astype("category")
+            entry["categories"] = [str(c) for c in categorical.cat.categories]
+            array = categorical.cat.codes.to_numpy(dtype=np.int32)
+        else:
+            array = values.to_numpy(dtype=kind)
+        np.save(os.path.join(staging, entry["file"]), array)
+        schema["columns"].append(entry)
+    with open(os.path.join(staging, SCHEMA_FILE), "w") as file:
+        json.dump(schema, file)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+    logger.info(f"Wrote {len(df)} rows of {len(df.columns)} columns to {path}")
+
+
+def read_columns(path, columns=None):
+    """Loads the given `columns` (all by default) of a column store, memory-mapped."""
+    with open(os.path.join(path, SCHEMA_FILE)) as file:
+        schema = json.load(file)
+    entries = {entry["name"]: entry for entry in schema["columns"]}
+    data = {}
+    for name in columns if columns is not None else entries:
+        entry = entries[name]
+        array = np.load(os.path.join(path, entry["file"]), mmap_mode="r")
+        if entry["type"] == "category":
+            array = pd.Categorical.from_codes(array, entry["categories"])
+        data[name] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def columns_path(csv_path):
+    return f"{os.path.splitext(csv_path)[0]}.columns"
+
+
+def load_training_data(csv_path, columns=None):
+    """
+    Loads `columns` of a training CSV from its column store, which is written next to
+    the CSV on first use and again whenever the CSV changes.
+    """
+    path = columns_path(csv_path)
+    schema = os.path.join(path, SCHEMA_FILE)
+    if not os.path.exists(schema) or os.path.getmtime(schema) < os.path.getmtime(
+        csv_path
+    ):
+        df = pd.read_csv(csv_path)
+        try:
+            write_columns(df, path)
+        except OSError as e:
+            logger.warning(f"Could not write the column store {path}: {e}")
+            return df[columns] if columns is not None else df
+    return read_columns(path, columns)
@@ -4,9 +4,11 @@
 
 import os
 import re
+from functools import lru_cache
 
 import joblib
 import logging
+import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 
 logger = logging.getLogger(__name__)
@@ -183,8 +185,9 @@ def calculate_player_kda(df, team_prefix):
     return df
 
 
-def prepare_match_prediction_data(df, scaler_file_path="scaler.pkl"):
-    logger.info("Preparing match prediction data")
+def build_match_features(df):
+    """The team features of the match rows, before they are scaled."""
+    logger.info("Building match prediction features")
     try:
         df = calculate_team_features(df, "radiant")
         df = calculate_team_features(df, "dire")
@@ -216,6 +219,15 @@ def prepare_match_prediction_data(df, scaler_file_path="scaler.pkl"):
             inplace=True,
         )
 
+    except Exception as e:
+        logger.error(f"Error in build_match_features: {e}")
+
+    return df
+
+
+def scale_match_features(df, scaler_file_path="scaler.pkl"):
+    """Scales the match features with a saved scaler, fitting it on first use."""
+    try:
         columns_to_normalize = df.columns.difference(["match_id", "radiant_win"])
 
         if os.path.exists(scaler_file_path):
@@ -231,11 +243,16 @@ def prepare_match_prediction_data(df, scaler_file_path="scaler.pkl"):
         logger.info("Normalization applied")
 
     except Exception as e:
-        logger.error(f"Error in prepare_match_prediction_data: {e}")
+        logger.error(f"Error in scale_match_features: {e}")
 
     return df
 
 
+def prepare_match_prediction_data(df, scaler_file_path="scaler.pkl"):
+    logger.info("Preparing match prediction data")
+    return scale_match_features(build_match_features(df), scaler_file_path)
+
+
 def create_hero_features(df, team_prefix):
     logger.info(f"Creating hero features for {team_prefix}")
     try:
@@ -291,3 +308,94 @@ def prepare_hero_pick_data(df):
         logger.error(f"Error in prepare_hero_pick_data: {e}")
 
     return df
+
+
+# Scoreboard player stats averaged per team for live win-probability predictions
+REALTIME_PLAYER_STATS = [
+    "kills",
+    "death",
+    "assists",
+    "last_hits",
+    "denies",
+    "gold_per_min",
+    "xp_per_min",
+    "net_worth",
+    "level",
+]
+REALTIME_FEATURE_COLUMNS = [
+    f"{team}_{feature}"
+    for team in ["radiant", "dire"]
+    for feature in [
+        "avg_last_hits",
+        "avg_denies",
+        "avg_gpm",
+        "avg_xpm",
+        "avg_net_worth",
+        "avg_player_level",
+    ]
+] + ["radiant_avg_kda", "dire_avg_kda"]
+
+
+@lru_cache(maxsize=None)
+def load_scaler_params(scaler_file_path, columns=tuple(REALTIME_FEATURE_COLUMNS)):
+    """
+    Returns the MinMaxScaler `scale_` and `min_` entries of `columns` as arrays.
+
+    Scalers fitted by prepare_match_prediction_data see the columns in sorted order,
+    which is assumed when the scaler does not record its feature names.
+    """
+    scaler = joblib.load(scaler_file_path)
+    logger.info(f"Loaded scaler parameters from {scaler_file_path}")
+    feature_names = getattr(scaler, "feature_names_in_", None)
+    if feature_names is None:
+        feature_names = sorted(
+            REALTIME_FEATURE_COLUMNS
+            + [
+                f"{team}_{attr}"
+                for team in ["radiant", "dire"]
+                for attr in [
+                    "avg_hero_winrate",
+                    "avg_teamfight_participation_cols",
+                    "sum_obs",
+                    "sum_sen",
+                    "avg_roshans_killed",
+                    "avg_hero_damage",
+                ]
+            ]
+        )
+    index = [list(feature_names).index(column) for column in columns]
+    return (
+        scaler.scale_[index].astype(np.float32),
+        scaler.min_[index].astype(np.float32),
+    )
+
+
+class RealtimeFeatureState:
+    """
+    Feature vector of one live match, rebuilt in place on every scoreboard update.
+
+    Gives the same values as Match.get_realtime_match_data_for_prediction_win_probability
+    without building a DataFrame or reloading the scaler on each tick.
+    """
+
+    def __init__(self, scaler_file_path="scaler_dota_plus.pkl"):
+        self.scale, self.min = load_scaler_params(scaler_file_path)
+        self.stats = np.zeros((2, 5, len(REALTIME_PLAYER_STATS)), dtype=np.float32)
+        self.features = np.zeros((1, len(REALTIME_FEATURE_COLUMNS)), dtype=np.float32)
+
+    def update(self, match_steam_data):
+        """Returns the scaled (1, n_features) vector for a Steam live match."""
+        scoreboard = match_steam_data.get("scoreboard")
+        for side, team in enumerate(("radiant", "dire")):
+            players = scoreboard.get(team).get("players")
+            if len(players) != 5:
+                raise ValueError("Both teams must have exactly 5 players.")
+            for i, player in enumerate(players):
+                self.stats[side, i] = [player[stat] for stat in REALTIME_PLAYER_STATS]
+
+        kills, deaths, assists, *averages = self.stats.mean(axis=1).T
+        self.features[0, :12] = np.stack(averages, axis=1).ravel()
+        self.features[0, 12:] = (kills + assists) / np.where(deaths == 0, 1, deaths)
+        self.features *= self.scale
+        self.features += self.min
+        return self.features
@@ -0,0 +1,487 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import logging
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, as_completed
+from threading import Lock, Thread
+from time import monotonic, time
+
+import requests
+
+from config import (
+    negative_cache_ttl_not_found,
+    negative_cache_ttl_empty,
+    negative_cache_ttl_failed,
+    http_timeout,
+    circuit_failure_threshold,
+    circuit_slow_call_seconds,
+    circuit_reset_timeout,
+    hedge_percentile,
+    hedge_budget,
+    hedge_min_samples,
+    hedge_workers,
+    match_cache_size,
+)
+
+logger = logging.getLogger(__name__)
+
+# Steam reports players hiding their identity with this account id
+ANONYMOUS_ACCOUNT_ID = 4294967295
+
+# Responses that mean the upstream is failing rather than the request being wrong
+UPSTREAM_FAILURES = frozenset(range(500, 600)) | {429}
+
+
+class NegativeCache:
+    """
+    Remembers requests that came back empty or failed, so they are skipped until their
+    TTL runs out.
+
+    Each entry keeps the time the original attempt took, retries included, and every
+    skip adds it to `saved_seconds`. Skips without an entry, such as anonymous players,
+    are costed at the average request time seen by `get`.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = ttls  # reason -> seconds
+        self._entries = {}  # key -> (expires_at, reason, cost)
+        self._lock = Lock()
+        self.skipped_requests = 0
+        self.saved_seconds = 0.0
+        self._request_count = 0
+        self._request_seconds = 0.0
+
+    def observe(self, seconds):
+        """Records how long a request took."""
+        with self._lock:
+            self._request_count += 1
+            self._request_seconds += seconds
+
+    def average_request_time(self):
+        if not self._request_count:
+            return 0.0
+        return self._request_seconds / self._request_count
+
+    def add(self, key, reason, cost=0.0):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttls[reason], reason, cost)
+        logger.info(f"Remembering {key} as {reason} for {self.ttls[reason]}s.")
+
+    def check(self, key):
+        """Returns the reason `key` is skipped, or None if it should be requested."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, reason, cost = entry
+            if monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._record_skip(cost)
+        logger.info(f"Skipping {key} ({reason}). {self.stats()}")
+        return reason
+
+    def record_skip(self):
+        """Counts a request skipped without a cache entry, e.g. for anonymous players."""
+        with self._lock:
+            self._record_skip(self.average_request_time())
+
+    def _record_skip(self, cost):
+        self.skipped_requests += 1
+        self.saved_seconds += cost
+
+    def stats(self):
+        return (
+            f"Negative cache: {len(self._entries)} entries, "
+            f"{self.skipped_requests} requests skipped, "
+            f"{self.saved_seconds:.1f}s saved"
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.skipped_requests = 0
+            self.saved_seconds = 0.0
+            self._request_count = 0
+            self._request_seconds = 0.0
+
+
+negative_cache = NegativeCache(
+    {
+        "not found": negative_cache_ttl_not_found,
+        "empty": negative_cache_ttl_empty,
+        "failed": negative_cache_ttl_failed,
+    }
+)
+
+
+def is_anonymous(account_id):
+    return account_id is None or account_id == ANONYMOUS_ACCOUNT_ID
+
+
+class LruCache:
+    """Keeps the `max_entries` most recently used values."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+
+
+# Finished matches never change, and teammates share most of their recent matches
+match_cache = LruCache(match_cache_size)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without making a request while an endpoint's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Fails calls to one upstream endpoint fast once it is down or slow.
+
+    The circuit opens after `failure_threshold` consecutive failed or slow calls. After
+    `reset_timeout` seconds a single probe call is let through (half-open): success
+    closes the circuit, failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, endpoint, failure_threshold, slow_call_seconds, reset_timeout):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._lock = Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if (
+                self.state == "open"
+                and monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self.state = "half-open"
+                logger.info(f"Probing {self.endpoint}.")
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, duration):
+        ok = ok and duration <= self.slow_call_seconds
+        with self._lock:
+            if ok:
+                if self.state != "closed":
+                    logger.info(f"Circuit for {self.endpoint} closed.")
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        f"Circuit for {self.endpoint} opened after {self.failures} failed or slow calls."
+                    )
+                self.state = "open"
+                self._opened_at = monotonic()
+
+    def release(self):
+        """Lets another probe through when the probe's result says nothing."""
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self._opened_at = monotonic() - self.reset_timeout
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                circuit_failure_threshold,
+                circuit_slow_call_seconds,
+                circuit_reset_timeout,
+            )
+        return _breakers[endpoint]
+
+
+def _close_response(future):
+    # The losing copy of a streamed request holds its connection until closed
+    if future.exception() is None:
+        future.result().close()
+
+
+class Hedger:
+    """
+    Sends a second copy of a slow idempotent GET and returns whichever answers first.
+
+    The copy goes out once a request has run longer than the `percentile` latency of
+    its endpoint, measured over the last `window` successful calls once there are
+    `min_samples` of them. At most `budget` of the hedgeable requests get a copy.
+
+    The first request starts on its own thread at once, so the delay is not eaten by a
+    queue; only copies go to the pool. Copies are not recorded, so every request
+    counts once in the circuit breaker and latency statistics.
+    """
+
+    def __init__(self, percentile, budget, min_samples, workers, window=200):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="hedge")
+        self._latencies = {}  # endpoint -> recent durations
+        self._lock = Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved_seconds = 0.0
+
+    def observe(self, endpoint, duration):
+        with self._lock:
+            latencies = self._latencies.setdefault(endpoint, deque(maxlen=self.window))
+            latencies.append(duration)
+
+    def delay(self, endpoint):
+        """How long a request to `endpoint` runs before it is hedged, or None."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[int(len(latencies) * self.percentile / 100) - 1]
+
+    def get(self, endpoint, send):
+        """Calls `send()`, and `send(record=False)` as well if the first call is slow."""
+        with self._lock:
+            self.requests += 1
+        delay = self.delay(endpoint)
+        if delay is None:
+            return send()
+
+        primary = self._start(send)
+        try:
+            return primary.result(timeout=delay)
+        except TimeoutError:
+            pass
+        if not self._take_budget():
+            return primary.result()
+        logger.debug(f"Hedging {endpoint} request after {delay:.2f}s.")
+        return self._race(primary, self._pool.submit(send, record=False))
+
+    def _start(self, send):
+        primary = Future()
+
+        def run():
+            try:
+                primary.set_result(send())
+            except BaseException as e:
+                primary.set_exception(e)
+
+        Thread(target=run, name="hedged-request", daemon=True).start()
+        return primary
+
+    def _take_budget(self):
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _race(self, primary, hedge):
+        """Returns the first successful response of the two."""
+        for future in as_completed([primary, hedge]):
+            if future.exception() is None:
+                loser = primary if future is hedge else hedge
+                loser.add_done_callback(_close_response)
+                if future is hedge:
+                    self._hedge_won(primary)
+                return future.result()
+        return primary.result()
+
+    def _hedge_won(self, primary):
+        won_at = monotonic()
+        with self._lock:
+            self.hedge_wins += 1
+
+        def record_saving(_):
+            with self._lock:
+                self.saved_seconds += monotonic() - won_at
+
+        primary.add_done_callback(record_saving)
+
+    def stats(self):
+        rate = self.hedges / self.requests if self.requests else 0.0
+        return (
+            f"Hedging: {self.hedges} of {self.requests} requests hedged ({rate:.1%}), "
+            f"{self.hedge_wins} won by the copy, {self.saved_seconds:.1f}s saved"
+        )
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self.requests = self.hedges = self.hedge_wins = 0
+            self.saved_seconds = 0.0
+
+
+hedger = Hedger(hedge_percentile, hedge_budget, hedge_min_samples, hedge_workers)
+
+
+def get(url, endpoint=None, hedge=False, **kwargs):
+    """
+    `requests.get` behind the circuit breaker of `endpoint`, with a default timeout.
+
+    Server errors, rate limiting, exceptions and slow calls count as failures. Raises
+    CircuitOpenError while the circuit is open. Timeouts are capped at
+    `http_timeout`; a shorter one set by the caller's deadline is not counted as a
+    failure when it runs out. With `hedge`, which is only safe for
+    idempotent requests, a slow request is sent a second time. Durations feed the
+    negative cache's time estimates and the hedging latencies.
+    """
+    endpoint = endpoint or url
+    circuit = breaker(endpoint)
+    if not circuit.allow():
+        raise CircuitOpenError(f"Circuit for {endpoint} is open")
+    # A timeout shorter than http_timeout comes from the caller's deadline, and
+    # running into it says nothing about the upstream's health
+    timeout = kwargs.get("timeout")
+    deadline_bound = timeout is not None and timeout < http_timeout
+    kwargs["timeout"] = timeout if deadline_bound else http_timeout
+
+    def send(record=True):
+        started = monotonic()
+        ok = False
+        try:
+            response = requests.get(url, **kwargs)
+            ok = response.status_code not in UPSTREAM_FAILURES
+            return response
+        except requests.Timeout:
+            if record and deadline_bound:
+                record = False
+                circuit.release()
+            raise
+        finally:
+            if record:
+                duration = monotonic() - started
+                circuit.record(ok, duration)
+                negative_cache.observe(duration)
+                if ok:
+                    hedger.observe(endpoint, duration)
+
+    if hedge:
+        return hedger.get(endpoint, send)
+    return send()
+
+
+# Result of get_json; `stale` is set when the upstream failed and `data` is the last
+# good value, fetched at `fetched_at` (a time() value)
+JsonResult = namedtuple("JsonResult", ["data", "stale", "fetched_at"])
+
+_last_good = {}  # url -> (data, fetched_at)
+_revalidating = set()
+_last_good_lock = Lock()
+
+
+def get_json(url, endpoint, max_age=0):
+    """
+    Fetches JSON through `get`, serving the last good value while the upstream fails.
+
+    A value younger than `max_age` seconds is returned without a request. When the
+    request fails or the circuit is open, the last good value is returned marked stale
+    and a background request revalidates it. Returns None on client errors, or when
+    the upstream fails and nothing was cached.
+    """
+    with _last_good_lock:
+        cached = _last_good.get(url)
+    if cached is not None and time() - cached[1] < max_age:
+        return JsonResult(cached[0], False, cached[1])
+
+    try:
+        if cached is not None and breaker(endpoint).state != "closed":
+            # Leave the probe to the background request
+            raise CircuitOpenError(f"Circuit for {endpoint} is open")
+        response = get(url, endpoint)
+        if response.status_code == 200:
+            return _store(url, response.json())
+        failure = f"status code {response.status_code}"
+        if response.status_code not in UPSTREAM_FAILURES:
+            logger.error(f"Error fetching {endpoint}: {failure}")
+            return None
+    except requests.RequestException as e:
+        failure = e
+
+    if cached is None:
+        logger.error(f"Error fetching {endpoint}: {failure}")
+        return None
+    logger.warning(f"Serving {endpoint} from {time() - cached[1]:.0f}s ago: {failure}")
+    _revalidate(url, endpoint)
+    return JsonResult(cached[0], True, cached[1])
+
+
+def _store(url, data):
+    fetched_at = time()
+    with _last_good_lock:
+        _last_good[url] = (data, fetched_at)
+    return JsonResult(data, False, fetched_at)
+
+
+def _revalidate(url, endpoint):
+    with _last_good_lock:
+        if url in _revalidating:
+            return
+        _revalidating.add(url)
+
+    def run():
+        try:
+            response = get(url, endpoint)
+            if response.status_code == 200:
+                _store(url, response.json())
+                logger.info(f"{endpoint} revalidated.")
+        except requests.RequestException as e:
+            logger.info(f"{endpoint} is still unavailable: {e}")
+        finally:
+            with _last_good_lock:
+                _revalidating.discard(url)
+
+    Thread(target=run, name=f"revalidate-{endpoint}", daemon=True).start()
+
+
+def reset():
+    """Forgets every circuit, cached value and negative entry."""
+    with _breakers_lock:
+        _breakers.clear()
+    with _last_good_lock:
+        _last_good.clear()
+        _revalidating.clear()
+    negative_cache.clear()
+    match_cache.clear()
+    hedger.reset()
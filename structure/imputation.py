@@ -0,0 +1,112 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import logging
+import os
+from threading import Lock
+
+import pandas as pd
+
+from structure.columnar import load_training_data
+
+logger = logging.getLogger(__name__)
+
+# Per-player averages the match model is built from
+PLAYER_STATS = [
+    "kills",
+    "deaths",
+    "assists",
+    "gold_per_min",
+    "xp_per_min",
+    "teamfight_participation",
+    "obs_placed",
+    "sen_placed",
+    "net_worth",
+    "roshans_killed",
+    "last_hits",
+    "denies",
+    "level",
+    "hero_damage",
+    "tower_damage",
+]
+
+
+class PlayerStatsImputer:
+    """
+    Stand-in stats for players whose recent matches could not be fetched in time.
+
+    Sources are tried from most to least specific: aggregates fetched earlier in this
+    process for the same player and hero, the player's averages in the training set,
+    the averages of the hero in the training set, and finally training-set means.
+    """
+
+    def __init__(self, training_data_path):
+        self.training_data_path = training_data_path
+        self._recent = {}  # (account_id, hero_id) -> stats
+        self._priors = None
+        self._lock = Lock()
+
+    def remember(self, account_id, hero_id, stats):
+        with self._lock:
+            self._recent[(account_id, hero_id)] = {
+                stat: stats[stat] for stat in PLAYER_STATS
+            }
+
+    def impute(self, account_id, hero_id):
+        """Returns (stats, source) for a player, source naming where they came from."""
+        with self._lock:
+            stats = self._recent.get((account_id, hero_id))
+        if stats is not None:
+            return dict(stats), "cached aggregates"
+
+        player_means, hero_means, global_means = self.priors()
+        if account_id in player_means:
+            return dict(player_means[account_id]), "player training average"
+        if hero_id in hero_means:
+            return dict(hero_means[hero_id]), "hero prior"
+        return dict(global_means), "training mean"
+
+    def priors(self):
+        """Per-player, per-hero and overall stat means of the training set."""
+        with self._lock:
+            if self._priors is None:
+                self._priors = self._load_priors()
+            return self._priors
+
+    def _load_priors(self):
+        if not os.path.exists(self.training_data_path):
+            logger.warning(
+                f"No training data at {self.training_data_path}, imputing zeros."
+            )
+            return {}, {}, {stat: 0.0 for stat in PLAYER_STATS}
+
+        df = load_training_data(
+            self.training_data_path,
+            [
+                f"{team}_player_{i}_{column}"
+                for team in ("radiant", "dire")
+                for i in range(1, 6)
+                for column in ["id", "hero_id"] + PLAYER_STATS
+            ],
+        )
+        players = pd.concat(
+            [
+                df[
+                    [f"{team}_player_{i}_id", f"{team}_player_{i}_hero_id"]
+                    + [f"{team}_player_{i}_{stat}" for stat in PLAYER_STATS]
+                ].set_axis(["account_id", "hero_id"] + PLAYER_STATS, axis=1)
+                for team in ("radiant", "dire")
+                for i in range(1, 6)
+            ],
+            ignore_index=True,
+        )
+        players[PLAYER_STATS] = players[PLAYER_STATS].apply(
+            pd.to_numeric, errors="coerce"
+        )
+        logger.info(f"Loaded {len(players)} player rows for imputation.")
+        return (
+            players.groupby("account_id")[PLAYER_STATS].mean().to_dict("index"),
+            players.groupby("hero_id")[PLAYER_STATS].mean().to_dict("index"),
+            players[PLAYER_STATS].mean().to_dict(),
+        )
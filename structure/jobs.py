@@ -0,0 +1,200 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import itertools
+import logging
+from collections import OrderedDict, deque
+from threading import Condition, Event, Thread, local
+
+logger = logging.getLogger(__name__)
+
+_worker_state = local()
+
+
+class QueueFullError(Exception):
+    """Raised when a job is rejected because a queue-depth limit is reached."""
+
+
+class JobStatus:
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class Job:
+    def __init__(self, job_id, chat_id, name, func, args, kwargs):
+        self.job_id = job_id
+        self.chat_id = chat_id
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JobStatus.queued
+        self.error = None
+        self._cancel_event = Event()
+        self._finished = Event()
+
+    @property
+    def cancelled(self):
+        """True once cancellation was requested; long-running jobs should poll this."""
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the job has finished, failed or was cancelled."""
+        return self._finished.wait(timeout)
+
+    def __repr__(self):
+        return f"Job(ID: {self.job_id}, Name: {self.name}, Chat: {self.chat_id}, Status: {self.status})"
+
+
+def current_job():
+    """Returns the Job executed by the calling worker thread, or None outside a pool."""
+    return getattr(_worker_state, "job", None)
+
+
+class WorkerPool:
+    """
+    Fixed number of worker threads fed from per-chat FIFO queues.
+
+    Chats are served round-robin, so one chat queueing several slow jobs cannot starve
+    the others. Submissions beyond `max_queue_depth` queued jobs, or beyond
+    `max_jobs_per_chat` queued and running jobs of one chat, raise QueueFullError.
+    """
+
+    def __init__(self, name, workers, max_queue_depth, max_jobs_per_chat):
+        self.name = name
+        self.max_queue_depth = max_queue_depth
+        self.max_jobs_per_chat = max_jobs_per_chat
+        self._queues = OrderedDict()  # chat_id -> deque of queued jobs
+        self._active = {}  # job_id -> queued or running job
+        self._ids = itertools.count(1)
+        self._condition = Condition()
+        self._queued = 0
+        self._running = 0
+        self._shutdown = False
+        self._threads = [
+            Thread(target=self._work, name=f"{name}-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Worker pool {name} started with {workers} workers.")
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    @property
+    def running(self):
+        return self._running
+
+    def submit(self, chat_id, func, *args, name=None, **kwargs):
+        """Queues `func(*args, **kwargs)` on behalf of `chat_id` and returns its Job."""
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError(f"Worker pool {self.name} is shut down")
+            if self._queued >= self.max_queue_depth:
+                raise QueueFullError(f"Worker pool {self.name} queue is full")
+            chat_jobs = sum(
+                1 for job in self._active.values() if job.chat_id == chat_id
+            )
+            if chat_jobs >= self.max_jobs_per_chat:
+                raise QueueFullError(f"Chat {chat_id} has too many pending jobs")
+
+            job = Job(
+                next(self._ids), chat_id, name or func.__name__, func, args, kwargs
+            )
+            self._queues.setdefault(chat_id, deque()).append(job)
+            self._active[job.job_id] = job
+            self._queued += 1
+            self._condition.notify()
+        logger.info(f"Submitted {job} to pool {self.name}.")
+        return job
+
+    def get_job(self, job_id):
+        """Returns a queued or running job."""
+        with self._condition:
+            return self._active.get(job_id)
+
+    def jobs_for_chat(self, chat_id):
+        with self._condition:
+            return [job for job in self._active.values() if job.chat_id == chat_id]
+
+    def cancel(self, job_id):
+        """Cancels a job: queued jobs are dropped, running jobs are asked to stop."""
+        with self._condition:
+            job = self._active.get(job_id)
+            if job is None:
+                return False
+            job.cancel()
+            if job.status == JobStatus.queued:
+                self._queues[job.chat_id].remove(job)
+                if not self._queues[job.chat_id]:
+                    del self._queues[job.chat_id]
+                self._queued -= 1
+                self._finish(job, JobStatus.cancelled)
+        logger.info(f"Cancelled {job}.")
+        return True
+
+    def cancel_chat(self, chat_id):
+        """Cancels every queued and running job of a chat. Returns how many were hit."""
+        return sum(self.cancel(job.job_id) for job in self.jobs_for_chat(chat_id))
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_job(self):
+        # Round-robin: take the oldest job of the chat at the front, then send that
+        # chat to the back of the line.
+        chat_id, chat_queue = next(iter(self._queues.items()))
+        job = chat_queue.popleft()
+        if chat_queue:
+            self._queues.move_to_end(chat_id)
+        else:
+            del self._queues[chat_id]
+        self._queued -= 1
+        return job
+
+    def _finish(self, job, status):
+        job.status = status
+        self._active.pop(job.job_id, None)
+        job._finished.set()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queues and not self._shutdown:
+                    self._condition.wait()
+                if self._shutdown:
+                    return
+                job = self._next_job()
+                job.status = JobStatus.running
+                self._running += 1
+
+            _worker_state.job = job
+            status = JobStatus.done
+            try:
+                job.func(*job.args, **job.kwargs)
+                if job.cancelled:
+                    status = JobStatus.cancelled
+            except Exception as e:
+                job.error = e
+                status = JobStatus.failed
+                logger.error(f"{job} failed: {e}")
+            finally:
+                _worker_state.job = None
+                with self._condition:
+                    self._running -= 1
+                    self._finish(job, status)
+            logger.info(f"{job} finished in pool {self.name}.")
@@ -0,0 +1,138 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import logging
+from threading import Event, Lock, Thread
+from time import time
+
+from config import steam_api_key
+from structure.jobs import QueueFullError
+from structure.struct import Dota2API, Markups
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    """Latest match and hero-pick predictions of live matches, keyed by match_id."""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._entries = {}  # (match_id, kind) -> Prediction
+        self._lock = Lock()
+
+    def get(self, match_id, kind):
+        """Returns the prediction if it is younger than `max_age` seconds."""
+        with self._lock:
+            prediction = self._entries.get((str(match_id), kind))
+        if prediction is None or time() - prediction.computed_at > self.max_age:
+            return None
+        return prediction
+
+    def put(self, match_id, kind, prediction):
+        with self._lock:
+            self._entries[(str(match_id), kind)] = prediction
+
+    def match_ids(self):
+        """Matches with at least one prediction younger than `max_age`."""
+        now = time()
+        with self._lock:
+            return {
+                match_id
+                for (match_id, _), prediction in self._entries.items()
+                if now - prediction.computed_at <= self.max_age
+            }
+
+    def retain(self, match_ids):
+        """Drops expired predictions and those of every match not in `match_ids`."""
+        now = time()
+        with self._lock:
+            for key in [
+                key
+                for key, prediction in self._entries.items()
+                if key[0] not in match_ids
+                or now - prediction.computed_at > self.max_age
+            ]:
+                del self._entries[key]
+
+
+class PredictionRefresher:
+    """
+    Watches the live league feed and pre-computes predictions in the background.
+
+    Every `interval` seconds, each valid live match (draft complete) that has no cached
+    prediction yet is queued on `pool`. The job builds the match once and stores both
+    the match and the hero-pick prediction, so a button tap is answered from the cache.
+    Matches that left the feed are dropped from the cache. Player aggregates fetched
+    here are remembered by `imputer` for later deadline-bound predictions.
+    """
+
+    def __init__(self, cache, pool, interval, imputer=None):
+        self.cache = cache
+        self.pool = pool
+        self.interval = interval
+        self.imputer = imputer
+        self.dota_api = Dota2API(steam_api_key)
+        self._pending = set()  # match_ids queued or being computed
+        self._failed = set()  # match_ids whose prediction could not be computed
+        self._lock = Lock()
+        self._stop = Event()
+
+    def start(self):
+        Thread(target=self._run, name="prediction-refresher", daemon=True).start()
+        logger.info("Prediction refresher started.")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Prediction refresh failed: {e}")
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        """Queues the live matches that still need predictions. Returns how many."""
+        live_matches = {
+            str(match_data.get("match_id")): match_data
+            for match_data in self.dota_api.fetch_live_matches()
+            if self.dota_api.is_valid_match(match_data)
+        }
+        self.cache.retain(set(live_matches))
+        cached = self.cache.match_ids()
+
+        queued = 0
+        with self._lock:
+            self._failed &= set(live_matches)
+            for match_id, match_data in live_matches.items():
+                if match_id in cached | self._pending | self._failed:
+                    continue
+                try:
+                    self.pool.submit(
+                        match_id, self.prewarm, match_id, match_data, name="prewarm"
+                    )
+                except QueueFullError as e:
+                    logger.warning(f"Prediction refresh deferred: {e}")
+                    break
+                self._pending.add(match_id)
+                queued += 1
+        logger.info(f"Queued predictions for {queued} live matches.")
+        return queued
+
+    def prewarm(self, match_id, match_data):
+        try:
+            match = self.dota_api.create_match_object(match_data, imputer=self.imputer)
+            self.cache.put(match_id, "match", Markups.compute_match_prediction(match))
+            self.cache.put(
+                match_id, "hero_pick", Markups.compute_hero_pick_prediction(match)
+            )
+            logger.info(f"Predictions for match ID {match_id} pre-computed.")
+        except Exception as e:
+            logger.error(f"Could not pre-compute predictions for {match_id}: {e}")
+            with self._lock:
+                self._failed.add(match_id)
+        finally:
+            with self._lock:
+                self._pending.discard(match_id)
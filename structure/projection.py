@@ -0,0 +1,127 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import io
+import logging
+
+try:
+    import ijson
+except ImportError:  # Optional; responses are then parsed whole and projected
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# Per-player fields of an OpenDota match that player averages are built from
+MATCH_PLAYER_FIELDS = [
+    "account_id",
+    "teamfight_participation",
+    "obs_placed",
+    "sen_placed",
+    "net_worth",
+    "kills",
+    "deaths",
+    "assists",
+    "roshans_killed",
+    "last_hits",
+    "denies",
+    "gold_per_min",
+    "xp_per_min",
+    "level",
+    "hero_damage",
+    "tower_damage",
+    "hero_healing",
+]
+
+# A projection maps the keys to keep to the projection of their values; None keeps a
+# value whole, and the projection of an array applies to each of its items
+MATCH_PROJECTION = {
+    "radiant_win": None,
+    "players": {field: None for field in MATCH_PLAYER_FIELDS},
+}
+MATCH_RESULT_PROJECTION = {"radiant_win": None}
+
+STREAMING = ijson is not None
+
+
+def project(value, projection):
+    """Keeps only the parts of an already decoded `value` named by `projection`."""
+    if projection is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, projection) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: project(value[key], sub_projection)
+            for key, sub_projection in projection.items()
+            if key in value
+        }
+    return value
+
+
+def decode(response, projection):
+    """
+    Decodes the JSON body of `response`, keeping only what `projection` names.
+
+    With ijson installed and a response requested with `stream=True`, the body is
+    parsed as it is read and only the projected values are built.
+    """
+    if STREAMING and isinstance(response.raw, io.IOBase):
+        response.raw.decode_content = True
+        return build(ijson.parse(response.raw, use_float=True), projection)
+    return project(response.json(), projection)
+
+
+def build(events, projection):
+    """
+    Builds the projected document from ijson `(prefix, event, value)` events.
+
+    Events outside the projection are dropped before anything is built for them.
+    """
+    containers, leaves = _paths(projection)
+
+    def wanted(path):
+        return path in containers or any(path[: len(leaf)] == leaf for leaf in leaves)
+
+    root = {}
+    stack = [root]  # Open containers; the document ends up in root["document"]
+    keys = ["document"]
+    for prefix, event, value in events:
+        path = tuple(part for part in prefix.split(".") if part and part != "item")
+        if event == "map_key":
+            if wanted(path + (value,)):
+                keys[-1] = value
+            continue
+        if not wanted(path):
+            continue
+        if event in ("start_map", "start_array"):
+            container = {} if event == "start_map" else []
+            _add(stack[-1], keys[-1], container)
+            stack.append(container)
+            keys.append(None)
+        elif event in ("end_map", "end_array"):
+            stack.pop()
+            keys.pop()
+        else:
+            _add(stack[-1], keys[-1], value)
+    return root.get("document")
+
+
+def _add(container, key, value):
+    if isinstance(container, dict):
+        container[key] = value
+    else:
+        container.append(value)
+
+
+def _paths(projection, path=()):
+    """Paths of the containers a projection walks through, and of the kept values."""
+    containers, leaves = {path}, set()
+    for key, sub_projection in projection.items():
+        if sub_projection is None:
+            leaves.add(path + (key,))
+        else:
+            sub_containers, sub_leaves = _paths(sub_projection, path + (key,))
+            containers |= sub_containers
+            leaves |= sub_leaves
+    return containers, leaves
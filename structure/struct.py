@@ -1,41 +1,73 @@
 # © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
-from time import sleep, strftime
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import localtime, monotonic, sleep, strftime, time
 import pandas as pd
 import requests
 import logging
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import opendota_key, steam_api_key
+from config import (
+    opendota_key,
+    steam_api_key,
+    prediction_deadline,
+    progress_edit_interval,
+    hero_stats_max_age,
+)
 from db.database_operations import insert_match_result
+from db.setup import HISTORY_FEATURE_COLUMNS
 from ml.model import MainML
+from structure import http_client, projection
+from structure.http_client import (
+    CircuitOpenError,
+    is_anonymous,
+    match_cache,
+    negative_cache,
+)
 from structure.helpers import (
     prepare_match_prediction_data,
     prepare_hero_pick_data,
     remove_special_chars,
     remove_zero_columns,
 )
+from structure.jobs import current_job
 
 logger = logging.getLogger(__name__)
 
 
+def remaining_time(deadline):
+    """Seconds left until `deadline` (a time() value), or None without a deadline."""
+    if deadline is None:
+        return None
+    return max(deadline - time(), 0.1)
+
+
+def deadline_passed(deadline):
+    return deadline is not None and time() >= deadline
+
+
 class Dota2API:
     def __init__(self, api_key):
         self.api_key = api_key
         self.url = f"https://api.steampowered.com/IDOTA2Match_570/GetLiveLeagueGames/v1/?key={self.api_key}&dpc=true"
+        self.stale = False
         logger.info("Dota2API initialized with provided API key.")
 
     def fetch_live_matches(self):
-        """Fetch live matches data from the Dota 2 API."""
+        """
+        Fetch live matches data from the Dota 2 API.
+
+        While Steam is failing the last good feed is returned and `stale` is set.
+        """
         logger.info("Fetching live matches from the Dota 2 API.")
-        try:
-            response = requests.get(self.url)
-            response.raise_for_status()
-            logger.info("Successfully fetched live matches.")
-            return response.json().get("result", {}).get("games", [])
-        except requests.RequestException as e:
-            logger.error(f"Error fetching live matches: {e}")
+        result = http_client.get_json(self.url, "live_feed")
+        if result is None:
             return []
+        self.stale = result.stale
+        logger.info("Successfully fetched live matches.")
+        return result.data.get("result", {}).get("games", [])
 
     def get_live_tournaments(self):
         """Fetch and build a list of live tournaments."""
@@ -117,8 +149,8 @@ class Dota2API:
         logger.info("All dota plus match buttons added to markup.")
         return markup
 
-    def build_single_match(self, match_id):
-        """Build a single match object given the match_id."""
+    def build_single_match(self, match_id, fetch_history=True):
+        """Build a single match object given the match_id; see build_players."""
         logger.info(f"Building single match object for match ID: {match_id}.")
         live_matches = self.fetch_live_matches()
         for match_data in live_matches:
@@ -126,7 +158,7 @@ class Dota2API:
                 match_data
             ):
                 logger.info(f"Match ID {match_id} found and is valid.")
-                return self.create_match_object(match_data)
+                return self.create_match_object(match_data, fetch_history)
         logger.warning(f"Match ID {match_id} not found or invalid.")
         return None
 
@@ -165,8 +197,8 @@ class Dota2API:
         logger.info(f"Total tournaments built: {len(tournaments)}.")
         return list(tournaments.values())
 
-    def build_team(self, team_data, team_side, players_data):
-        """Build a team object with players."""
+    def build_team(self, team_data, team_side, players):
+        """Build a team object from the already built players of one side."""
         if not team_data:
             logger.warning("No team data provided for building a team.")
             return None
@@ -177,11 +209,7 @@ class Dota2API:
             team_id=team_data.get("team_id", 0),
         )
 
-        team_players = [
-            self.build_player(player_data)
-            for player_data in players_data
-            if player_data.get("team") == team_side
-        ]
+        team_players = [player for player in players if player.team == team_side]
         for player in team_players:
             if player:
                 team.add_player(player)
@@ -189,8 +217,13 @@ class Dota2API:
         logger.info(f"Team {team.team_name} built with {len(team_players)} players.")
         return team
 
-    def build_player(self, player_data):
-        """Build a player object."""
+    def build_player(self, player_data, fetch_history=True, deadline=None):
+        """
+        Build a player object.
+
+        Without `fetch_history` the player's recent matches are not fetched and their
+        stats stay zero, which is enough for hero-pick predictions.
+        """
         logger.info(
             f"Building player object for account ID: {player_data.get('account_id')}."
         )
@@ -199,18 +232,82 @@ class Dota2API:
             name=player_data.get("name", "Unknown"),
             hero_id=player_data.get("hero_id", 0),
             team=player_data.get("team"),
+            player_data=None if fetch_history else player_data,
+            deadline=deadline,
         )
 
-    def create_match_object(self, match_data):
-        """Create a Match object from match data."""
+    def build_players(
+        self,
+        players_data,
+        fetch_history=True,
+        on_progress=None,
+        deadline=None,
+        imputer=None,
+    ):
+        """
+        Build the players of both teams, fetching their histories in parallel.
+
+        `on_progress(built, total)` is called after each player is built, from the
+        thread that built it. Players
+        stop fetching at `deadline`; those left without any fetched match get their
+        stats from `imputer`, which records the source in `player.imputed`.
+        """
+        team_players_data = [
+            player_data
+            for player_data in players_data
+            if player_data.get("team") in (0, 1)
+        ]
+        built = itertools.count(1)
+        progress_lock = Lock()
+
+        def build(player_data):
+            player = self.build_player(player_data, fetch_history, deadline)
+            if on_progress:
+                with progress_lock:
+                    count = next(built)
+                on_progress(count, len(team_players_data))
+            return player
+
+        if not fetch_history or not team_players_data:
+            players = [build(player_data) for player_data in team_players_data]
+        else:
+            with ThreadPoolExecutor(max_workers=len(team_players_data)) as executor:
+                players = list(executor.map(build, team_players_data))
+
+        if fetch_history and imputer:
+            for player in players:
+                if player.matches_used:
+                    imputer.remember(
+                        player.account_id, player.hero.hero_id, vars(player)
+                    )
+                else:
+                    stats, source = imputer.impute(
+                        player.account_id, player.hero.hero_id
+                    )
+                    player.set_stats(stats)
+                    player.imputed = source
+                    logger.warning(f"Imputed stats of {player.name} from {source}.")
+        return players
+
+    def create_match_object(
+        self,
+        match_data,
+        fetch_history=True,
+        on_progress=None,
+        deadline=None,
+        imputer=None,
+    ):
+        """Create a Match object from match data; see build_players for the options."""
         logger.info("Creating match object from match data.")
         radiant_team_data, dire_team_data = match_data.get(
             "radiant_team"
         ), match_data.get("dire_team")
-        players_data = match_data.get("players", [])
+        players = self.build_players(
+            match_data.get("players", []), fetch_history, on_progress, deadline, imputer
+        )
 
-        radiant_team = self.build_team(radiant_team_data, 0, players_data)
-        dire_team = self.build_team(dire_team_data, 1, players_data)
+        radiant_team = self.build_team(radiant_team_data, 0, players)
+        dire_team = self.build_team(dire_team_data, 1, players)
 
         if radiant_team and dire_team:
             match = Match(
@@ -221,7 +318,10 @@ class Dota2API:
             )
             match.dire_team = dire_team
             match.radiant_team = radiant_team
+            match.stale = self.stale
             logger.info(f"Match object created for match ID: {match.match_id}.")
+            logger.info(http_client.hedger.stats())
+            logger.info(negative_cache.stats())
             return match
         logger.warning("Could not create match object due to missing teams.")
         return None
@@ -327,6 +427,7 @@ class Buttons:
 class Hero:
     def __init__(self, hero_id):
         self.hero_id = hero_id
+        self.stale = False
         self.features = self.get_hero_features()
         self.name = self.features["name"] if self.features else "Unknown Hero"
         self.counter_picks = []
@@ -341,11 +442,11 @@ class Hero:
     def get_hero_features(self):
         url = f"https://api.opendota.com/api/heroStats?api_key={opendota_key}"
         logger.info(f"Fetching hero features for Hero ID: {self.hero_id}")
-        response = requests.get(url)
+        result = http_client.get_json(url, "hero_stats", max_age=hero_stats_max_age)
 
-        if response.status_code == 200:
-            heroes = response.json()
-            for hero in heroes:
+        if result is not None:
+            self.stale = self.stale or result.stale
+            for hero in result.data:
                 if hero["id"] == self.hero_id:
                     logger.info(
                         f"Hero features retrieved for ID {self.hero_id}: {hero}"
@@ -357,20 +458,20 @@ class Hero:
                         "pro_pick": hero.get("pro_pick", 0),
                     }
         else:
-            logger.error(f"Error fetching hero features: {response.status_code}")
+            logger.error("Error fetching hero features")
             return None
 
     def get_hero_matchups(self):
         url = f"https://api.opendota.com/api/heroes/{self.hero_id}/matchups?api_key={opendota_key}"
         logger.info(f"Fetching matchups for Hero ID: {self.hero_id}")
-        response = requests.get(url)
+        result = http_client.get_json(url, "hero_matchups")
 
-        if response.status_code == 200:
-            hero_matchups = response.json()
+        if result is not None:
+            self.stale = self.stale or result.stale
             logger.info(f"Matchups retrieved for Hero ID {self.hero_id}.")
-            return hero_matchups
+            return result.data
         else:
-            logger.error(f"Error fetching hero matchups: {response.status_code}")
+            logger.error("Error fetching hero matchups")
             return None
 
     def set_counter_pick_data(self, hero_against_ids):
@@ -398,36 +499,44 @@ class Hero:
 
 
 class Player:
-    def __init__(self, account_id, name, hero_id, team, player_data=None):
+    def __init__(
+        self, account_id, name, hero_id, team, player_data=None, deadline=None
+    ):
         self.account_id = account_id
         self.team = team
         self.hero = Hero(hero_id)
         self.name = name
+        self.matches_used = 0
+        self.imputed = None
 
         if player_data:
-            self.teamfight_participation = player_data.get("teamfight_participation", 0)
-            self.obs_placed = player_data.get("obs_placed", 0)
-            self.sen_placed = player_data.get("sen_placed", 0)
-            self.net_worth = player_data.get("net_worth", 0)
-            self.kills = player_data.get("kills", 0)
-            self.deaths = player_data.get("deaths", 0)
-            self.assists = player_data.get("assists", 0)
-            self.roshans_killed = player_data.get("roshans_killed", 0)
-            self.last_hits = player_data.get("last_hits", 0)
-            self.denies = player_data.get("denies", 0)
-            self.gold_per_min = player_data.get("gold_per_min", 0)
-            self.xp_per_min = player_data.get("xp_per_min", 0)
-            self.level = player_data.get("level", 0)
-            self.hero_damage = player_data.get("hero_damage", 0)
-            self.tower_damage = player_data.get("tower_damage", 0)
-            self.hero_healing = player_data.get("hero_healing", 0)
+            self.set_stats(player_data)
         else:
             # Initialize default values
             self.reset_stats()
-            self.get_player_total_data()
+            self.get_player_total_data(deadline)
 
         logger.info(f"Initialized Player: {self}")
 
+    def set_stats(self, player_data):
+        """Set the player's statistics from a dict, missing ones default to zero."""
+        self.teamfight_participation = player_data.get("teamfight_participation", 0)
+        self.obs_placed = player_data.get("obs_placed", 0)
+        self.sen_placed = player_data.get("sen_placed", 0)
+        self.net_worth = player_data.get("net_worth", 0)
+        self.kills = player_data.get("kills", 0)
+        self.deaths = player_data.get("deaths", 0)
+        self.assists = player_data.get("assists", 0)
+        self.roshans_killed = player_data.get("roshans_killed", 0)
+        self.last_hits = player_data.get("last_hits", 0)
+        self.denies = player_data.get("denies", 0)
+        self.gold_per_min = player_data.get("gold_per_min", 0)
+        self.xp_per_min = player_data.get("xp_per_min", 0)
+        self.level = player_data.get("level", 0)
+        self.hero_damage = player_data.get("hero_damage", 0)
+        self.tower_damage = player_data.get("tower_damage", 0)
+        self.hero_healing = player_data.get("hero_healing", 0)
+
     def reset_stats(self):
         """Reset all player statistics to zero."""
         self.teamfight_participation = 0
@@ -447,12 +556,17 @@ class Player:
         self.tower_damage = 0
         self.hero_healing = 0
 
-    def get_player_total_data(self):
-        """Fetch player total data with retries on match data retrieval."""
+    def get_player_total_data(self, deadline=None):
+        """
+        Fetch player total data with retries on match data retrieval.
+
+        No new request is started after `deadline`; the averages then cover the
+        matches fetched so far, counted in `matches_used`.
+        """
         logger.info(
             f"Fetching total data for Player: {self.name} (ID: {self.account_id})"
         )
-        recent_matches = self.fetch_recent_matches()
+        recent_matches = self.fetch_recent_matches(deadline)
 
         # Initialize counters for averages
         participation_count = obs_count = sen_count = net_worth_count = 0
@@ -462,17 +576,25 @@ class Player:
 
         # Iterate through recent matches
         for match in recent_matches:
+            if deadline_passed(deadline):
+                logger.warning(
+                    f"Deadline reached for Player {self.name} after {self.matches_used} matches"
+                )
+                break
             match_id = match["match_id"]
-            match_data = self.fetch_match_data_with_retries(match_id)
+            match_data = self.fetch_match_data_with_retries(match_id, deadline)
 
             if match_data is None:
-                logger.warning(f"Skipping match {match_id} after 5 attempts")
+                logger.warning(
+                    f"Skipping match {match_id}, its data could not be fetched"
+                )
                 continue  # Skip the match if it couldn't be retrieved
 
             # Get player data
             player_data = self.get_player_data(match_data)
 
             if player_data:
+                self.matches_used += 1
                 logger.debug(
                     f"Processing match data for match ID {match_id}: {player_data}"
                 )
@@ -540,44 +662,104 @@ class Player:
 
         logger.info(f"Completed data retrieval for Player: {self.name}")
 
-    def fetch_recent_matches(self):
-        """Fetch recent matches for the player."""
+    def fetch_recent_matches(self, deadline=None):
+        """
+        Fetch recent matches for the player.
+
+        Anonymous players are not requested at all, and a 404 or an empty list (private
+        profile) is remembered by the negative cache.
+        """
+        if is_anonymous(self.account_id):
+            logger.info(f"Player {self.name} is anonymous, skipping recent matches")
+            negative_cache.record_skip()
+            return []
+        cache_key = ("recent_matches", self.account_id, self.hero.hero_id)
+        if negative_cache.check(cache_key):
+            return []
+
         logger.info(f"Fetching recent matches for Player ID: {self.account_id}")
-        response = requests.get(
-            f"https://api.opendota.com/api/players/{self.account_id}/matches?api_key={opendota_key}&limit=10&hero_id={self.hero.hero_id}&lobby_type=1"
-        )
+        started = monotonic()
+        try:
+            response = http_client.get(
+                f"https://api.opendota.com/api/players/{self.account_id}/matches?api_key={opendota_key}&limit=10&hero_id={self.hero.hero_id}&lobby_type=1",
+                "player_matches",
+                hedge=True,
+                timeout=remaining_time(deadline),
+            )
+        except requests.RequestException as e:
+            logger.error(f"Error fetching recent matches: {e}")
+            return []
         if response.status_code == 200:
             logger.info(
                 f"Recent matches fetched successfully for Player ID: {self.account_id}"
             )
-            return response.json()
+            recent_matches = response.json()
+            if not recent_matches:
+                negative_cache.add(cache_key, "empty", monotonic() - started)
+            return recent_matches
         else:
             logger.error(f"Error fetching recent matches: {response.status_code}")
+            if response.status_code == 404:
+                negative_cache.add(cache_key, "not found", monotonic() - started)
             return []
 
-    def fetch_match_data_with_retries(self, match_id):
-        """Fetch match data with retries."""
+    def fetch_match_data_with_retries(self, match_id, deadline=None):
+        """
+        Fetch match data with retries, giving up at `deadline`.
+
+        A 404 is not retried. Matches that are missing or fail every retry are
+        remembered by the negative cache. Only the fields player averages are built
+        from are decoded, and they are kept in the match cache.
+        """
+        match_data = match_cache.get(match_id)
+        if match_data is not None:
+            return match_data
+        cache_key = ("match", match_id)
+        if negative_cache.check(cache_key):
+            return None
+
         logger.info(f"Fetching match data for Match ID: {match_id}")
+        started = monotonic()
         retries = 0
         max_retries = 5
 
-        while retries < max_retries:
-            response = requests.get(
-                f"https://api.opendota.com/api/matches/{match_id}?api_key={opendota_key}"
-            )
-            if response.status_code == 200:
+        while retries < max_retries and not deadline_passed(deadline):
+            try:
+                response = http_client.get(
+                    f"https://api.opendota.com/api/matches/{match_id}?api_key={opendota_key}",
+                    "match",
+                    hedge=True,
+                    stream=projection.STREAMING,
+                    timeout=remaining_time(deadline),
+                )
+                status_code = response.status_code
+            except CircuitOpenError as e:
+                logger.error(f"Not fetching Match ID {match_id}: {e}")
+                return None
+            except requests.RequestException as e:
+                response, status_code = None, e
+            if status_code == 200:
                 logger.info(f"Successfully fetched match data for Match ID: {match_id}")
-                return response.json()  # Successful response
+                match_data = projection.decode(response, projection.MATCH_PROJECTION)
+                match_cache.put(match_id, match_data)
+                return match_data
+            elif status_code == 404:
+                logger.error(f"Match ID {match_id} not found")
+                negative_cache.add(cache_key, "not found", monotonic() - started)
+                return None
             else:
                 retries += 1
                 logger.warning(
-                    f"Retrying... attempt {retries} for Match ID {match_id} (Status code: {response.status_code})"
+                    f"Retrying... attempt {retries} for Match ID {match_id} (Status code: {status_code})"
                 )
-                sleep(2)  # Sleep for 2 seconds before retrying
+                # Sleep for 2 seconds before retrying
+                sleep(min(2, remaining_time(deadline) or 2))
 
         logger.error(
-            f"Failed to fetch match data for Match ID {match_id} after {max_retries} attempts"
+            f"Failed to fetch match data for Match ID {match_id} after {retries} attempts"
         )
+        if retries == max_retries:
+            negative_cache.add(cache_key, "failed", monotonic() - started)
         return None  # Return None if all retries fail
 
     def get_player_data(self, match_data):
@@ -666,12 +848,21 @@ class Match:
         self.dire_team = None
         self.league_id = league_id
         self.radiant_win = radiant_win
+        self.stale = False  # Built from a live feed served from cache
         logger.info(f"Initialized Match: {self}")
 
+    def uses_stale_data(self):
+        """True if the live feed or any hero's stats were served from a stale cache."""
+        return self.stale or any(
+            player.hero.stale
+            for team in (self.radiant_team, self.dire_team)
+            for player in team.players
+        )
+
     def get_match_data(self):
         logger.info(f"Fetching match data for match ID: {self.match_id}")
         url = f"https://api.opendota.com/api/matches/{self.match_id}?api_key={opendota_key}"
-        response = requests.get(url)
+        response = http_client.get(url, "match")
 
         if response.status_code == 200:
             match_info = response.json()
@@ -682,29 +873,18 @@ class Match:
             self.radiant_win = match_info["radiant_win"]
             logger.info(f"Match info retrieved: {match_info}")
 
-            for player in match_info["players"]:
-                if player["isRadiant"]:
-                    player = Player(
-                        account_id=player["account_id"],
-                        hero_id=player["hero_id"],
-                        name=player["name"],
-                        team=radiant_team.team_name,
-                        player_data=player,
-                    )
-                    radiant_team.add_player(player)
-                else:
-                    player = Player(
-                        account_id=player["account_id"],
-                        hero_id=player["hero_id"],
-                        name=player["name"],
-                        team=dire_team.team_name,
-                        player_data=player,
-                    )
-                    dire_team.add_player(player)
-
-                logger.info(
-                    f"Added player: {player} to team: {radiant_team.team_name if player['isRadiant'] else dire_team.team_name}"
+            for player_info in match_info["players"]:
+                team = radiant_team if player_info["isRadiant"] else dire_team
+                player = Player(
+                    account_id=player_info["account_id"],
+                    hero_id=player_info["hero_id"],
+                    name=player_info["name"],
+                    team=team.team_name,
+                    player_data=player_info,
                 )
+                team.add_player(player)
+
+                logger.info(f"Added player: {player} to team: {team.team_name}")
             self.radiant_team = radiant_team
             self.dire_team = dire_team
             logger.info(f"Teams set: {self.radiant_team}, {self.dire_team}")
@@ -971,40 +1151,74 @@ class Tournament:
         self.matches.append(match)
         logger.info(f"Match added: {match.match_id} to tournament {self.name}")
 
-    def get_league_matches(self):
+    def fetch_match_list(self):
+        """The league's matches as listed by OpenDota, empty if they can't be fetched."""
         url = f"https://api.opendota.com/api/leagues/{self.league_id}/matches?api_key={opendota_key}"
         logger.info(f"Fetching matches for league {self.league_id} from {url}")
-        response = requests.get(url)
+        response = http_client.get(url, "league_matches")
         if response.status_code == 200:
-            for match_info in response.json():
-                logger.debug(f"Match info received: {match_info}")
-                match_id = match_info["match_id"]
-                radiant_team_id = match_info["radiant_team_id"]
-                dire_team_id = match_info["dire_team_id"]
-                radiant_win = match_info["radiant_win"]
-
-                match = Match(
-                    match_id, radiant_team_id, dire_team_id, self.league_id, radiant_win
-                )
-
-                try:
-                    match.get_match_data()
-                    match.set_hero_counter_picks()
-                    self.add_match(match)
-                    logger.info(f"Match {match_id} successfully added to tournament.")
-                except (TypeError, KeyError) as e:
-                    logger.warning(
-                        f"Error processing match {match_id}: {str(e)} - Skipping this match."
-                    )
-        else:
-            logger.error(
-                f"Error fetching matches for league {self.league_id}: {response.status_code}"
+            return response.json()
+        logger.error(
+            f"Error fetching matches for league {self.league_id}: {response.status_code}"
+        )
+        return []
+
+    def load_match(self, match_info):
+        """Builds a listed match with its players and counter picks, None if it fails."""
+        logger.debug(f"Match info received: {match_info}")
+        match_id = match_info["match_id"]
+        match = Match(
+            match_id,
+            match_info["radiant_team_id"],
+            match_info["dire_team_id"],
+            self.league_id,
+            match_info["radiant_win"],
+        )
+        try:
+            match.get_match_data()
+            match.set_hero_counter_picks()
+        except (TypeError, KeyError, AttributeError) as e:
+            logger.warning(
+                f"Error processing match {match_id}: {str(e)} - Skipping this match."
             )
+            return None
+        return match
+
+    def get_league_matches(self):
+        for match_info in self.fetch_match_list():
+            match = self.load_match(match_info)
+            if match is not None:
+                self.add_match(match)
+                logger.info(f"Match {match.match_id} successfully added to tournament.")
 
     def __repr__(self):
         return f"Tournament({self.name}, ID: {self.league_id})"
 
 
+class Prediction:
+    """Outcome of a model run for one match, kept so it can be rendered again later."""
+
+    def __init__(
+        self,
+        match,
+        prediction,
+        probabilities=None,
+        features=None,
+        imputed=None,
+        stale=False,
+    ):
+        self.match = match
+        self.prediction = prediction
+        self.probabilities = probabilities
+        self.features = features
+        self.imputed = imputed or {}  # player name -> source of their stand-in stats
+        self.stale = stale  # Some upstream data was served from a stale cache
+        self.computed_at = time()
+
+    def __repr__(self):
+        return f"Prediction(Match ID: {self.match.match_id}, Prediction: {self.prediction}, Computed at: {self.computed_at})"
+
+
 class Markups:
     def __init__(self, bot):
         self.markup = InlineKeyboardMarkup()
@@ -1033,9 +1247,18 @@ class Markups:
         )
 
         try:
+            job = current_job()
             tournaments = dota_api.get_live_tournaments()
             for tournament in tournaments:
                 for match in tournament.matches:
+                    if job is not None and job.cancelled:
+                        logger.info("Dota2 matches markup generation cancelled.")
+                        self.bot.send_message(
+                            chat_id=call.message.chat.id,
+                            text="<b>Cancelled</b>",
+                            parse_mode="HTML",
+                        )
+                        return
                     message = (
                         f"<b>Tournament:</b> {tournament.name}\n"
                         f"<b>League ID:</b> {tournament.league_id}\n\n"
@@ -1104,14 +1327,38 @@ class Markups:
         self.markup = dota_api.get_dota_plus_match_as_buttons(self.markup)
         return self.markup
 
-    def make_prediction_for_selected_match(self, call, match_id):
-        logger.info(f"Making prediction for selected match ID: {match_id}")
-        self.bot.send_message(
-            chat_id=call.message.chat.id,
-            text="Task started. This may take around 5 minutes. Please wait...",
+    @staticmethod
+    def compute_match_prediction(match):
+        """Runs the match model; the slow part is fetching the players' recent games."""
+        df, top_features = match.get_match_data_for_prediction()
+        main_ml = MainML(None, "xgb_model.pkl")
+        main_ml.load_model()
+        prediction, probabilities = main_ml.predict(df)
+        imputed = {
+            player.name: player.imputed
+            for team in (match.radiant_team, match.dire_team)
+            for player in team.players
+            if getattr(player, "imputed", None)
+        }
+        return Prediction(
+            match,
+            prediction[0],
+            probabilities[0],
+            df.iloc[0],
+            imputed,
+            match.uses_stale_data(),
         )
-        dota_api = Dota2API(steam_api_key)
-        match = dota_api.build_single_match(match_id=match_id)
+
+    @staticmethod
+    def compute_hero_pick_prediction(match):
+        df, top_features = match.get_hero_match_data_for_prediction()
+        hero_pick_ml = MainML(None, "xgb_model_hero_pick.pkl")
+        hero_pick_ml.load_model()
+        prediction, _ = hero_pick_ml.predict(df)
+        return Prediction(match, prediction[0], stale=match.uses_stale_data())
+
+    @staticmethod
+    def render_match_header(match):
         message = (
             f"<b>Match ID:</b> {match.match_id}\n"
             f"<b>Dire Team {Icons.direIcon}:</b> {match.dire_team.team_name} (ID: {match.dire_team.team_id})\n"
@@ -1130,129 +1377,214 @@ class Markups:
         # List Radiant team players
         for player in match.radiant_team.players:
             message += f"   - {remove_special_chars(player.name)} {Icons.playerIcon}(Hero: {player.hero.name})\n"
+        return message
 
-        # Prepare match data for prediction
-        df, top_features = match.get_match_data_for_prediction()
-        main_ml = MainML(None, "xgb_model.pkl")
-        main_ml.load_model()
-        prediction, probabilities = main_ml.predict(df)
+    @staticmethod
+    def render_freshness(prediction):
+        minutes = int((time() - prediction.computed_at) // 60)
+        message = f"<b>Computed at:</b> {strftime('%H:%M:%S', localtime(prediction.computed_at))} ({minutes} min ago)\n"
+        if prediction.stale:
+            message += "<b>Stale data:</b> Steam or OpenDota is unavailable, some stats are from an earlier fetch\n"
+        return message
+
+    def render_match_prediction(self, prediction):
+        message = self.render_match_header(prediction.match)
+        message += f"\n<b>Prediction:</b> {'Radiant Wins' if prediction.prediction == 1 else 'Dire Wins'}\n"
+        radiant_prob = prediction.probabilities[1]  # Assuming class 1 is Radiant
+        dire_prob = prediction.probabilities[0]  # Assuming class 0 is Dire
+        message += f"<b>Probabilities:</b> Radiant: {radiant_prob:.2%}, Dire: {dire_prob:.2%}\n"
+        if prediction.imputed:
+            message += "<b>Estimated stats (history not ready in time):</b> "
+            message += ", ".join(
+                f"{remove_special_chars(name)} ({source})"
+                for name, source in prediction.imputed.items()
+            )
+            message += "\n"
+        message += self.render_freshness(prediction)
+        message += "<b>----------------------------------------</b>\n"  # Separator line in bold
+        return message
 
-        row = df.iloc[0]  # Access the first row of the DataFrame
-
-        model_prediction = prediction[0]
-
-        radiant_avg_hero_winrate = row["radiant_avg_hero_winrate"]
-        radiant_avg_roshans_killed = row["radiant_avg_roshans_killed"]
-        radiant_avg_last_hits = row["radiant_avg_last_hits"]
-        radiant_avg_denies = row["radiant_avg_denies"]
-        radiant_avg_hero_damage = row["radiant_avg_hero_damage"]
-        radiant_avg_gpm = row["radiant_avg_gpm"]
-        radiant_avg_xpm = row["radiant_avg_xpm"]
-        radiant_avg_net_worth = row["radiant_avg_net_worth"]
-        radiant_avg_player_level = row["radiant_avg_player_level"]
-        radiant_sum_obs = row["radiant_sum_obs"]
-        radiant_sum_sen = row["radiant_sum_sen"]
-        radiant_avg_teamfight_participation_cols = row[
-            "radiant_avg_teamfight_participation_cols"
-        ]
+    def render_hero_pick_prediction(self, prediction):
+        message = self.render_match_header(prediction.match)
+        message += f"\n<b>Prediction:</b> {'Radiant pick is stronger' if prediction.prediction == 1 else 'Dire pick is stronger'}\n"
+        message += self.render_freshness(prediction)
+        message += "<b>----------------------------------------</b>\n"  # Separator line in bold
+        return message
 
-        dire_avg_hero_winrate = row["dire_avg_hero_winrate"]
-        dire_avg_roshans_killed = row["dire_avg_roshans_killed"]
-        dire_avg_last_hits = row["dire_avg_last_hits"]
-        dire_avg_denies = row["dire_avg_denies"]
-        dire_avg_hero_damage = row["dire_avg_hero_damage"]
-        dire_avg_gpm = row["dire_avg_gpm"]
-        dire_avg_xpm = row["dire_avg_xpm"]
-        dire_avg_net_worth = row["dire_avg_net_worth"]
-        dire_avg_player_level = row["dire_avg_player_level"]
-        dire_sum_obs = row["dire_sum_obs"]
-        dire_sum_sen = row["dire_sum_sen"]
-        dire_avg_teamfight_participation_cols = row[
-            "dire_avg_teamfight_participation_cols"
-        ]
+    def send_prediction(self, chat_id, kind, prediction):
+        """Sends an already computed `kind` prediction."""
+        if kind == "match":
+            message = self.render_match_prediction(prediction)
+        else:
+            message = self.render_hero_pick_prediction(prediction)
+        logger.info(f"Sending message to chat {chat_id}: {message}")
+        self.bot.send_message(chat_id=chat_id, text=message, parse_mode="HTML")
 
-        radiant_avg_kda = row["radiant_avg_kda"]
-        dire_avg_kda = row["dire_avg_kda"]
+    @staticmethod
+    def record_match_prediction(match_id, prediction):
+        """Stores a match prediction in the history table."""
+        row = prediction.features
 
         # Call the insert function to add the match result to the database
         insert_match_result(
             match_id=match_id,
-            model_prediction=model_prediction,
-            radiant_avg_hero_winrate=radiant_avg_hero_winrate,
-            radiant_avg_roshans_killed=radiant_avg_roshans_killed,
-            radiant_avg_last_hits=radiant_avg_last_hits,
-            radiant_avg_denies=radiant_avg_denies,
-            radiant_avg_hero_damage=radiant_avg_hero_damage,
-            radiant_avg_gpm=radiant_avg_gpm,
-            radiant_avg_xpm=radiant_avg_xpm,
-            radiant_avg_net_worth=radiant_avg_net_worth,
-            radiant_avg_player_level=radiant_avg_player_level,
-            radiant_sum_obs=radiant_sum_obs,
-            radiant_sum_sen=radiant_sum_sen,
-            radiant_avg_teamfight_participation_cols=radiant_avg_teamfight_participation_cols,
-            dire_avg_hero_winrate=dire_avg_hero_winrate,
-            dire_avg_roshans_killed=dire_avg_roshans_killed,
-            dire_avg_last_hits=dire_avg_last_hits,
-            dire_avg_denies=dire_avg_denies,
-            dire_avg_hero_damage=dire_avg_hero_damage,
-            dire_avg_gpm=dire_avg_gpm,
-            dire_avg_xpm=dire_avg_xpm,
-            dire_avg_net_worth=dire_avg_net_worth,
-            dire_avg_player_level=dire_avg_player_level,
-            dire_sum_obs=dire_sum_obs,
-            dire_sum_sen=dire_sum_sen,
-            dire_avg_teamfight_participation_cols=dire_avg_teamfight_participation_cols,
-            radiant_avg_kda=radiant_avg_kda,
-            dire_avg_kda=dire_avg_kda,
+            model_prediction=prediction.prediction,
+            **{column: row[column] for column in HISTORY_FEATURE_COLUMNS},
         )
 
-        message += f"\n<b>Prediction:</b> {'Radiant Wins' if prediction[0] == 1 else 'Dire Wins'}\n"
-        radiant_prob = probabilities[0][1]  # Assuming class 1 is Radiant
-        dire_prob = probabilities[0][0]  # Assuming class 0 is Dire
-        message += f"<b>Probabilities:</b> Radiant: {radiant_prob:.2%}, Dire: {dire_prob:.2%}\n"
-        message += "<b>----------------------------------------</b>\n"  # Separator line in bold
+    def get_prediction(self, call, match_id, kind, compute, prediction_cache):
+        """
+        Returns the cached `kind` prediction of a match, or computes and caches it.
 
-        # Log the message text
-        logger.info(f"Sending message to chat {call.message.chat.id}: {message}")
-        self.bot.send_message(
-            chat_id=call.message.chat.id, text=message, parse_mode="HTML"
-        )
-        logger.info(f"Prediction for match ID {match_id} sent successfully.")
+        Only hero-pick predictions are computed here, so the players' recent matches
+        are not fetched.
+        """
+        prediction = prediction_cache.get(match_id, kind) if prediction_cache else None
+        if prediction is not None:
+            logger.info(f"Serving cached {kind} prediction for match ID: {match_id}")
+            return prediction
 
-    def make_hero_pick_prediction_for_selected_match(self, call, match_id):
-        logger.info(f"Making hero pick prediction for match ID: {match_id}")
         self.bot.send_message(
-            chat_id=call.message.chat.id,
-            text="Task started. This may take around 5 minutes. Please wait...",
+            chat_id=call.message.chat.id, text="Task started. Please wait..."
         )
         dota_api = Dota2API(steam_api_key)
-        match = dota_api.build_single_match(match_id=match_id)
-        message = (
-            f"<b>Match ID:</b> {match.match_id}\n"
-            f"<b>Dire Team {Icons.direIcon}:</b> {match.dire_team.team_name} (ID: {match.dire_team.team_id})\n"
-            "<b>Players:</b>\n"
+        match = dota_api.build_single_match(match_id=match_id, fetch_history=False)
+        prediction = compute(match)
+        if prediction_cache:
+            prediction_cache.put(match_id, kind, prediction)
+        return prediction
+
+    def edit_message(self, chat_id, message_id, text):
+        try:
+            self.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id, text=text, parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.warning(f"Could not update message {message_id} in {chat_id}: {e}")
+
+    def quick_estimate(self, dota_api, match_id, match_data, prediction_cache):
+        """
+        Hero-pick prediction used as a first answer while player histories load.
+
+        It only needs hero stats and matchups, so the players are built without
+        fetching their recent matches. Returns None if it cannot be computed.
+        """
+        prediction = (
+            prediction_cache.get(match_id, "hero_pick") if prediction_cache else None
         )
+        if prediction is not None:
+            return prediction
+        try:
+            match = dota_api.create_match_object(match_data, fetch_history=False)
+            prediction = self.compute_hero_pick_prediction(match)
+        except Exception as e:
+            logger.warning(f"No quick estimate for match ID {match_id}: {e}")
+            return None
+        if prediction_cache:
+            prediction_cache.put(match_id, "hero_pick", prediction)
+        return prediction
 
-        # List Dire team players
-        for player in match.dire_team.players:
-            message += f"   - {remove_special_chars(player.name)} {Icons.playerIcon}(Hero: {player.hero.name})\n"
+    @staticmethod
+    def render_progress(quick_estimate, built, total):
+        message = ""
+        if quick_estimate is not None:
+            message += f"<b>Quick estimate (hero picks):</b> {'Radiant pick is stronger' if quick_estimate.prediction == 1 else 'Dire pick is stronger'}\n"
+        message += f"Fetching player histories: {built}/{total}. Full prediction will follow..."
+        return message
+
+    def make_prediction_for_selected_match(
+        self, call, match_id, prediction_cache=None, imputer=None
+    ):
+        """
+        Answers from the prediction cache, or replies at once and fills the reply in.
+
+        On a cache miss the reply first shows the hero-pick estimate and how many
+        players' histories have been fetched, then is edited into the full prediction.
+        Player histories not fetched within `prediction_deadline` seconds are filled in
+        by `imputer`.
+        """
+        logger.info(f"Making prediction for selected match ID: {match_id}")
+        deadline = time() + prediction_deadline
+        chat_id = call.message.chat.id
+        # Progress is reported from other threads, so the job is looked up here
+        job = current_job()
+        prediction = (
+            prediction_cache.get(match_id, "match") if prediction_cache else None
+        )
+        if prediction is not None:
+            logger.info(f"Serving cached match prediction for match ID: {match_id}")
+            self.record_match_prediction(match_id, prediction)
+            self.send_prediction(chat_id, "match", prediction)
+            return
+
+        reply = self.bot.send_message(
+            chat_id=chat_id,
+            text="Task started. Preparing a quick estimate...",
+            parse_mode="HTML",
+        )
+        dota_api = Dota2API(steam_api_key)
+        match_data = dota_api.get_single_match_online_data(match_id)
+        if not match_data:
+            self.edit_message(
+                chat_id, reply.message_id, f"Match {match_id} is no longer live."
+            )
+            return
 
-        message += (
-            f"\n<b>Radiant Team {Icons.radiantIcon}:</b> {match.radiant_team.team_name} (ID: {match.radiant_team.team_id})\n"
-            "<b>Players:</b>\n"
+        estimate = self.quick_estimate(dota_api, match_id, match_data, prediction_cache)
+        total = sum(
+            1
+            for player in match_data.get("players", [])
+            if player.get("team") in (0, 1)
+        )
+        self.edit_message(
+            chat_id, reply.message_id, self.render_progress(estimate, 0, total)
         )
+        last_edit = [monotonic()]
+        edit_lock = Lock()
+
+        def on_progress(built, total):
+            if job is not None and job.cancelled:
+                return
+            # Telegram limits edits per chat, so progress is shown at most once per
+            # progress_edit_interval seconds
+            with edit_lock:
+                if monotonic() - last_edit[0] < progress_edit_interval:
+                    return
+                last_edit[0] = monotonic()
+            self.edit_message(
+                chat_id, reply.message_id, self.render_progress(estimate, built, total)
+            )
 
-        # List Radiant team players
-        for player in match.radiant_team.players:
-            message += f"   - {remove_special_chars(player.name)} {Icons.playerIcon}(Hero: {player.hero.name})\n"
+        match = dota_api.create_match_object(
+            match_data, on_progress=on_progress, deadline=deadline, imputer=imputer
+        )
+        if job is not None and job.cancelled:
+            logger.info(f"Prediction for match ID {match_id} cancelled.")
+            self.edit_message(chat_id, reply.message_id, "Prediction cancelled.")
+            return
+        prediction = self.compute_match_prediction(match)
+        if prediction_cache:
+            prediction_cache.put(match_id, "match", prediction)
+        self.record_match_prediction(match_id, prediction)
+        message = self.render_match_prediction(prediction)
 
-        # Prepare match data for prediction
-        df, top_features = match.get_hero_match_data_for_prediction()
-        hero_pick_ml = MainML(None, "xgb_model_hero_pick.pkl")
-        hero_pick_ml.load_model()
-        prediction, _ = hero_pick_ml.predict(df)
-        message += f"\n<b>Prediction:</b> {'Radiant pick is stronger' if prediction[0] == 1 else 'Dire pick is stronger'}\n"
-        message += "<b>----------------------------------------</b>\n"  # Separator line in bold
+        # Log the message text
+        logger.info(f"Updating message in chat {chat_id}: {message}")
+        self.edit_message(chat_id, reply.message_id, message)
+        logger.info(f"Prediction for match ID {match_id} sent successfully.")
+
+    def make_hero_pick_prediction_for_selected_match(
+        self, call, match_id, prediction_cache=None
+    ):
+        logger.info(f"Making hero pick prediction for match ID: {match_id}")
+        prediction = self.get_prediction(
+            call,
+            match_id,
+            "hero_pick",
+            self.compute_hero_pick_prediction,
+            prediction_cache,
+        )
+        message = self.render_hero_pick_prediction(prediction)
 
         # Log the message text
         logger.info(f"Sending message to chat {call.message.chat.id}: {message}")
@@ -1261,49 +1593,11 @@ class Markups:
         )
         logger.info(f"Hero pick prediction for match ID {match_id} sent successfully.")
 
-    def follow_dota_plus_for_selected_match(self, call, match_id):
+    def follow_dota_plus_for_selected_match(self, call, match_id, tracker_registry):
         logger.info(f"Follow dota plus for match ID: {match_id}")
-        dota_api = Dota2API(steam_api_key)
         msg = self.bot.send_message(
             call.message.chat.id,
             f"{Icons.match_online} Match {match_id} is live! {Icons.match_tracking} Tracking win probability...",
         )
-        main_ml = MainML(None, "xgb_model_dota_plus.pkl")
-        main_ml.load_model()
-
-        prev_match_data = None
-        prev_probabilities = None
-
-        while True:
-            match_data = dota_api.get_single_match_online_data(match_id=match_id)
-
-            # Check if the match is finished
-            if not match_data:
-                self.bot.edit_message_text(
-                    chat_id=call.message.chat.id,
-                    message_id=msg.message_id,
-                    text=f"{Icons.match_finished} Match {match_id} finished!"
-                    f"Radiant Team {Icons.radiantIcon}| {prev_match_data.get('radiant_team').get('team_name')} vs Dire Team {Icons.direIcon}:|  {prev_match_data.get('dire_team').get('team_name')}\n"
-                    f"Final in game {prev_match_data.get('scoreboard').get('duration')/ 60:.2f}\n"
-                    f"Last update time: {strftime('%H:%M:%S')}"
-                    f"Final win probability: Probabilities: Radiant: {prev_probabilities[0][1]:.2%}, Dire: {prev_probabilities[0][0] :.2%}\n",
-                )
-                break  # Exit the loop when the match is finished
-            prev_match_data = match_data
-            df, top_features = (
-                Match.get_realtime_match_data_for_prediction_win_probability(match_data)
-            )
-            prediction, probabilities = main_ml.predict(df)
-            prev_probabilities = probabilities
-
-            self.bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                message_id=msg.message_id,
-                text=f"{Icons.match_online} Match is live! {Icons.match_tracking} Tracking win probability...\n"
-                f"Radiant Team {Icons.radiantIcon}| {match_data.get('radiant_team').get('team_name')} vs Dire Team {Icons.direIcon}:|  {match_data.get('dire_team').get('team_name')}\n"
-                f"Probabilities: Radiant: {probabilities[0][1]:.2%}, Dire: {probabilities[0][0] :.2%}\n"
-                f"Time in game {match_data.get('scoreboard').get('duration')/ 60:.2f}\n"
-                f"Last update time: {strftime('%H:%M:%S')}",
-            )
-
-            sleep(60)
+        # One shared tracker per match updates this message with every other subscriber
+        tracker_registry.subscribe(match_id, call.message.chat.id, msg.message_id)
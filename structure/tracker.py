@@ -0,0 +1,483 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock, Thread
+from time import strftime
+
+from config import steam_api_key
+from ml.model import MainML
+from structure.helpers import RealtimeFeatureState
+from structure.struct import Dota2API, Icons
+
+logger = logging.getLogger(__name__)
+
+
+class TrackerLimitError(Exception):
+    """Raised when a new match would exceed the number of tracked matches."""
+
+
+def _scoreboard_summary(match_data):
+    """Total kills and the Radiant net worth and XP leads of a live match."""
+    scoreboard = match_data.get("scoreboard")
+    minutes = scoreboard.get("duration") / 60
+    totals = {}
+    for side in ("radiant", "dire"):
+        players = scoreboard.get(side).get("players")
+        totals[side] = (
+            sum(player.get("kills", 0) for player in players),
+            sum(player.get("net_worth", 0) for player in players),
+            sum(player.get("xp_per_min", 0) for player in players) * minutes,
+        )
+    radiant, dire = totals["radiant"], totals["dire"]
+    return radiant[0] + dire[0], radiant[1] - dire[1], radiant[2] - dire[2]
+
+
+def next_poll_delay(
+    previous, current, min_interval, max_interval, late_game_duration=35 * 60
+):
+    """
+    Seconds until a live match should be polled again.
+
+    The draft is polled slowly and a feed that has not moved yet is polled again soon.
+    In game, the delay shrinks with the kills and net-worth/XP lead swings per game
+    minute since the previous snapshot, and late games are polled faster than early
+    laning.
+    """
+    duration = current.get("scoreboard").get("duration")
+    if duration <= 0:
+        return max_interval
+    if previous is None:
+        return min_interval
+    elapsed = duration - previous.get("scoreboard").get("duration")
+    if elapsed <= 0:
+        return min_interval
+
+    kills, gold_lead, xp_lead = _scoreboard_summary(current)
+    previous_kills, previous_gold_lead, previous_xp_lead = _scoreboard_summary(previous)
+    swing = abs(gold_lead - previous_gold_lead) + abs(xp_lead - previous_xp_lead)
+
+    activity = (kills - previous_kills + swing / 1000) * 60 / elapsed
+    if duration >= late_game_duration:
+        activity += 1
+    return min(max(max_interval / (1 + activity), min_interval), max_interval)
+
+
+class LiveFeed:
+    """
+    Shared snapshot of the Steam live league games feed.
+
+    The feed lists every live match, so it is downloaded at most once per
+    `refresh_interval` seconds however many trackers read from it.
+    """
+
+    def __init__(self, registry, refresh_interval):
+        self.registry = registry
+        self.refresh_interval = refresh_interval
+        self.matches = {}  # match_id -> live match data
+        self.fetched_at = None
+        self.fetches = 0
+        self.stale = False  # Steam is failing and the last good feed is served
+        self._api = None
+        self._locks = {}
+
+    async def get(self, match_id):
+        """Returns the live data of a valid match, or None once it is finished."""
+        loop = asyncio.get_running_loop()
+        # Created lazily so it belongs to the loop that uses it
+        lock = self._locks.setdefault(id(loop), asyncio.Lock())
+        async with lock:
+            if (
+                self.fetched_at is None
+                or loop.time() - self.fetched_at >= self.refresh_interval
+            ):
+                await self.refresh()
+        return self.matches.get(str(match_id))
+
+    async def refresh(self):
+        if self._api is None:
+            self._api = Dota2API(steam_api_key)
+        live_matches = await self.registry.call_http(self._api.fetch_live_matches)
+        self.matches = {
+            str(match_data.get("match_id")): match_data
+            for match_data in live_matches
+            if self._api.is_valid_match(match_data)
+        }
+        self.stale = self._api.stale
+        self.fetched_at = asyncio.get_running_loop().time()
+        self.fetches += 1
+        logger.info(f"Live feed refreshed with {len(self.matches)} matches.")
+
+
+class MatchTracker:
+    """
+    Follows one live match for every chat that watches it.
+
+    The tracker is a coroutine on the registry's event loop, so an idle tracker costs a
+    pending timer rather than a sleeping thread. The model is run once per tick on a
+    RealtimeFeatureState updated in place, and the next tick is scheduled from how
+    much the scoreboard moved since the previous one. A subscribed message is only
+    edited when the Radiant win probability moved by `edit_threshold` or the game
+    clock advanced by `edit_time_step` seconds since that message was last rendered.
+    """
+
+    def __init__(self, match_id, registry, edit_threshold=0, edit_time_step=0):
+        self.match_id = match_id
+        self.registry = registry
+        self.edit_threshold = edit_threshold
+        self.edit_time_step = edit_time_step
+        self.subscribers = set()  # (chat_id, message_id) pairs
+        self.rendered = {}  # (chat_id, message_id) -> (radiant probability, duration)
+        self.features = None
+        self.stopped = False
+        self.future = None
+        self.prev_match_data = None
+        self.prev_probabilities = None
+
+    async def run(self):
+        logger.info(f"Tracker started for match ID: {self.match_id}")
+        try:
+            model = await self.registry.run_blocking(self.registry.get_model)
+            self.features = await self.registry.run_blocking(RealtimeFeatureState)
+            while not self.stopped:
+                match_data = await self.registry.feed.get(self.match_id)
+
+                # Check if the match is finished
+                if not match_data:
+                    self.registry.retire(self, cancel=False)
+                    await self.broadcast(self.render_finished())
+                    # Deliver the final message before the tracker reports itself stopped
+                    await self.registry.edits.flush(
+                        {chat_id for chat_id, _ in self.rendered}
+                    )
+                    break
+
+                probabilities = await self.registry.run_blocking(
+                    self.predict, model, match_data
+                )
+                delay = self.registry.poll_delay(self.prev_match_data, match_data)
+                self.prev_match_data = match_data
+                self.prev_probabilities = probabilities
+
+                await self.broadcast(
+                    self.render_live(
+                        match_data, probabilities, self.registry.feed.stale
+                    ),
+                    state=(
+                        probabilities[0][1],
+                        match_data.get("scoreboard").get("duration"),
+                    ),
+                )
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            logger.info(f"Tracker for match ID {self.match_id} cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Tracker for match ID {self.match_id} failed: {e}")
+            self.registry.retire(self, cancel=False)
+        logger.info(f"Tracker stopped for match ID: {self.match_id}")
+
+    def predict(self, model, match_data):
+        prediction, probabilities = model.predict(self.features.update(match_data))
+        return probabilities
+
+    def needs_edit(self, subscription, state):
+        last = self.rendered.get(subscription)
+        if last is None:
+            return True
+        probability, duration = state
+        last_probability, last_duration = last
+        return (
+            abs(probability - last_probability) >= self.edit_threshold
+            or duration - last_duration >= self.edit_time_step
+        )
+
+    async def broadcast(self, text, state=None):
+        """
+        Queues `text` for every subscribed message whose rendered `state` is stale.
+
+        Without a state (the final message) every subscriber is edited.
+        """
+        subscribers = self.registry.subscribers_of(self)
+        self.rendered = {
+            subscription: self.rendered[subscription]
+            for subscription in subscribers
+            if subscription in self.rendered
+        }
+        for subscription in subscribers:
+            if state is not None and not self.needs_edit(subscription, state):
+                continue
+            self.rendered[subscription] = state
+            chat_id, message_id = subscription
+            self.registry.edits.enqueue(chat_id, message_id, text)
+
+    @staticmethod
+    def render_live(match_data, probabilities, stale=False):
+        message = (
+            f"{Icons.match_online} Match is live! {Icons.match_tracking} Tracking win probability...\n"
+            f"Radiant Team {Icons.radiantIcon}| {match_data.get('radiant_team').get('team_name')} vs Dire Team {Icons.direIcon}:|  {match_data.get('dire_team').get('team_name')}\n"
+            f"Probabilities: Radiant: {probabilities[0][1]:.2%}, Dire: {probabilities[0][0] :.2%}\n"
+            f"Time in game {match_data.get('scoreboard').get('duration')/ 60:.2f}\n"
+            f"Last update time: {strftime('%H:%M:%S')}"
+        )
+        if stale:
+            message += (
+                "\nStale data: Steam is unavailable, showing the last live update"
+            )
+        return message
+
+    def render_finished(self):
+        if self.prev_match_data is None:
+            return f"{Icons.match_finished} Match {self.match_id} finished!"
+        return (
+            f"{Icons.match_finished} Match {self.match_id} finished!"
+            f"Radiant Team {Icons.radiantIcon}| {self.prev_match_data.get('radiant_team').get('team_name')} vs Dire Team {Icons.direIcon}:|  {self.prev_match_data.get('dire_team').get('team_name')}\n"
+            f"Final in game {self.prev_match_data.get('scoreboard').get('duration')/ 60:.2f}\n"
+            f"Last update time: {strftime('%H:%M:%S')}"
+            f"Final win probability: Probabilities: Radiant: {self.prev_probabilities[0][1]:.2%}, Dire: {self.prev_probabilities[0][0] :.2%}\n"
+        )
+
+
+class EditQueue:
+    """
+    Per-chat queue of Telegram message edits, drained on the tracker event loop.
+
+    Each chat gets at most one edit every `min_interval` seconds. An edit queued for a
+    message that still has one pending replaces it, so a slow chat only ever receives
+    the newest text.
+    """
+
+    def __init__(self, registry, min_interval):
+        self.registry = registry
+        self.min_interval = min_interval
+        self._pending = {}  # chat_id -> OrderedDict of message_id -> text
+        self._drainers = {}  # chat_id -> asyncio.Task
+        self._last_sent = {}  # chat_id -> loop time of the last edit
+        self.merged = 0
+
+    def enqueue(self, chat_id, message_id, text):
+        """Must be called on the event loop."""
+        pending = self._pending.setdefault(chat_id, OrderedDict())
+        if message_id in pending:
+            self.merged += 1
+        pending[message_id] = text
+        if chat_id not in self._drainers:
+            self._drainers[chat_id] = asyncio.ensure_future(self._drain(chat_id))
+
+    async def flush(self, chat_ids=None):
+        """Waits until the queued edits of `chat_ids` (default: all chats) are sent."""
+        while True:
+            drainers = [
+                drainer
+                for chat_id, drainer in self._drainers.items()
+                if chat_ids is None or chat_id in chat_ids
+            ]
+            if not drainers:
+                return
+            await asyncio.gather(*drainers, return_exceptions=True)
+
+    async def _drain(self, chat_id):
+        loop = asyncio.get_running_loop()
+        pending = self._pending[chat_id]
+        try:
+            while pending:
+                last_sent = self._last_sent.get(chat_id)
+                if last_sent is not None:
+                    delay = last_sent + self.min_interval - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                message_id, text = pending.popitem(last=False)
+                try:
+                    await self.registry.call_telegram(
+                        self.registry.bot.edit_message_text,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=text,
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"Could not update message {message_id} in {chat_id}: {e}"
+                    )
+                self._last_sent[chat_id] = loop.time()
+        finally:
+            del self._drainers[chat_id]
+            if not pending:
+                del self._pending[chat_id]
+
+
+class TrackerRegistry:
+    """
+    Keeps at most one MatchTracker per live match_id.
+
+    All trackers run as coroutines on one event loop thread. Blocking HTTP and Telegram
+    calls go through a small shared thread pool, each kind capped by its own semaphore,
+    and message edits go through a shared per-chat EditQueue. Trackers read the match
+    from one shared LiveFeed and together poll at most `poll_budget` times a minute.
+    A tracker is created by the first subscriber and torn down when the match ends or
+    its last subscriber leaves.
+    """
+
+    def __init__(
+        self,
+        bot,
+        max_trackers,
+        interval=60,
+        http_concurrency=8,
+        telegram_concurrency=4,
+        edit_threshold=0.01,
+        edit_time_step=300,
+        edit_interval=1.0,
+        min_interval=10,
+        feed_refresh_interval=10,
+        poll_budget=600,
+    ):
+        self.bot = bot
+        self.max_trackers = max_trackers
+        self.interval = interval
+        self.min_interval = min_interval
+        self.poll_budget = poll_budget
+        self.feed = LiveFeed(self, feed_refresh_interval)
+        self.edit_threshold = edit_threshold
+        self.edit_time_step = edit_time_step
+        self.edits = EditQueue(self, edit_interval)
+        self.http_concurrency = http_concurrency
+        self.telegram_concurrency = telegram_concurrency
+        self.trackers = {}  # match_id -> MatchTracker
+        self._lock = Lock()
+        self._loop = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=http_concurrency + telegram_concurrency + 1,
+            thread_name_prefix="tracker-io",
+        )
+        self._semaphores = {}
+        self._model = None
+        self._model_lock = Lock()
+
+    def get_model(self):
+        """Loads the Dota Plus model once and shares it between all trackers."""
+        with self._model_lock:
+            if self._model is None:
+                self._model = MainML(None, "xgb_model_dota_plus.pkl")
+                self._model.load_model()
+            return self._model
+
+    def poll_delay(self, previous, current):
+        """
+        Adaptive delay of one tracker, never shorter than the feed refresh interval
+        or than what keeps all trackers within `poll_budget` polls per minute.
+        """
+        budget_delay = len(self.trackers) * 60 / self.poll_budget
+        return max(
+            next_poll_delay(previous, current, self.min_interval, self.interval),
+            self.feed.refresh_interval,
+            budget_delay,
+        )
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Runs a blocking call on the shared thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    async def call_http(self, func, *args, **kwargs):
+        async with self._semaphore("http", self.http_concurrency):
+            return await self.run_blocking(func, *args, **kwargs)
+
+    async def call_telegram(self, func, *args, **kwargs):
+        async with self._semaphore("telegram", self.telegram_concurrency):
+            return await self.run_blocking(func, *args, **kwargs)
+
+    def _semaphore(self, kind, limit):
+        # Created lazily so they belong to the loop that uses them
+        loop = asyncio.get_running_loop()
+        key = (kind, id(loop))
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(limit)
+        return self._semaphores[key]
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            Thread(
+                target=self._loop.run_forever, name="tracker-loop", daemon=True
+            ).start()
+            logger.info("Tracker event loop started.")
+        return self._loop
+
+    def _schedule(self, tracker):
+        tracker.future = asyncio.run_coroutine_threadsafe(
+            tracker.run(), self._ensure_loop()
+        )
+
+    def subscribe(self, match_id, chat_id, message_id):
+        """Adds a message to the tracker of `match_id`, starting one if needed."""
+        match_id = str(match_id)
+        with self._lock:
+            tracker = self.trackers.get(match_id)
+            if tracker is None:
+                if len(self.trackers) >= self.max_trackers:
+                    raise TrackerLimitError(
+                        f"Already tracking {len(self.trackers)} matches"
+                    )
+                tracker = MatchTracker(
+                    match_id,
+                    self,
+                    self.edit_threshold,
+                    self.edit_time_step,
+                )
+                self.trackers[match_id] = tracker
+                self._schedule(tracker)
+            tracker.subscribers.add((chat_id, message_id))
+        logger.info(f"Chat {chat_id} subscribed to match ID {match_id}")
+        return tracker
+
+    def unsubscribe(self, match_id, chat_id, message_id):
+        with self._lock:
+            tracker = self.trackers.get(str(match_id))
+            if tracker is None:
+                return False
+            tracker.subscribers.discard((chat_id, message_id))
+            if not tracker.subscribers:
+                self._retire_locked(tracker, cancel=True)
+        return True
+
+    def unsubscribe_chat(self, chat_id):
+        """Removes every subscription of a chat. Returns how many were removed."""
+        removed = 0
+        with self._lock:
+            for tracker in list(self.trackers.values()):
+                subscriptions = {s for s in tracker.subscribers if s[0] == chat_id}
+                tracker.subscribers -= subscriptions
+                removed += len(subscriptions)
+                if subscriptions and not tracker.subscribers:
+                    self._retire_locked(tracker, cancel=True)
+        return removed
+
+    def subscribers_of(self, tracker):
+        with self._lock:
+            return list(tracker.subscribers)
+
+    def retire(self, tracker, cancel=True):
+        """
+        Stops a tracker; later subscriptions to its match start a fresh one.
+
+        A tracker retiring itself passes cancel=False so it can still send its final
+        message.
+        """
+        with self._lock:
+            self._retire_locked(tracker, cancel)
+
+    def _retire_locked(self, tracker, cancel):
+        tracker.stopped = True
+        if cancel and tracker.future is not None:
+            # Wakes the tracker from its sleep instead of waiting for the next tick
+            tracker.future.cancel()
+        if self.trackers.get(tracker.match_id) is tracker:
+            del self.trackers[tracker.match_id]
+            logger.info(f"Tracker for match ID {tracker.match_id} retired")
@@ -0,0 +1,68 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from structure.columnar import load_training_data, read_columns, write_columns
+
+
+def training_rows():
+    return pd.DataFrame(
+        {
+            "match_id": [7000000001, 7000000002, 7000000003],
+            "radiant_team_name": ["Team A", "Team B", None],
+            "radiant_player_1_id": [1.0, np.nan, 3.0],
+            "radiant_player_1_kills": [1, 2, 3],
+            "radiant_player_1_hero_winrate": [0.5, 0.25, 0.125],
+            "radiant_win": [True, False, True],
+        }
+    )
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_typed_columns(self):
+        path = os.path.join(self.directory, "train.columns")
+        write_columns(training_rows(), path)
+
+        df = read_columns(path)
+        self.assertEqual(list(df.columns), list(training_rows().columns))
+        self.assertEqual(df["match_id"].dtype, np.int64)
+        self.assertEqual(df["match_id"].iloc[0], 7000000001)
+        self.assertEqual(df["radiant_team_name"].dtype, "category")
+        self.assertTrue(pd.isna(df["radiant_team_name"].iloc[2]))
+        self.assertEqual(df["radiant_player_1_id"].dtype, np.float64)
+        self.assertEqual(df["radiant_player_1_kills"].dtype, np.float32)
+        self.assertEqual(df["radiant_win"].dtype, bool)
+        self.assertEqual(list(df["radiant_player_1_kills"]), [1, 2, 3])
+        self.assertEqual(list(df["radiant_win"]), [True, False, True])
+
+        df = read_columns(path, ["radiant_win", "match_id"])
+        self.assertEqual(list(df.columns), ["radiant_win", "match_id"])
+
+    def test_store_follows_the_csv(self):
+        csv_path = os.path.join(self.directory, "train.csv")
+        training_rows().to_csv(csv_path, index=False)
+
+        df = load_training_data(csv_path, ["match_id", "radiant_player_1_kills"])
+        self.assertEqual(list(df["radiant_player_1_kills"]), [1, 2, 3])
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, "train.columns")))
+
+        time.sleep(0.01)
+        training_rows().head(1).to_csv(csv_path, index=False)
+        self.assertEqual(len(load_training_data(csv_path)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
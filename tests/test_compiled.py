@@ -0,0 +1,96 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_classification
+from xgboost import XGBClassifier, XGBRegressor
+
+from ml.compiled import CompiledEnsemble
+
+
+def training_data():
+    X, y = make_classification(n_samples=500, n_features=8, random_state=42)
+    X[::9, 2] = np.nan  # Missing values take the default branch
+    return pd.DataFrame(X, columns=[f"feature_{i}" for i in range(8)]), y
+
+
+def median_latency(predict, row, calls=200):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        predict(row)
+        latencies.append(time.perf_counter() - started)
+    return np.median(latencies)
+
+
+class TestCompiledEnsemble(unittest.TestCase):
+    def setUp(self):
+        self.X, self.y = training_data()
+        self.model = XGBClassifier(n_estimators=50, max_depth=5, random_state=42)
+        self.model.fit(self.X, self.y)
+        self.compiled = CompiledEnsemble.from_classifier(self.model)
+
+    def test_parity_with_predict_proba(self):
+        np.testing.assert_allclose(
+            self.compiled.predict_proba(self.X),
+            self.model.predict_proba(self.X),
+            atol=1e-6,
+        )
+        np.testing.assert_array_equal(
+            self.compiled.predict(self.X), self.model.predict(self.X)
+        )
+
+    def test_single_rows(self):
+        row = self.X.iloc[[3]]
+        np.testing.assert_allclose(
+            self.compiled.predict_proba(row), self.model.predict_proba(row), atol=1e-6
+        )
+        # Plain arrays are taken in the column order of the training data
+        np.testing.assert_allclose(
+            self.compiled.predict_proba(row.to_numpy()[0]),
+            self.model.predict_proba(row),
+            atol=1e-6,
+        )
+        # Data frames are matched by column name
+        reordered = row[row.columns[::-1]]
+        np.testing.assert_allclose(
+            self.compiled.predict_proba(reordered),
+            self.model.predict_proba(row),
+            atol=1e-6,
+        )
+
+    def test_early_stopped_model(self):
+        model = XGBClassifier(
+            n_estimators=500, early_stopping_rounds=5, random_state=42
+        ).fit(self.X[:400], self.y[:400], eval_set=[(self.X[400:], self.y[400:])])
+        self.assertLess(model.best_iteration, 499)
+
+        np.testing.assert_allclose(
+            CompiledEnsemble.from_classifier(model).predict_proba(self.X),
+            model.predict_proba(self.X),
+            atol=1e-6,
+        )
+
+    def test_unsupported_objective(self):
+        model = XGBRegressor(n_estimators=2).fit(self.X, self.y)
+        with self.assertRaises(ValueError):
+            CompiledEnsemble(model.get_booster())
+
+    def test_faster_than_xgboost_for_single_rows(self):
+        row = self.X.iloc[[0]]
+        xgboost_latency = median_latency(self.model.predict_proba, row)
+        compiled_latency = median_latency(self.compiled.predict_proba, row)
+        print(
+            f"\nSingle-row latency: XGBoost {xgboost_latency * 1000:.3f} ms, "
+            f"compiled {compiled_latency * 1000:.3f} ms"
+        )
+        self.assertLess(compiled_latency, xgboost_latency)
+
+
+if __name__ == "__main__":
+    unittest.main()
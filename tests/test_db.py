@@ -2,10 +2,12 @@
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
 
+import importlib
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 import numpy as np
+import requests
 from sqlalchemy.exc import SQLAlchemyError
 
 from db.database_operations import (
@@ -17,8 +19,18 @@ from db.database_operations import (
     calculate_win_rate,
     get_current_last_trained_row_id,
     update_or_create_last_trained_row_id,
+    load_history_training_data,
+)
+import config
+import db.setup
+from structure import http_client
+from db.setup import (
+    History,
+    ModelTrainingMetadata,
+    HISTORY_FEATURE_COLUMNS,
+    init_database,
+    is_database_ready,
 )
-from db.setup import History, ModelTrainingMetadata
 
 
 class TestDatabaseOperations(unittest.TestCase):
@@ -141,6 +153,60 @@ class TestDatabaseOperations(unittest.TestCase):
         self.assertEqual(len(df), 1)  # Expecting 1 row
         self.assertEqual(df["match_id"][0], 8012600015)  # Check match_id
 
+    @patch("db.database_operations.get_database_session")
+    def test_load_history_training_data(self, mock_get_session):
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+
+        n_features = len(HISTORY_FEATURE_COLUMNS)
+        first_chunk = [(7, 1) + (0.5,) * n_features, (9, 0) + (0.25,) * n_features]
+        second_chunk = [(12, 1) + (1.0,) * n_features]
+
+        count_result = MagicMock()
+        count_result.scalar_one.return_value = 3
+        rows_result = MagicMock()
+        rows_result.partitions.return_value = iter([first_chunk, second_chunk])
+        mock_session.execute.side_effect = [count_result, rows_result]
+
+        features, labels, row_ids = load_history_training_data(after_row_id=5)
+
+        self.assertEqual(features.dtype, np.float32)
+        self.assertEqual(features.shape, (3, n_features))
+        np.testing.assert_array_equal(labels, [1, 0, 1])
+        np.testing.assert_array_equal(row_ids, [7, 9, 12])
+        np.testing.assert_allclose(features[:, 0], [0.5, 0.25, 1.0])
+        mock_session.close.assert_called_once()
+
+    @patch("db.database_operations.get_database_session")
+    def test_load_history_training_data_respects_limit(self, mock_get_session):
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+
+        count_result = MagicMock()
+        count_result.scalar_one.return_value = 100
+        rows_result = MagicMock()
+        rows_result.partitions.return_value = iter(
+            [[(1, 0) + (0.0,) * len(HISTORY_FEATURE_COLUMNS)]]
+        )
+        mock_session.execute.side_effect = [count_result, rows_result]
+
+        features, labels, row_ids = load_history_training_data(limit=1)
+
+        self.assertEqual(features.shape[0], 1)
+        self.assertEqual(row_ids.tolist(), [1])
+
+    @patch("db.database_operations.get_database_session")
+    def test_load_history_training_data_database_error(self, mock_get_session):
+        mock_session = MagicMock()
+        mock_get_session.return_value = mock_session
+        mock_session.execute.side_effect = SQLAlchemyError("Database error")
+
+        features, labels, row_ids = load_history_training_data()
+
+        self.assertEqual(features.shape, (0, len(HISTORY_FEATURE_COLUMNS)))
+        self.assertEqual(len(labels), 0)
+        self.assertEqual(len(row_ids), 0)
+
     def test_convert_to_native_type(self):
         # Test converting numpy int64 to int
         self.assertEqual(convert_to_native_type(np.int64(42)), 42)
@@ -184,6 +250,32 @@ class TestDatabaseOperations(unittest.TestCase):
             match_to_update.actual_result, 1
         )  # Assuming True translates to 1
 
+    @patch("db.database_operations.get_database_session")
+    @patch("requests.get")
+    def test_fetch_and_update_survives_failed_requests(
+        self, mock_get, mock_get_session
+    ):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+        mock_session = mock_get_session.return_value
+        matches = [History(match_id=i, actual_result=None) for i in range(1, 10)]
+        mock_session.query.return_value.filter.return_value.all.return_value = matches
+        mock_response = MagicMock(status_code=200)
+        mock_response.json.return_value = {"radiant_win": False}
+        mock_get.side_effect = [requests.Timeout("slow"), mock_response] + [
+            requests.ConnectionError("down")
+        ] * 5
+
+        fetch_and_update_actual_results()
+
+        # Every request has a timeout, and one failure does not stop the others
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], http_client.http_timeout)
+        self.assertIsNone(matches[0].actual_result)
+        self.assertEqual(matches[1].actual_result, 0)
+        # Once the circuit opens the remaining matches are left for later
+        self.assertEqual(mock_get.call_count, 7)
+        self.assertTrue(all(match.actual_result is None for match in matches[2:]))
+
     @patch("db.database_operations.get_database_session")
     def test_fetch_and_update_no_matches(self, mock_get_session):
         mock_session = MagicMock()
@@ -405,3 +497,43 @@ class TestDatabaseOperations(unittest.TestCase):
 
         # Verify that 0 is returned on exception
         self.assertEqual(result, 0)
+
+
+class TestDatabaseSetup(unittest.TestCase):
+    def setUp(self):
+        db.setup._database_initialised = False
+
+    def tearDown(self):
+        db.setup._database_initialised = False
+
+    @patch("db.setup.create_engine")
+    def test_importing_config_does_not_touch_database(self, mock_create_engine):
+        importlib.reload(config)
+
+        mock_create_engine.assert_not_called()
+
+    @patch("db.setup.create_database_and_tables", return_value=True)
+    def test_init_database_runs_once(self, mock_create_tables):
+        self.assertTrue(init_database(config.DATABASE_CONFIG))
+        self.assertTrue(init_database(config.DATABASE_CONFIG))
+
+        mock_create_tables.assert_called_once_with(config.DATABASE_CONFIG)
+
+    @patch("db.setup.create_database_and_tables", side_effect=[False, True])
+    def test_init_database_retries_after_failure(self, mock_create_tables):
+        self.assertFalse(init_database(config.DATABASE_CONFIG))
+        self.assertTrue(init_database(config.DATABASE_CONFIG))
+
+        self.assertEqual(mock_create_tables.call_count, 2)
+
+    @patch("db.setup.create_database_engine")
+    def test_is_database_ready(self, mock_create_engine):
+        # Not ready before the schema has been bootstrapped
+        self.assertFalse(is_database_ready(config.DATABASE_CONFIG))
+        mock_create_engine.assert_not_called()
+
+        db.setup._database_initialised = True
+        self.assertTrue(is_database_ready(config.DATABASE_CONFIG))
+
+        mock_create_engine.return_value.connect.side_effect = Exception("down")
+        self.assertFalse(is_database_ready(config.DATABASE_CONFIG))
@@ -0,0 +1,111 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from db.setup import HISTORY_FEATURE_COLUMNS
+from ml.external_memory import (
+    ChunkIter,
+    column_store_chunks,
+    csv_chunks,
+    history_chunks,
+    training_matrix,
+)
+from structure.columnar import write_columns
+
+
+def training_rows(rows=23):
+    return pd.DataFrame(
+        {
+            "feature_a": np.arange(rows, dtype=float),
+            "feature_b": np.arange(rows, dtype=float) % 3,
+            "radiant_win": np.arange(rows) % 2 == 0,
+        }
+    )
+
+
+def double(chunk):
+    chunk["feature_a"] = chunk["feature_a"] * 2
+    return chunk
+
+
+class TestChunkSources(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def assert_chunks(self, chunks):
+        parts = list(chunks())
+        self.assertEqual([len(X) for X, _ in parts], [10, 10, 3])
+        X = pd.concat([X for X, _ in parts])
+        self.assertEqual(list(X.columns), ["feature_a", "feature_b"])
+        self.assertEqual(list(X["feature_a"]), [2 * i for i in range(23)])
+        y = np.concatenate([np.asarray(y) for _, y in parts])
+        self.assertEqual(list(y), list(training_rows()["radiant_win"]))
+
+    def test_csv_chunks(self):
+        path = os.path.join(self.directory, "train.csv")
+        training_rows().to_csv(path, index=False)
+        self.assert_chunks(csv_chunks(path, "radiant_win", 10, prepare=double))
+
+    def test_column_store_chunks(self):
+        path = os.path.join(self.directory, "train.columns")
+        write_columns(training_rows(), path)
+        self.assert_chunks(column_store_chunks(path, "radiant_win", 10, prepare=double))
+
+    @patch("ml.external_memory.load_history_training_data")
+    def test_history_chunks(self, mock_load_data):
+        features = len(HISTORY_FEATURE_COLUMNS)
+        mock_load_data.side_effect = [
+            (np.ones((2, features)), np.array([0, 1]), np.array([4, 7])),
+            (np.zeros((1, features)), np.array([1]), np.array([9])),
+            (np.empty((0, features)), np.empty(0), np.empty(0)),
+        ]
+
+        parts = list(history_chunks(2)())
+
+        self.assertEqual([len(X) for X, _ in parts], [2, 1])
+        self.assertEqual(list(parts[0][0].columns), HISTORY_FEATURE_COLUMNS)
+        self.assertEqual(
+            [call.kwargs["after_row_id"] for call in mock_load_data.call_args_list],
+            [0, 7, 9],
+        )
+
+    def test_held_out_rows_are_not_trained_on(self):
+        path = os.path.join(self.directory, "train.csv")
+        training_rows().to_csv(path, index=False)
+        chunks = csv_chunks(path, "radiant_win", 10)
+
+        dtrain = training_matrix(chunks, holdout_every=5)
+        self.assertEqual(dtrain.num_row(), 18)
+
+        # The iterator can be replayed for every pass XGBoost makes
+        iterator = ChunkIter(chunks, holdout_every=5)
+        labels = []
+        for _ in range(2):
+            iterator.reset()
+            while iterator.next(lambda data, label: labels.append(label)):
+                pass
+        self.assertEqual(sum(len(label) for label in labels), 36)
+
+    def test_cache_on_disk(self):
+        path = os.path.join(self.directory, "train.csv")
+        training_rows().to_csv(path, index=False)
+
+        dtrain = training_matrix(
+            csv_chunks(path, "radiant_win", 10),
+            cache_dir=os.path.join(self.directory, "cache"),
+        )
+        self.assertEqual(dtrain.num_row(), 18)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import pandas as pd
+import requests
+
+from dataset.generation import PartitionedWriter, collect, write_dataset
+from dataset.warehouse import Warehouse
+from structure import http_client
+
+LEAGUES = [
+    {"leagueid": 1, "name": "League A"},
+    {"leagueid": 2, "name": "League B"},
+    {"leagueid": 3, "name": "Other League"},
+]
+
+
+def match_payload(match_id):
+    slots = [0, 1, 2, 3, 4, 128, 129, 130, 131, 132]
+    return {
+        "match_id": match_id,
+        "radiant_win": True,
+        "players": [
+            {"player_slot": slot, "isRadiant": slot < 128, "hero_id": hero_id}
+            for hero_id, slot in enumerate(slots, 1)
+        ],
+    }
+
+
+def opendota(failing=()):
+    """A fake requests.get for the OpenDota endpoints the collection uses."""
+
+    def get(url, **kwargs):
+        path = url.split("/api/")[1].split("?")[0]
+        if path in failing:
+            raise requests.ConnectionError("down")
+        response = MagicMock(status_code=200)
+        if path.startswith("leagues/"):
+            league_id = int(path.split("/")[1])
+            data = [{"match_id": league_id * 10 + n} for n in range(2)]
+        elif path.startswith("matches/"):
+            data = match_payload(int(path.split("/")[1]))
+        elif path == "heroStats":
+            data = [{"id": 1, "localized_name": "Anti-Mage"}]
+        else:
+            data = [{"hero_id": 6, "games_played": 2, "wins": 1}]
+        response.json.return_value = data
+        return response
+
+    return get
+
+
+class TestGeneration(unittest.TestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.warehouse = Warehouse(os.path.join(self.directory.name, "raw.sqlite"))
+        self.addCleanup(self.warehouse.close)
+
+    def collect(self, failing=()):
+        with patch("dataset.generation.OpenDotaApi") as mock_api, patch(
+            "requests.get", side_effect=opendota(failing)
+        ) as mock_get:
+            mock_api.return_value.set_premium_leagues.return_value = LEAGUES
+            collect(self.warehouse, leagues=["League A", "League B"], workers=4)
+        return sorted(
+            call.args[0].split("/api/")[1] for call in mock_get.call_args_list
+        )
+
+    def test_collection_resumes(self):
+        urls = self.collect(failing={"matches/21", "heroes/3/matchups"})
+        self.assertEqual(len(urls), 2 + 4 + 1 + 10)
+        self.assertEqual(self.warehouse.missing_matches(), [21])
+        self.assertEqual(self.warehouse.missing_matchups(), [3])
+
+        # Only what failed is fetched again
+        urls = self.collect()
+        self.assertEqual(
+            [url.split("?")[0] for url in urls], ["heroes/3/matchups", "matches/21"]
+        )
+        self.assertEqual(self.warehouse.missing_matches(), [])
+        self.assertEqual(self.warehouse.missing_matchups(), [])
+        self.assertEqual(len(list(self.warehouse.matches(["League B"]))), 2)
+
+    def test_write_dataset(self):
+        output = os.path.join(self.directory.name, "dataset")
+        os.makedirs(output)
+        with open(os.path.join(output, "Old_League.csv"), "w") as file:
+            file.write("match_id\n1\n")
+
+        write_dataset(
+            [
+                ("League A", {"match_id": 10, "radiant_win": True}),
+                ("League B", {"match_id": 20}),
+                ("League A", {"match_id": 11, "radiant_win": False}),
+            ],
+            ["match_id", "radiant_win"],
+            output,
+        )
+
+        self.assertEqual(sorted(os.listdir(output)), ["League_A.csv", "League_B.csv"])
+        league_a = pd.read_csv(os.path.join(output, "League_A.csv"))
+        self.assertEqual(list(league_a["match_id"]), [10, 11])
+        league_b = pd.read_csv(os.path.join(output, "League_B.csv"))
+        self.assertEqual(list(league_b.columns), ["match_id", "radiant_win"])
+        self.assertTrue(league_b["radiant_win"].isna().all())
+        # Training builds its own column store next to the training CSV
+        self.assertFalse(os.path.exists(f"{output}.columns"))
+
+    def test_rows_must_fit_the_schema(self):
+        writer = PartitionedWriter(self.directory.name, ["match_id"])
+        with self.assertRaises(ValueError):
+            writer.write("League A", {"match_id": 1, "unknown": 2})
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
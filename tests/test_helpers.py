@@ -2,8 +2,12 @@
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
 
+import os
+import tempfile
 import unittest
 
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 
@@ -13,7 +17,10 @@ from structure.helpers import (
     prepare_match_prediction_data,
     find_dict_in_list,
     prepare_hero_pick_data,
+    RealtimeFeatureState,
+    REALTIME_FEATURE_COLUMNS,
 )
+from structure.struct import Match
 
 
 class TestFeatureEngineering(unittest.TestCase):
@@ -493,3 +500,70 @@ class TestFeatureEngineering(unittest.TestCase):
         self.assertEqual(df_radiant["radiant_avg_kills"].iloc[0], 3)
         self.assertEqual(df_radiant["radiant_avg_assists"].iloc[0], 24.6)
         self.assertEqual(df_radiant["radiant_avg_deaths"].iloc[0], 1.6)
+
+
+class TestRealtimeFeatureState(unittest.TestCase):
+    def live_match(self, seed):
+        rng = np.random.default_rng(seed)
+
+        def player():
+            return {
+                "account_id": int(rng.integers(1, 1000)),
+                "hero_id": int(rng.integers(1, 120)),
+                "kills": int(rng.integers(0, 15)),
+                "death": int(rng.integers(0, 3)),
+                "assists": int(rng.integers(0, 20)),
+                "gold_per_min": int(rng.integers(200, 900)),
+                "xp_per_min": int(rng.integers(200, 900)),
+                "net_worth": int(rng.integers(500, 30000)),
+                "last_hits": int(rng.integers(0, 400)),
+                "denies": int(rng.integers(0, 30)),
+                "level": int(rng.integers(1, 30)),
+            }
+
+        return {
+            "match_id": 1,
+            "radiant_team": {"team_id": 1, "team_name": "Radiant"},
+            "dire_team": {"team_id": 2, "team_name": "Dire"},
+            "scoreboard": {
+                "duration": 1800,
+                "radiant": {"players": [player() for _ in range(5)]},
+                "dire": {"players": [player() for _ in range(5)]},
+            },
+        }
+
+    def test_matches_dataframe_pipeline(self):
+        state = RealtimeFeatureState("scaler_dota_plus.pkl")
+
+        for seed in range(5):
+            match = self.live_match(seed)
+            expected, columns = (
+                Match.get_realtime_match_data_for_prediction_win_probability(match)
+            )
+
+            self.assertEqual(columns, REALTIME_FEATURE_COLUMNS)
+            np.testing.assert_allclose(
+                state.update(match), expected.values, rtol=1e-5, atol=1e-6
+            )
+
+    def test_scaler_without_feature_names(self):
+        # Columns in the sorted order prepare_match_prediction_data fits them in
+        fitted = joblib.load("scaler_dota_plus.pkl")
+        scaler = MinMaxScaler().fit(np.vstack([fitted.data_min_, fitted.data_max_]))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "scaler.pkl")
+            joblib.dump(scaler, path)
+            match = self.live_match(0)
+
+            np.testing.assert_allclose(
+                RealtimeFeatureState(path).update(match),
+                RealtimeFeatureState("scaler_dota_plus.pkl").update(match),
+                rtol=1e-5,
+            )
+
+    def test_requires_full_teams(self):
+        match = self.live_match(0)
+        match["scoreboard"]["dire"]["players"].pop()
+
+        with self.assertRaises(ValueError):
+            RealtimeFeatureState("scaler_dota_plus.pkl").update(match)
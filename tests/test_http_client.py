@@ -0,0 +1,224 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from structure import http_client
+from structure.http_client import CircuitBreaker, CircuitOpenError
+
+
+def response(status_code, data=None):
+    mock_response = MagicMock(status_code=status_code)
+    mock_response.json.return_value = data
+    return mock_response
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_failures_and_probes_after_reset(self):
+        circuit = CircuitBreaker(
+            "match", failure_threshold=2, slow_call_seconds=1, reset_timeout=0.05
+        )
+
+        circuit.record(False, 0.1)
+        self.assertTrue(circuit.allow())
+        circuit.record(True, 2)  # Slow calls count as failures
+        self.assertEqual(circuit.state, "open")
+        self.assertFalse(circuit.allow())
+        self.assertEqual(circuit.rejected, 1)
+
+        time.sleep(0.05)
+        self.assertTrue(circuit.allow())  # The probe
+        self.assertFalse(circuit.allow())
+        circuit.record(True, 0.1)
+        self.assertEqual(circuit.state, "closed")
+        self.assertTrue(circuit.allow())
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+
+    @patch("requests.get")
+    def test_open_circuit_fails_fast(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError("down")
+
+        for _ in range(5):
+            with self.assertRaises(requests.ConnectionError):
+                http_client.get("https://api.opendota.com/api/matches/1", "match")
+        with self.assertRaises(CircuitOpenError):
+            http_client.get("https://api.opendota.com/api/matches/2", "match")
+
+        self.assertEqual(mock_get.call_count, 5)
+        # Every call had a timeout even though none was given
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], http_client.http_timeout)
+        # Other endpoints are not affected
+        mock_get.side_effect = None
+        mock_get.return_value = response(200)
+        http_client.get("https://api.opendota.com/api/heroStats", "hero_stats")
+
+    @patch("requests.get")
+    def test_deadline_timeouts_are_not_failures(self, mock_get):
+        mock_get.side_effect = requests.Timeout("deadline")
+
+        for _ in range(10):
+            with self.assertRaises(requests.Timeout):
+                http_client.get(
+                    "https://api.opendota.com/api/matches/1", "match", timeout=0.1
+                )
+        self.assertEqual(http_client.breaker("match").state, "closed")
+
+        # Longer timeouts are capped, and running into them is a failure
+        for _ in range(5):
+            with self.assertRaises(requests.Timeout):
+                http_client.get(
+                    "https://api.opendota.com/api/matches/1", "match", timeout=60
+                )
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], http_client.http_timeout)
+        self.assertEqual(http_client.breaker("match").state, "open")
+
+    @patch("requests.get")
+    def test_deadline_timeout_of_probe_lets_another_probe_through(self, mock_get):
+        circuit = http_client.breaker("match")
+        circuit.reset_timeout = 0.05
+        mock_get.side_effect = requests.ConnectionError("down")
+        for _ in range(5):
+            with self.assertRaises(requests.ConnectionError):
+                http_client.get("https://api.opendota.com/api/matches/1", "match")
+        time.sleep(0.05)
+
+        # The probe runs into the caller's deadline
+        mock_get.side_effect = requests.Timeout("deadline")
+        with self.assertRaises(requests.Timeout):
+            http_client.get(
+                "https://api.opendota.com/api/matches/1", "match", timeout=0.1
+            )
+        self.assertEqual(circuit.state, "open")
+
+        mock_get.side_effect = None
+        mock_get.return_value = response(200)
+        http_client.get("https://api.opendota.com/api/matches/1", "match")
+        self.assertEqual(circuit.state, "closed")
+
+    @patch("requests.get")
+    def test_stale_value_is_served_and_revalidated(self, mock_get):
+        url = "https://api.opendota.com/api/heroStats"
+        mock_get.return_value = response(200, ["fresh"])
+        result = http_client.get_json(url, "hero_stats")
+        self.assertEqual(result.data, ["fresh"])
+        self.assertFalse(result.stale)
+
+        # Young enough values are not requested again
+        self.assertEqual(http_client.get_json(url, "hero_stats", max_age=60), result)
+        self.assertEqual(mock_get.call_count, 1)
+
+        # The upstream fails once and has recovered by the background request
+        mock_get.side_effect = [response(503), response(200, ["recovered"])]
+        result = http_client.get_json(url, "hero_stats")
+        self.assertEqual(result.data, ["fresh"])
+        self.assertTrue(result.stale)
+
+        for _ in range(100):
+            if http_client.get_json(url, "hero_stats", max_age=60).data != ["fresh"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(
+            http_client.get_json(url, "hero_stats", max_age=60).data, ["recovered"]
+        )
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch("requests.get")
+    def test_client_errors_are_not_served_stale(self, mock_get):
+        url = "https://api.opendota.com/api/heroes/1/matchups"
+        mock_get.return_value = response(200, ["matchups"])
+        http_client.get_json(url, "hero_matchups")
+
+        mock_get.return_value = response(404)
+        self.assertIsNone(http_client.get_json(url, "hero_matchups"))
+        self.assertEqual(http_client.breaker("hero_matchups").state, "closed")
+
+    @patch("requests.get")
+    def test_nothing_cached_during_outage(self, mock_get):
+        mock_get.side_effect = requests.Timeout("slow")
+        self.assertIsNone(http_client.get_json("https://steam/live", "live_feed"))
+
+
+class TestHedger(unittest.TestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+
+    def warm_up(self, mock_get, count=20):
+        mock_get.side_effect = None
+        mock_get.return_value = response(200)
+        for _ in range(count):
+            http_client.get("https://api.opendota.com/api/matches/1", "match", True)
+        mock_get.reset_mock()
+
+    @patch("requests.get")
+    def test_slow_request_is_hedged(self, mock_get):
+        self.warm_up(mock_get)
+        calls = []
+        responses = []
+
+        def tail_latency(url, timeout=None):
+            calls.append(url)
+            if len(calls) == 1:
+                time.sleep(0.3)  # Only the first copy is slow
+            responses.append(response(200, len(calls)))
+            return responses[-1]
+
+        mock_get.side_effect = tail_latency
+        start = time.monotonic()
+        result = http_client.get(
+            "https://api.opendota.com/api/matches/2", "match", hedge=True
+        )
+
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(result.json(), 2)
+        self.assertEqual(calls, ["https://api.opendota.com/api/matches/2"] * 2)
+        self.assertEqual(http_client.hedger.hedges, 1)
+        self.assertEqual(http_client.hedger.hedge_wins, 1)
+        # Wait for the slow copy to finish
+        for _ in range(100):
+            if responses[-1].close.called and http_client.hedger.saved_seconds:
+                break
+            time.sleep(0.01)
+        self.assertGreater(http_client.hedger.saved_seconds, 0.1)
+        # Only the losing copy, which finished last, is closed
+        winner, loser = responses
+        self.assertIs(result, winner)
+        winner.close.assert_not_called()
+        loser.close.assert_called_once()
+
+    @patch("requests.get")
+    def test_hedging_stays_within_budget(self, mock_get):
+        self.warm_up(mock_get)
+
+        def slow(url, timeout=None):
+            time.sleep(0.02)
+            return response(200)
+
+        mock_get.side_effect = slow
+        for _ in range(10):
+            http_client.get("https://api.opendota.com/api/matches/2", "match", True)
+
+        # 5% of 30 requests allows one copy
+        self.assertEqual(http_client.hedger.requests, 30)
+        self.assertEqual(http_client.hedger.hedges, 1)
+        self.assertEqual(mock_get.call_count, 11)
+
+    @patch("requests.get")
+    def test_no_hedging_without_enough_samples(self, mock_get):
+        self.warm_up(mock_get, count=5)
+        self.assertIsNone(http_client.hedger.delay("match"))
+        self.assertIsNone(http_client.hedger.delay("player_matches"))
+
+
+if __name__ == "__main__":
+    unittest.main()
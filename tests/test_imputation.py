@@ -0,0 +1,55 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from structure.imputation import PlayerStatsImputer, PLAYER_STATS
+
+
+def training_rows():
+    row = {}
+    for team, offset in (("radiant", 0), ("dire", 100)):
+        for i in range(1, 6):
+            row[f"{team}_player_{i}_id"] = offset + i
+            row[f"{team}_player_{i}_hero_id"] = i
+            for stat in PLAYER_STATS:
+                row[f"{team}_player_{i}_{stat}"] = offset + i
+    return pd.DataFrame([row, row])
+
+
+class TestPlayerStatsImputer(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "train.csv")
+        training_rows().to_csv(self.path, index=False)
+        self.imputer = PlayerStatsImputer(self.path)
+
+    def test_sources_from_most_specific(self):
+        self.imputer.remember(1, 3, {stat: 7 for stat in PLAYER_STATS})
+
+        stats, source = self.imputer.impute(1, 3)
+        self.assertEqual((stats["kills"], source), (7, "cached aggregates"))
+
+        stats, source = self.imputer.impute(101, 9)
+        self.assertEqual((stats["kills"], source), (101, "player training average"))
+
+        # Hero 2 is played by radiant player 2 and dire player 102
+        stats, source = self.imputer.impute(999, 2)
+        self.assertEqual((stats["kills"], source), (52, "hero prior"))
+
+        stats, source = self.imputer.impute(999, 999)
+        self.assertEqual((stats["gold_per_min"], source), (53, "training mean"))
+
+    def test_missing_training_data(self):
+        imputer = PlayerStatsImputer(os.path.join(self.path, "missing.csv"))
+
+        stats, source = imputer.impute(1, 1)
+
+        self.assertEqual(source, "training mean")
+        self.assertEqual(set(stats.values()), {0.0})
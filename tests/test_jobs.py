@@ -0,0 +1,125 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import unittest
+from threading import Event
+
+from structure.jobs import WorkerPool, QueueFullError, JobStatus, current_job
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.release = Event()
+        self.started = Event()
+        self.order = []
+
+    def make_pool(self, workers=1, max_queue_depth=10, max_jobs_per_chat=10):
+        pool = WorkerPool("test", workers, max_queue_depth, max_jobs_per_chat)
+        self.addCleanup(pool.shutdown)
+        self.addCleanup(self.release.set)
+        return pool
+
+    def block(self):
+        self.started.set()
+        self.release.wait(5)
+
+    def submit_blocker(self, pool, chat_id):
+        job = pool.submit(chat_id, self.block)
+        self.assertTrue(self.started.wait(5))
+        return job
+
+    def record(self, label):
+        self.order.append(label)
+
+    def test_job_runs_and_reports_status(self):
+        pool = self.make_pool()
+
+        job = pool.submit(1, self.record, "a")
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, JobStatus.done)
+        self.assertEqual(self.order, ["a"])
+        self.assertIsNone(pool.get_job(job.job_id))
+
+    def test_failed_job_keeps_error(self):
+        pool = self.make_pool()
+
+        def fail():
+            raise ValueError("boom")
+
+        job = pool.submit(1, fail)
+
+        job.wait(5)
+        self.assertEqual(job.status, JobStatus.failed)
+        self.assertIsInstance(job.error, ValueError)
+
+    def test_chats_are_served_round_robin(self):
+        pool = self.make_pool()
+        blocker = self.submit_blocker(pool, "a")
+
+        a1 = pool.submit("a", self.record, "a1")
+        a2 = pool.submit("a", self.record, "a2")
+        b1 = pool.submit("b", self.record, "b1")
+        self.release.set()
+
+        for job in (blocker, a1, a2, b1):
+            job.wait(5)
+        self.assertEqual(self.order, ["a1", "b1", "a2"])
+
+    def test_queue_depth_limits(self):
+        pool = self.make_pool(max_queue_depth=2, max_jobs_per_chat=2)
+        running = self.submit_blocker(pool, "a")
+
+        pool.submit("a", self.record, "queued")
+        with self.assertRaises(QueueFullError):
+            pool.submit("a", self.record, "per chat limit")
+
+        pool.submit("b", self.record, "b1")
+        with self.assertRaises(QueueFullError):
+            pool.submit("c", self.record, "global limit")
+
+        self.assertEqual(pool.queue_depth, 2)
+        self.assertEqual(running.status, JobStatus.running)
+
+    def test_cancel_queued_job(self):
+        pool = self.make_pool()
+        self.submit_blocker(pool, "a")
+        queued = pool.submit("a", self.record, "never")
+
+        self.assertTrue(pool.cancel(queued.job_id))
+        self.release.set()
+
+        self.assertTrue(queued.wait(5))
+        self.assertEqual(queued.status, JobStatus.cancelled)
+        self.assertFalse(pool.cancel(queued.job_id))
+        self.assertEqual(self.order, [])
+
+    def test_cancel_running_job_is_cooperative(self):
+        pool = self.make_pool()
+        started = Event()
+
+        def loop():
+            started.set()
+            while not current_job().cancelled:
+                self.release.wait(0.01)
+
+        job = pool.submit("a", loop)
+        started.wait(5)
+
+        self.assertEqual(pool.cancel_chat("a"), 1)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, JobStatus.cancelled)
+
+    def test_concurrency_is_capped(self):
+        pool = self.make_pool(workers=2)
+
+        for _ in range(4):
+            pool.submit("a", self.block)
+
+        for _ in range(100):
+            if pool.running == 2:
+                break
+            self.release.wait(0.01)
+        self.assertEqual(pool.running, 2)
+        self.assertEqual(pool.queue_depth, 2)
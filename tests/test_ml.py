@@ -3,12 +3,12 @@
 # This code is licensed under the MIT License. See LICENSE file for details.
 
 import unittest
-from dataclasses import dataclass
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import pandas as pd
 import numpy as np
 from sklearn.datasets import make_classification
 from xgboost import XGBClassifier
+from db.setup import HISTORY_FEATURE_COLUMNS
 from ml.model import MainML, logger
 
 
@@ -47,6 +47,29 @@ class TestMainML(unittest.TestCase):
             self.main_ml.xgb_model, self.model_path
         )
 
+    @patch("joblib.dump")
+    def test_train_with_profile(self, mock_joblib_dump):
+        with self.assertLogs(logger, level="INFO") as log:
+            self.main_ml.train_and_save_model(
+                features=[f"feature_{i}" for i in range(5)],
+                target="target",
+                profile="fast",
+                n_jobs=1,
+            )
+
+        params = self.main_ml.xgb_model.get_params()
+        self.assertEqual(params["tree_method"], "hist")
+        self.assertEqual(params["max_depth"], 4)
+        self.assertEqual(params["n_jobs"], 1)
+        # Stopped early on the validation split
+        self.assertLess(self.main_ml.xgb_model.best_iteration, 499)
+        self.assertTrue(
+            any(
+                "Training took" in line and "single-row latency" in line
+                for line in log.output
+            )
+        )
+
     @patch("joblib.load")
     def test_load_model(self, mock_joblib_load):
         mock_joblib_load.return_value = XGBClassifier()
@@ -58,6 +81,22 @@ class TestMainML(unittest.TestCase):
 
         mock_joblib_load.assert_called_once_with(self.model_path)
 
+    @patch("ml.model.serving_backend", "numpy")
+    @patch("joblib.load")
+    def test_load_compiled_model(self, mock_joblib_load):
+        X = self.df[[f"feature_{i}" for i in range(5)]]
+        model = XGBClassifier(n_estimators=10).fit(X, self.df["target"])
+        mock_joblib_load.return_value = model
+
+        self.main_ml.load_model()
+        prediction, probability = self.main_ml.predict(X)
+
+        np.testing.assert_allclose(probability, model.predict_proba(X), atol=1e-6)
+        np.testing.assert_array_equal(prediction, model.predict(X))
+        # Compiled once until the saved model changes
+        MainML(None, self.model_path).load_model()
+        mock_joblib_load.assert_called_once_with(self.model_path)
+
     @patch.object(XGBClassifier, "predict", return_value=np.array([1]))
     @patch.object(XGBClassifier, "predict_proba", return_value=np.array([[0.2, 0.8]]))
     def test_predict(self, mock_predict_proba, mock_predict):
@@ -95,42 +134,25 @@ class TestMainML(unittest.TestCase):
                 confusion_matrix_logged, "Confusion matrix not found in logs"
             )
 
+    @patch("joblib.dump")
     @patch.object(
         XGBClassifier, "fit"
     )  # Mock the `fit` method to avoid actual training
-    @patch("ml.model.get_database_session")  # Mock the database session creation
+    @patch("ml.model.update_or_create_last_trained_row_id")
+    @patch("ml.model.load_history_training_data")  # Mock the history loader
     @patch("joblib.load")  # Mock `joblib.load` to avoid loading from file
     def test_incremental_training_with_enough_data(
-        self, mock_joblib_load, mock_get_session, mock_fit
+        self, mock_joblib_load, mock_load_data, mock_update_row_id, mock_fit, _
     ):
-        # Create a mock session and mock return for `get_database_session`
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
-
         # Create a mock model to be returned by `joblib.load`
         mock_model = XGBClassifier()
         mock_joblib_load.return_value = mock_model
 
-        # Define mock data similar to your database records
-        @dataclass
-        class HistoryRecord:
-            id: int
-            match_id: int
-            actual_result: int
-            awg: float
-
-        mock_data = [
-            HistoryRecord(id=1, match_id=1, actual_result=1, awg=0.1),
-            HistoryRecord(id=2, match_id=2, actual_result=0, awg=0.1),
-            HistoryRecord(id=3, match_id=3, actual_result=1, awg=0.1),
-            HistoryRecord(id=4, match_id=4, actual_result=0, awg=0.1),
-            HistoryRecord(id=5, match_id=5, actual_result=1, awg=0.1),
-        ]
-
-        # Setup the session mock to return our mock history data
-        mock_session.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = (
-            mock_data
-        )
+        # Columnar batch as returned by the loader: features, labels, row ids
+        features = np.full((5, len(HISTORY_FEATURE_COLUMNS)), 0.1, dtype=np.float32)
+        labels = np.array([1, 0, 1, 0, 1], dtype=np.float32)
+        row_ids = np.array([1, 2, 3, 4, 5], dtype=np.int64)
+        mock_load_data.return_value = (features, labels, row_ids)
 
         # Call the method under test
         with self.assertLogs("ml.model", level="INFO") as log:
@@ -145,19 +167,73 @@ class TestMainML(unittest.TestCase):
                 for message in log.output
             )
 
+        mock_load_data.assert_called_once_with(after_row_id=0, limit=5)
+        X_new = mock_fit.call_args[0][0]
+        self.assertEqual(X_new.columns.tolist(), HISTORY_FEATURE_COLUMNS)
+        mock_update_row_id.assert_called_once_with(5)
+        self.assertEqual(self.main_ml.last_trained_row_id, 5)
+
     @patch("joblib.dump")
     @patch.object(XGBClassifier, "fit")
-    @patch("ml.model.get_database_session")
-    def test_incremental_training_with_no_data(
-        self, mock_get_session, mock_fit, mock_joblib_dump
+    @patch("ml.model.update_or_create_last_trained_row_id")
+    @patch("ml.model.load_history_training_data")
+    @patch("joblib.load")
+    def test_incremental_training_catch_up(
+        self, mock_joblib_load, mock_load_data, mock_update_row_id, mock_fit, mock_dump
     ):
-        # Mock the session and return a mock session object
-        mock_session = MagicMock()
-        mock_get_session.return_value = mock_session
+        mock_joblib_load.return_value = XGBClassifier()
+
+        # 12 pending rows make two full batches of 5, the last 2 rows wait
+        features = np.zeros((12, len(HISTORY_FEATURE_COLUMNS)), dtype=np.float32)
+        labels = np.array([0, 1] * 6, dtype=np.float32)
+        row_ids = np.arange(101, 113, dtype=np.int64)
+        mock_load_data.return_value = (features, labels, row_ids)
+
+        self.main_ml.incremental_train_with_new_data(batch_size=5, catch_up=True)
+
+        mock_load_data.assert_called_once_with(after_row_id=0, limit=None)
+        mock_joblib_load.assert_called_once()
+        self.assertEqual(mock_fit.call_count, 2)
+        self.assertEqual(len(mock_fit.call_args_list[1][0][0]), 5)
+        mock_dump.assert_called_once()
+        mock_update_row_id.assert_called_once_with(110)
+        self.assertEqual(self.main_ml.last_trained_row_id, 110)
+
+    @patch("joblib.dump")
+    def test_train_and_save_model_external(self, mock_joblib_dump):
+        def chunks():
+            for start in range(0, 100, 30):
+                end = start + 30
+                chunk = self.df.iloc[start:end]
+                yield chunk.drop(columns=["target"]), chunk["target"]
+
+        self.main_ml.xgb_model = XGBClassifier(random_state=42, n_estimators=10)
+        with self.assertLogs(logger, level="INFO") as log:
+            self.main_ml.train_and_save_model_external(chunks)
+
+        # Every fifth row is held out
+        self.assertIn("INFO:ml.model:Training on 80 rows of 5.", log.output)
+        mock_joblib_dump.assert_called_once_with(
+            self.main_ml.xgb_model, self.model_path
+        )
+        self.assertEqual(len(self.main_ml.xgb_model.get_booster().get_dump()), 10)
+        probabilities = self.main_ml.xgb_model.predict_proba(
+            self.df.drop(columns=["target"])
+        )
+        self.assertEqual(probabilities.shape, (100, 2))
+        self.assertTrue(any("Classification Report" in line for line in log.output))
 
+    @patch("joblib.dump")
+    @patch.object(XGBClassifier, "fit")
+    @patch("ml.model.load_history_training_data")
+    def test_incremental_training_with_no_data(
+        self, mock_load_data, mock_fit, mock_joblib_dump
+    ):
         # Mock no new data
-        mock_session.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = (
-            []
+        mock_load_data.return_value = (
+            np.empty((0, len(HISTORY_FEATURE_COLUMNS)), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int64),
         )
 
         with self.assertLogs(logger, level="INFO") as log:
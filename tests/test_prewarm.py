@@ -0,0 +1,114 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import unittest
+from unittest.mock import patch, MagicMock
+
+from structure.jobs import QueueFullError
+from structure.prewarm import PredictionCache, PredictionRefresher
+from structure.struct import Prediction
+
+
+class TestPredictionCache(unittest.TestCase):
+    def test_get_put_and_expiry(self):
+        cache = PredictionCache(max_age=60)
+        prediction = Prediction(MagicMock(match_id=1), 1, [0.3, 0.7])
+
+        cache.put(1, "match", prediction)
+
+        self.assertIs(cache.get("1", "match"), prediction)
+        self.assertIsNone(cache.get(1, "hero_pick"))
+
+        prediction.computed_at -= 61
+        self.assertIsNone(cache.get(1, "match"))
+
+    def test_retain_drops_finished_matches(self):
+        cache = PredictionCache(max_age=60)
+        cache.put(1, "match", Prediction(MagicMock(), 1))
+        cache.put(2, "match", Prediction(MagicMock(), 0))
+
+        cache.retain({"2"})
+
+        self.assertEqual(cache.match_ids(), {"2"})
+
+    def test_expired_matches_are_recomputed(self):
+        cache = PredictionCache(max_age=60)
+        prediction = Prediction(MagicMock(), 1)
+        cache.put(1, "match", prediction)
+
+        prediction.computed_at -= 61
+        self.assertEqual(cache.match_ids(), set())
+        cache.retain({"1"})
+        self.assertIsNone(cache.get(1, "match"))
+        self.assertEqual(cache._entries, {})
+
+
+@patch("structure.prewarm.Dota2API")
+class TestPredictionRefresher(unittest.TestCase):
+    def setUp(self):
+        self.cache = PredictionCache(max_age=60)
+        self.pool = MagicMock()
+
+    def make_refresher(self, mock_dota_api, live_match_ids):
+        api = mock_dota_api.return_value
+        api.fetch_live_matches.return_value = [
+            {"match_id": match_id} for match_id in live_match_ids
+        ]
+        api.is_valid_match.side_effect = lambda match_data: match_data["match_id"] != 3
+        return PredictionRefresher(self.cache, self.pool, interval=60)
+
+    def test_refresh_queues_new_valid_matches(self, mock_dota_api):
+        self.cache.put(1, "match", Prediction(MagicMock(), 1))
+        self.cache.put(9, "match", Prediction(MagicMock(), 1))
+        refresher = self.make_refresher(mock_dota_api, [1, 2, 3])
+
+        self.assertEqual(refresher.refresh(), 1)
+
+        # Match 1 is cached, 3 is still drafting and 9 is no longer live
+        self.pool.submit.assert_called_once_with(
+            "2", refresher.prewarm, "2", {"match_id": 2}, name="prewarm"
+        )
+        self.assertEqual(self.cache.match_ids(), {"1"})
+
+        # A match being computed is not queued twice
+        self.assertEqual(refresher.refresh(), 0)
+
+    def test_full_pool_defers_matches(self, mock_dota_api):
+        refresher = self.make_refresher(mock_dota_api, [1, 2])
+        self.pool.submit.side_effect = QueueFullError("full")
+
+        self.assertEqual(refresher.refresh(), 0)
+
+        self.pool.submit.side_effect = None
+        self.assertEqual(refresher.refresh(), 2)
+
+    @patch("structure.prewarm.Markups")
+    def test_prewarm_caches_both_predictions(self, mock_markups, mock_dota_api):
+        refresher = self.make_refresher(mock_dota_api, [1])
+        match_prediction = Prediction(MagicMock(), 1, [0.2, 0.8])
+        hero_pick_prediction = Prediction(MagicMock(), 0)
+        mock_markups.compute_match_prediction.return_value = match_prediction
+        mock_markups.compute_hero_pick_prediction.return_value = hero_pick_prediction
+        refresher.refresh()
+
+        refresher.prewarm("1", {"match_id": 1})
+
+        # The match and its players are built once for both models
+        mock_dota_api.return_value.create_match_object.assert_called_once_with(
+            {"match_id": 1}, imputer=None
+        )
+        self.assertIs(self.cache.get(1, "match"), match_prediction)
+        self.assertIs(self.cache.get(1, "hero_pick"), hero_pick_prediction)
+        self.assertEqual(refresher.refresh(), 0)
+
+    @patch("structure.prewarm.Markups")
+    def test_failed_match_is_not_retried(self, mock_markups, mock_dota_api):
+        refresher = self.make_refresher(mock_dota_api, [1])
+        mock_markups.compute_match_prediction.side_effect = ValueError("4 players")
+        refresher.refresh()
+
+        refresher.prewarm("1", {"match_id": 1})
+
+        self.assertIsNone(self.cache.get(1, "match"))
+        self.assertEqual(refresher.refresh(), 0)
@@ -0,0 +1,86 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import unittest
+from unittest.mock import MagicMock
+
+from structure.projection import (
+    MATCH_PROJECTION,
+    MATCH_RESULT_PROJECTION,
+    build,
+    decode,
+    project,
+)
+
+
+def parse_events(value, prefix=""):
+    """The (prefix, event, value) events ijson.parse reports for `value`."""
+    if isinstance(value, dict):
+        yield prefix, "start_map", None
+        for key, item in value.items():
+            yield prefix, "map_key", key
+            yield from parse_events(item, f"{prefix}.{key}" if prefix else key)
+        yield prefix, "end_map", None
+    elif isinstance(value, list):
+        yield prefix, "start_array", None
+        for item in value:
+            yield from parse_events(item, f"{prefix}.item" if prefix else "item")
+        yield prefix, "end_array", None
+    else:
+        yield prefix, "number", value
+
+
+def match_payload():
+    return {
+        "match_id": 1,
+        "radiant_win": True,
+        "objectives": [{"type": "CHAT_MESSAGE_FIRSTBLOOD", "players": [1, 2]}],
+        "chat": [{"key": "gg"}] * 100,
+        "players": [
+            {
+                "account_id": account_id,
+                "kills": 5,
+                "hero_healing": 0,
+                "gold_t": list(range(60)),
+                "purchase_log": [{"time": 1, "key": "tango"}],
+            }
+            for account_id in (1, 2)
+        ],
+    }
+
+
+class TestProjection(unittest.TestCase):
+    expected = {
+        "radiant_win": True,
+        "players": [
+            {"account_id": 1, "kills": 5, "hero_healing": 0},
+            {"account_id": 2, "kills": 5, "hero_healing": 0},
+        ],
+    }
+
+    def test_project_decoded_match(self):
+        self.assertEqual(project(match_payload(), MATCH_PROJECTION), self.expected)
+        self.assertEqual(
+            project(match_payload(), MATCH_RESULT_PROJECTION), {"radiant_win": True}
+        )
+
+    def test_build_from_events(self):
+        self.assertEqual(
+            build(parse_events(match_payload()), MATCH_PROJECTION), self.expected
+        )
+        self.assertEqual(
+            build(parse_events(match_payload()), MATCH_RESULT_PROJECTION),
+            {"radiant_win": True},
+        )
+        self.assertEqual(build(parse_events([1, [2]]), {}), [1, [2]])
+
+    def test_decode_without_a_stream(self):
+        response = MagicMock()
+        response.json.return_value = match_payload()
+
+        self.assertEqual(decode(response, MATCH_PROJECTION), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
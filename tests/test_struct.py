@@ -1,6 +1,7 @@
 # © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
 # All rights reserved.
 # This code is licensed under the MIT License. See LICENSE file for details.
+import time
 import unittest
 from dataclasses import dataclass
 from unittest.mock import patch, MagicMock, Mock
@@ -13,12 +14,17 @@ from structure.struct import (
     Tournament,
     Dota2API,
     Markups,
+    Prediction,
 )
+from structure import http_client
+from structure.http_client import ANONYMOUS_ACCOUNT_ID, negative_cache
+from structure.prewarm import PredictionCache
 
 
 @dataclass
 class HeroD:
     name: str
+    stale: bool = False
 
 
 @dataclass
@@ -39,9 +45,15 @@ class MatchD:
     match_id: int
     dire_team: Team
     radiant_team: Team
+    stale: bool = False
+
+    uses_stale_data = Match.uses_stale_data
 
 
 class TestHero(unittest.TestCase):
+    def setUp(self):
+        http_client.reset()
+
     @patch("requests.get")
     def test_get_hero_features_success(self, mock_get):
         mock_get.return_value.status_code = 200
@@ -165,6 +177,8 @@ class TestHero(unittest.TestCase):
 
 
 class PlayerTest(unittest.TestCase):
+    def setUp(self):
+        http_client.reset()
 
     @patch("requests.get")
     @patch.object(Hero, "get_hero_features")
@@ -243,6 +257,125 @@ class PlayerTest(unittest.TestCase):
         self.assertEqual(player.tower_damage, 3000)
         self.assertEqual(player.hero_healing, 2000)
 
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_deadline_stops_fetching(self, mock_hero_features, mock_get):
+        recent_matches = MagicMock(status_code=200)
+        recent_matches.json.return_value = [{"match_id": i} for i in range(10)]
+        match = MagicMock(status_code=200)
+        match.json.return_value = {"players": [{"account_id": 1, "kills": 4}]}
+
+        def slow_get(url, timeout=None, **kwargs):
+            self.assertIsNotNone(timeout)
+            if "/players/" in url:
+                return recent_matches
+            time.sleep(0.1)
+            return match
+
+        mock_get.side_effect = slow_get
+
+        start = time.time()
+        player = Player(1, "Player1", 1, 0, deadline=time.time() + 0.25)
+
+        self.assertLess(time.time() - start, 1)
+        self.assertGreater(player.matches_used, 0)
+        self.assertLess(player.matches_used, 10)
+        self.assertEqual(player.kills, 4)
+
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_failed_requests_give_up_at_deadline(self, mock_hero_features, mock_get):
+        recent_matches = MagicMock(status_code=200)
+        recent_matches.json.return_value = [{"match_id": 1}]
+        mock_get.side_effect = [recent_matches] + [MagicMock(status_code=500)] * 5
+
+        start = time.time()
+        player = Player(1, "Player1", 1, 0, deadline=time.time() + 0.3)
+
+        # Without a deadline five retries would sleep for eight seconds
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(player.matches_used, 0)
+
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_teammates_share_projected_matches(self, mock_hero_features, mock_get):
+        recent_matches = MagicMock(status_code=200)
+        recent_matches.json.return_value = [{"match_id": 7}]
+        match = MagicMock(status_code=200)
+        match.json.return_value = {
+            "radiant_win": False,
+            "chat": [{"key": "gg"}],
+            "players": [
+                {"account_id": 1, "kills": 4, "gold_t": [0, 100]},
+                {"account_id": 2, "kills": 8, "gold_t": [0, 200]},
+            ],
+        }
+        mock_get.side_effect = [recent_matches, match, recent_matches]
+
+        self.assertEqual(Player(1, "Player1", 1, 0).kills, 4)
+        self.assertEqual(Player(2, "Player2", 1, 0).kills, 8)
+
+        # The match was fetched once and only its projected fields are kept
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(
+            http_client.match_cache.get(7),
+            {
+                "radiant_win": False,
+                "players": [
+                    {"account_id": 1, "kills": 4},
+                    {"account_id": 2, "kills": 8},
+                ],
+            },
+        )
+
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_anonymous_player_is_not_requested(self, mock_hero_features, mock_get):
+        for account_id in (None, ANONYMOUS_ACCOUNT_ID):
+            player = Player(account_id, "Anonymous", 1, 0)
+            self.assertEqual(player.matches_used, 0)
+
+        mock_get.assert_not_called()
+        self.assertEqual(negative_cache.skipped_requests, 2)
+
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_private_profile_is_remembered(self, mock_hero_features, mock_get):
+        mock_get.return_value = MagicMock(status_code=200)
+        mock_get.return_value.json.return_value = []
+
+        Player(1, "Player1", 1, 0)
+        Player(1, "Player1", 1, 0)
+
+        mock_get.assert_called_once()
+        self.assertEqual(negative_cache.skipped_requests, 1)
+
+    @patch("structure.struct.sleep")
+    @patch("requests.get")
+    @patch.object(Hero, "get_hero_features", return_value=None)
+    def test_missing_and_failing_matches_are_remembered(
+        self, mock_hero_features, mock_get, mock_sleep
+    ):
+        recent_matches = MagicMock(status_code=200)
+        recent_matches.json.return_value = [{"match_id": 1}, {"match_id": 2}]
+        responses = {"1": MagicMock(status_code=404), "2": MagicMock(status_code=500)}
+
+        def get(url, timeout=None, **kwargs):
+            if "/players/" in url:
+                return recent_matches
+            return responses[url.split("/matches/")[1].split("?")[0]]
+
+        mock_get.side_effect = get
+
+        Player(1, "Player1", 1, 0)
+        # A 404 is not retried, a 500 is retried five times
+        self.assertEqual(mock_get.call_count, 1 + 1 + 5)
+
+        mock_get.reset_mock()
+        Player(1, "Player1", 1, 0)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(negative_cache.skipped_requests, 2)
+
 
 class TestTeam(unittest.TestCase):
 
@@ -595,6 +728,19 @@ class TestTournament(unittest.TestCase):
         # Assert no matches are added to the tournament in case of failure
         self.assertEqual(len(tournament.matches), 0)
 
+    @patch("requests.get")
+    def test_load_match_skips_missing_match(self, mock_get):
+        mock_get.return_value.status_code = 404
+
+        tournament = Tournament(league_id=1, name="Tournament A")
+        match_info = {
+            "match_id": 1,
+            "radiant_team_id": 1,
+            "dire_team_id": 2,
+            "radiant_win": True,
+        }
+        self.assertIsNone(tournament.load_match(match_info))
+
 
 class TestMarkups(unittest.TestCase):
     def setUp(self):
@@ -675,9 +821,8 @@ class TestMarkups(unittest.TestCase):
         # Check if the markup is generated
         self.assertEqual(markup, "Mocked Buttons")
 
-    @patch("structure.struct.Dota2API")
-    @patch("structure.struct.MainML")
-    def test_make_prediction_for_selected_match(self, mock_ml, mock_dota_api):
+    def run_progressive_prediction(self, mock_ml, mock_dota_api):
+        """Predicts a match whose ten players are built instantly; returns the edits."""
         mock_dota_api_instance = MagicMock()
         mock_dota_api.return_value = mock_dota_api_instance
 
@@ -696,13 +841,26 @@ class TestMarkups(unittest.TestCase):
         # Create a Match instance
         mock_match = MatchD(match_id=1, dire_team=dire_team, radiant_team=radiant_team)
 
-        # Mocking the return value for build_single_match
-        mock_dota_api_instance.build_single_match.return_value = mock_match
+        # Building the match reports each player whose history was fetched
+        def create_match_object(match_data, on_progress=None, **kwargs):
+            for built in range(1, 11):
+                if on_progress:
+                    on_progress(built, 10)
+            return mock_match
+
+        mock_dota_api_instance.create_match_object.side_effect = create_match_object
+        mock_dota_api_instance.get_single_match_online_data.return_value = {
+            "match_id": 1,
+            "players": [{"team": i // 5} for i in range(10)],
+        }
 
         # Mocking the return value for get_match_data_for_prediction
         mock_match.get_match_data_for_prediction = MagicMock(
             return_value=(MagicMock(), MagicMock())
         )
+        mock_match.get_hero_match_data_for_prediction = MagicMock(
+            return_value=(MagicMock(), MagicMock())
+        )
 
         # Mock the predict method to return prediction and probability
         mock_ml_instance = mock_ml.return_value  # Get the mocked instance of MainML
@@ -713,134 +871,203 @@ class TestMarkups(unittest.TestCase):
 
         call = MagicMock()
         call.message.chat.id = 12345
+        self.bot.send_message.return_value.message_id = 777
 
         # Call the method under test
-        self.markups.make_prediction_for_selected_match(call, match_id=1)
+        with patch("structure.struct.insert_match_result"):
+            self.markups.make_prediction_for_selected_match(call, match_id=1)
+
+        # One reply is sent at once and then edited in place
+        self.bot.send_message.assert_called_once()
+        self.assertTrue(
+            all(
+                call.kwargs["message_id"] == 777
+                for call in self.bot.edit_message_text.call_args_list
+            )
+        )
+        return [
+            call.kwargs["text"] for call in self.bot.edit_message_text.call_args_list
+        ]
 
-        # Check if the bot sent the message correctly
-        self.bot.send_message.assert_called()
+    @patch("structure.struct.progress_edit_interval", 0)
+    @patch("structure.struct.Dota2API")
+    @patch("structure.struct.MainML")
+    def test_make_prediction_for_selected_match(self, mock_ml, mock_dota_api):
+        edits = self.run_progressive_prediction(mock_ml, mock_dota_api)
+
+        self.assertIn(
+            "Quick estimate (hero picks):</b> Radiant pick is stronger", edits[0]
+        )
+        self.assertIn("Fetching player histories: 0/10", edits[0])
+        self.assertIn("Fetching player histories: 10/10", edits[-2])
+        self.assertIn("Radiant: 80.00%, Dire: 20.00%", edits[-1])
 
     @patch("structure.struct.Dota2API")
     @patch("structure.struct.MainML")
-    @patch("structure.struct.sleep", side_effect=None)
-    def test_follow_dota_plus_for_selected_match(
-        self, mock_sleep, mock_MainML, mock_Dota2API
-    ):
-        # Mock TeleBot instance
-        mock_bot_instance = MagicMock()
-
-        # Setup mocks for Dota2API
-        mock_api_instance = mock_Dota2API.return_value
-
-        # Mock ML model loading and prediction
-        mock_ml_instance = mock_MainML.return_value
-        mock_ml_instance.load_model.return_value = None
-        mock_ml_instance.predict.return_value = (None, [[0.7, 0.3]])
-
-        # Mock match data responses with complete structure
-        match_data_live = {
-            "radiant_team": {"team_name": "Radiant"},
-            "dire_team": {"team_name": "Dire"},
-            "scoreboard": {
-                "duration": 1800,  # 30 minutes in seconds
-                "radiant": {
-                    "players": [
-                        {
-                            "account_id": 1,
-                            "hero_id": 1,
-                            "kills": 1,
-                            "death": 1,
-                            "assists": 1,
-                            "gold_per_min": 1,
-                            "xp_per_min": 1,
-                            "net_worth": 1,
-                            "last_hits": 1,
-                            "denies": 1,
-                            "level": 1,
-                        }
-                        for _ in range(5)
-                    ]  # Mock 5 players for Radiant
-                },
-                "dire": {
-                    "players": [
-                        {
-                            "account_id": 1,
-                            "hero_id": 1,
-                            "kills": 1,
-                            "death": 1,
-                            "assists": 1,
-                            "gold_per_min": 1,
-                            "xp_per_min": 1,
-                            "net_worth": 1,
-                            "last_hits": 1,
-                            "denies": 1,
-                            "level": 1,
-                        }
-                        for _ in range(5)
-                    ]  # Mock 5 players for Dire
-                },
-            },
-        }
-        match_data_finished = None  # Match data is None when finished
+    def test_progress_edits_are_throttled(self, mock_ml, mock_dota_api):
+        edits = self.run_progressive_prediction(mock_ml, mock_dota_api)
+
+        # Players built within a second of the first edit are not shown one by one
+        self.assertEqual(len(edits), 2)
+        self.assertIn("Fetching player histories: 0/10", edits[0])
+        self.assertIn("Radiant: 80.00%, Dire: 20.00%", edits[1])
+
+    @patch("structure.struct.progress_edit_interval", 0)
+    @patch("structure.struct.current_job")
+    @patch("structure.struct.Dota2API")
+    @patch("structure.struct.MainML")
+    def test_cancelled_prediction_stops(self, mock_ml, mock_dota_api, mock_job):
+        mock_job.return_value.cancelled = True
+
+        edits = self.run_progressive_prediction(mock_ml, mock_dota_api)
 
-        # Mock the API call for match data
-        mock_api_instance.get_single_match_online_data.side_effect = [
-            match_data_live,  # 1st live update
-            match_data_finished,  # Match finished, returns None
+        # No progress after the first edit, and only the quick estimate is predicted
+        self.assertEqual(len(edits), 2)
+        self.assertEqual(edits[-1], "Prediction cancelled.")
+        self.assertEqual(mock_ml.return_value.predict.call_count, 1)
+
+    @patch("structure.struct.current_job")
+    @patch("structure.struct.Dota2API")
+    @patch("structure.struct.MainML")
+    def test_cancelled_matches_markup_stops(self, mock_ml, mock_dota_api, mock_job):
+        mock_job.return_value.cancelled = True
+        mock_dota_api.return_value.get_live_tournaments.return_value = [
+            MagicMock(matches=[MagicMock(), MagicMock()])
         ]
+        call = MagicMock()
 
-        # Create the bot instance
-        your_bot_instance = Markups(bot=mock_bot_instance)
+        self.markups.gen_dota2_matches_markup(call)
 
-        # Create a fake call object
-        fake_call = MagicMock()
-        fake_call.message.chat.id = 123456
-        match_id = 98765
+        mock_ml.assert_not_called()
+        self.assertEqual(
+            self.bot.send_message.call_args.kwargs["text"], "<b>Cancelled</b>"
+        )
+
+    @patch("structure.struct.Dota2API")
+    def test_make_prediction_for_finished_match(self, mock_dota_api):
+        mock_dota_api.return_value.get_single_match_online_data.return_value = None
+        call = MagicMock()
+        call.message.chat.id = 12345
+
+        self.markups.make_prediction_for_selected_match(call, match_id=1)
 
-        # Mock send_message to simulate sending the first message
-        mock_msg = MagicMock()
-        mock_msg.message_id = 1111
-        mock_bot_instance.send_message.return_value = mock_msg
-
-        # Invoke the method
-        your_bot_instance.follow_dota_plus_for_selected_match(fake_call, match_id)
-
-        # Check if `edit_message_text` was called
-        edit_calls = mock_bot_instance.edit_message_text.call_args_list
-        print(
-            "Edit message calls:", edit_calls
-        )  # Debugging step to see what was captured
-
-        # Assertions for `edit_message_text`
-        self.assertEqual(len(edit_calls), 2, "Expected 2 edit message calls")
-
-        # Check the first call: the match is still live
-        first_call_args = edit_calls[0].kwargs
-        self.assertEqual(len(first_call_args), 3, "First call should have 3 arguments")
-        print("First call args:", first_call_args)  # Debugging step
-        self.assertIn("Match is live", first_call_args["text"])
-        self.assertIn("Radiant vs Dire", first_call_args["text"])
         self.assertIn(
-            "Probabilities: Radiant: 30.00%, Dire: 70.00%", first_call_args["text"]
+            "no longer live", self.bot.edit_message_text.call_args.kwargs["text"]
         )
 
-        # Check the second call: the match is finished
-        second_call_args = edit_calls[1].kwargs
-        self.assertEqual(
-            len(second_call_args), 3, "Second call should have 3 arguments"
+    @patch("structure.struct.insert_match_result")
+    @patch("structure.struct.Dota2API")
+    def test_make_prediction_from_cache(self, mock_dota_api, mock_insert):
+        match = MatchD(
+            match_id=1,
+            dire_team=TeamD(team_name="Dire Team", team_id=2, players=[]),
+            radiant_team=TeamD(team_name="Radiant Team", team_id=3, players=[]),
+        )
+        cache = PredictionCache(max_age=60)
+        cache.put(1, "match", Prediction(match, 1, [0.2, 0.8], MagicMock()))
+
+        call = MagicMock()
+        call.message.chat.id = 12345
+
+        self.markups.make_prediction_for_selected_match(call, 1, cache)
+
+        # No waiting message and no OpenDota round trips, just the cached result
+        mock_dota_api.assert_not_called()
+        self.bot.send_message.assert_called_once()
+        text = self.bot.send_message.call_args.kwargs["text"]
+        self.assertIn("Radiant Wins", text)
+        self.assertIn("Radiant: 80.00%, Dire: 20.00%", text)
+        self.assertIn("Computed at", text)
+        mock_insert.assert_called_once()
+
+    def test_stale_data_is_marked(self):
+        team = TeamD(
+            team_name="Dire Team",
+            team_id=2,
+            players=[PlayerD(name="Player1", hero=HeroD(name="Hero1", stale=True))],
+        )
+        match = MatchD(match_id=1, dire_team=team, radiant_team=team)
+
+        prediction = Prediction(match, 1, [0.2, 0.8], stale=match.uses_stale_data())
+
+        self.assertIn("Stale data", self.markups.render_match_prediction(prediction))
+        self.assertIn(
+            "Stale data", self.markups.render_hero_pick_prediction(prediction)
+        )
+        match.dire_team = match.radiant_team = TeamD("Dire Team", 2, [])
+        self.assertFalse(match.uses_stale_data())
+
+    def test_follow_dota_plus_for_selected_match(self):
+        mock_registry = MagicMock()
+        mock_msg = MagicMock()
+        mock_msg.message_id = 1111
+        self.bot.send_message.return_value = mock_msg
+
+        fake_call = MagicMock()
+        fake_call.message.chat.id = 123456
+
+        self.markups.follow_dota_plus_for_selected_match(
+            fake_call, 98765, mock_registry
         )
-        print("Second call args:", second_call_args)  # Debugging step
-        self.assertIn(f"Match {match_id} finished", second_call_args["text"])
-        self.assertIn("Radiant vs Dire", second_call_args["text"])
-        self.assertIn("Final win probability", second_call_args["text"])
+
+        # The message is handed to the shared tracker instead of a loop per user
+        self.assertIn("Tracking win probability", self.bot.send_message.call_args[0][1])
+        mock_registry.subscribe.assert_called_once_with(98765, 123456, 1111)
+        self.bot.edit_message_text.assert_not_called()
 
 
 class TestDota2API(unittest.TestCase):
     def setUp(self):
+        http_client.reset()
         # Initialize the Dota2API with a mock API key
         self.api_key = "mock_api_key"
         self.dota_api = Dota2API(api_key=self.api_key)
 
+    @patch("structure.struct.Player")
+    def test_build_players_imputes_players_without_history(self, mock_player):
+        fetched = MagicMock(matches_used=3, account_id=1, team=0)
+        fetched.hero.hero_id = 10
+        missing = MagicMock(matches_used=0, account_id=2, team=1)
+        missing.hero.hero_id = 20
+        mock_player.side_effect = [fetched, missing]
+        imputer = MagicMock()
+        imputer.impute.return_value = ({"kills": 3}, "hero prior")
+
+        players = self.dota_api.build_players(
+            [{"account_id": 1, "team": 0}, {"account_id": 2, "team": 1}],
+            deadline=time.time() + 10,
+            imputer=imputer,
+        )
+
+        self.assertEqual(players, [fetched, missing])
+        imputer.remember.assert_called_once_with(1, 10, vars(fetched))
+        imputer.impute.assert_called_once_with(2, 20)
+        missing.set_stats.assert_called_once_with({"kills": 3})
+        self.assertEqual(missing.imputed, "hero prior")
+
+    @patch("structure.struct.Player")
+    def test_create_match_object_reports_progress(self, mock_player):
+        players = [
+            {"account_id": 1, "name": "A", "hero_id": 1, "team": 0},
+            {"account_id": 2, "name": "B", "hero_id": 2, "team": 1},
+            {"account_id": 3, "name": "Caster", "hero_id": 0, "team": 2},
+        ]
+        match_data = {
+            "match_id": 5,
+            "radiant_team": {"team_name": "R", "team_id": 1},
+            "dire_team": {"team_name": "D", "team_id": 2},
+            "players": players,
+        }
+        progress = []
+
+        self.dota_api.create_match_object(
+            match_data, fetch_history=False, on_progress=lambda *p: progress.append(p)
+        )
+
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        # Without history the live feed entry stands in for the player's stats
+        self.assertIs(mock_player.call_args_list[0].kwargs["player_data"], players[0])
+
     @patch("requests.get")
     @patch("structure.struct.Player")
     @patch.object(
@@ -0,0 +1,251 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from structure.tracker import (
+    EditQueue,
+    MatchTracker,
+    TrackerRegistry,
+    TrackerLimitError,
+)
+
+
+def live_match_data(match_id=98765, duration=1800, radiant_kills=1):
+    player = {
+        "account_id": 1,
+        "hero_id": 1,
+        "kills": 1,
+        "death": 1,
+        "assists": 1,
+        "gold_per_min": 1,
+        "xp_per_min": 1,
+        "net_worth": 1,
+        "last_hits": 1,
+        "denies": 1,
+        "level": 1,
+    }
+    return {
+        "match_id": match_id,
+        "radiant_team": {"team_name": "Radiant"},
+        "dire_team": {"team_name": "Dire"},
+        "scoreboard": {
+            "duration": duration,  # 30 minutes in seconds by default
+            "radiant": {
+                "players": [dict(player, kills=radiant_kills) for _ in range(5)]
+            },
+            "dire": {"players": [dict(player) for _ in range(5)]},
+        },
+    }
+
+
+# Trackers are not scheduled on the background loop; the tests run them directly
+@patch.object(TrackerRegistry, "_schedule")
+class TestTrackerRegistry(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.registry = TrackerRegistry(
+            self.bot,
+            max_trackers=2,
+            interval=0,
+            edit_interval=0,
+            min_interval=0,
+            feed_refresh_interval=0,
+        )
+
+    def test_one_tracker_per_match(self, mock_schedule):
+        first = self.registry.subscribe(98765, 1, 11)
+        second = self.registry.subscribe("98765", 2, 22)
+
+        self.assertIs(first, second)
+        self.assertEqual(first.subscribers, {(1, 11), (2, 22)})
+        mock_schedule.assert_called_once_with(first)
+
+    def test_tracker_limit(self, mock_schedule):
+        self.registry.subscribe(1, 1, 11)
+        self.registry.subscribe(2, 1, 12)
+
+        with self.assertRaises(TrackerLimitError):
+            self.registry.subscribe(3, 1, 13)
+
+        # Joining an already tracked match is still allowed
+        self.registry.subscribe(2, 2, 21)
+
+    def test_last_unsubscribe_tears_tracker_down(self, mock_schedule):
+        tracker = self.registry.subscribe(98765, 1, 11)
+        tracker.future = MagicMock()
+        self.registry.subscribe(98765, 2, 22)
+
+        self.registry.unsubscribe(98765, 1, 11)
+        self.assertFalse(tracker.stopped)
+
+        self.assertEqual(self.registry.unsubscribe_chat(2), 1)
+        self.assertTrue(tracker.stopped)
+        tracker.future.cancel.assert_called_once()
+        self.assertEqual(self.registry.trackers, {})
+
+    @patch("structure.tracker.MainML")
+    @patch("structure.tracker.Dota2API")
+    def test_tracker_fans_out_one_prediction(
+        self, mock_dota_api, mock_main_ml, mock_schedule
+    ):
+        mock_ml_instance = mock_main_ml.return_value
+        mock_ml_instance.predict.return_value = (None, [[0.7, 0.3]])
+        mock_api_instance = mock_dota_api.return_value
+        mock_api_instance.fetch_live_matches.side_effect = [
+            [live_match_data(), live_match_data(match_id=1)],  # 1st live update
+            [live_match_data(match_id=1)],  # Match finished
+        ]
+
+        tracker = self.registry.subscribe(98765, 1, 11)
+        self.registry.subscribe(98765, 2, 22)
+        asyncio.run(tracker.run())
+
+        # The feed is fetched and the model is run once per tick, not per chat
+        self.assertEqual(mock_api_instance.fetch_live_matches.call_count, 2)
+        mock_ml_instance.predict.assert_called_once()
+        mock_ml_instance.load_model.assert_called_once()
+
+        edit_calls = self.bot.edit_message_text.call_args_list
+        self.assertEqual(
+            len(edit_calls), 4, "Expected a live and a final edit per chat"
+        )
+
+        texts = {}
+        for call in edit_calls:
+            key = (call.kwargs["chat_id"], call.kwargs["message_id"])
+            texts.setdefault(key, []).append(call.kwargs["text"])
+        self.assertEqual(set(texts), {(1, 11), (2, 22)})
+        for live_text, final_text in texts.values():
+            self.assertIn("Match is live", live_text)
+            self.assertIn("Radiant vs Dire", live_text)
+            self.assertIn("Probabilities: Radiant: 30.00%, Dire: 70.00%", live_text)
+
+            self.assertIn("Match 98765 finished", final_text)
+            self.assertIn("Radiant vs Dire", final_text)
+            self.assertIn("Final win probability", final_text)
+
+        # The finished tracker is gone so a new subscription starts a fresh one
+        self.assertEqual(self.registry.trackers, {})
+
+    def test_messages_are_edited_only_on_change(self, mock_schedule):
+        registry = TrackerRegistry(
+            self.bot, max_trackers=2, edit_threshold=0.02, edit_time_step=300
+        )
+        registry.edits = MagicMock()
+        tracker = registry.subscribe(98765, 1, 11)
+
+        def edited(text, state=None):
+            registry.edits.enqueue.reset_mock()
+            asyncio.run(tracker.broadcast(text, state))
+            return registry.edits.enqueue.call_count
+
+        self.assertEqual(edited("first", (0.50, 600)), 1)
+        self.assertEqual(edited("small move", (0.51, 660)), 0)
+        self.assertEqual(edited("probability", (0.52, 660)), 1)
+        self.assertEqual(edited("game time", (0.52, 960)), 1)
+
+        # A new subscriber is rendered straight away, the old one is up to date
+        registry.subscribe(98765, 2, 22)
+        self.assertEqual(edited("joined", (0.52, 960)), 1)
+        registry.edits.enqueue.assert_called_once_with(2, 22, "joined")
+
+        # The final message always goes out
+        self.assertEqual(edited("finished"), 2)
+
+    def test_edit_queue_merges_and_rate_limits(self, mock_schedule):
+        sent = []
+        self.bot.edit_message_text.side_effect = lambda **kwargs: sent.append(
+            (time.monotonic(), kwargs["message_id"], kwargs["text"])
+        )
+        edits = EditQueue(self.registry, min_interval=0.05)
+
+        async def send():
+            edits.enqueue(1, 11, "old")
+            edits.enqueue(1, 11, "new")
+            edits.enqueue(1, 12, "other")
+            edits.enqueue(2, 21, "another chat")
+            await edits.flush()
+
+        asyncio.run(send())
+
+        self.assertEqual(edits.merged, 1)
+        self.assertEqual(
+            sorted((message_id, text) for _, message_id, text in sent),
+            [(11, "new"), (12, "other"), (21, "another chat")],
+        )
+        chat_times = [when for when, message_id, _ in sent if message_id in (11, 12)]
+        self.assertGreaterEqual(chat_times[1] - chat_times[0], 0.04)
+
+    def test_stale_feed_is_marked(self, mock_schedule):
+        fresh = MatchTracker.render_live(live_match_data(), [[0.4, 0.6]])
+        stale = MatchTracker.render_live(live_match_data(), [[0.4, 0.6]], stale=True)
+
+        self.assertNotIn("Stale data", fresh)
+        self.assertIn("Stale data", stale)
+
+    def test_poll_delay_follows_the_game(self, mock_schedule):
+        registry = TrackerRegistry(
+            self.bot,
+            max_trackers=2,
+            interval=60,
+            min_interval=10,
+            feed_refresh_interval=5,
+            poll_budget=600,
+        )
+        quiet = live_match_data(duration=600)
+        calm = live_match_data(duration=660)
+        fight = live_match_data(duration=660, radiant_kills=2)
+
+        self.assertEqual(registry.poll_delay(None, live_match_data(duration=0)), 60)
+        self.assertEqual(registry.poll_delay(None, quiet), 10)
+        self.assertEqual(registry.poll_delay(quiet, calm), 60)
+        self.assertEqual(registry.poll_delay(quiet, fight), 10)
+        self.assertEqual(
+            registry.poll_delay(
+                live_match_data(duration=2400), live_match_data(duration=2460)
+            ),
+            30,
+        )
+
+        # Many tracked matches stretch every delay to stay within the budget
+        registry.poll_budget = 1
+        registry.subscribe(1, 1, 11)
+        registry.subscribe(2, 1, 12)
+        self.assertEqual(registry.poll_delay(quiet, fight), 120)
+
+    def test_many_trackers_share_one_feed(self, mock_schedule):
+        registry = TrackerRegistry(
+            self.bot,
+            max_trackers=500,
+            http_concurrency=3,
+            edit_interval=0,
+            feed_refresh_interval=60,
+        )
+
+        def slow_fetch():
+            time.sleep(0.01)
+            return []  # Every match is already finished
+
+        async def run_all(trackers):
+            await asyncio.gather(*(tracker.run() for tracker in trackers))
+
+        trackers = [
+            registry.subscribe(match_id, 1, match_id) for match_id in range(300)
+        ]
+        threads_before = threading.active_count()
+        with patch("structure.tracker.Dota2API") as mock_dota_api, patch(
+            "structure.tracker.MainML"
+        ):
+            mock_dota_api.return_value.fetch_live_matches.side_effect = slow_fetch
+            asyncio.run(run_all(trackers))
+
+            mock_dota_api.return_value.fetch_live_matches.assert_called_once()
+        self.assertEqual(registry.trackers, {})
+        # I/O runs on the registry's small pool, not on a thread per tracker
+        self.assertLessEqual(threading.active_count() - threads_before, 8)
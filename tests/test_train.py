@@ -0,0 +1,98 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import ANY, patch
+
+import pandas as pd
+
+from ml.train import MODELS, load_frames, train_models
+
+
+def training_frame():
+    return pd.DataFrame(
+        {"a": [0.1, 0.2, 0.3], "radiant_sum_obs": 0, "radiant_win": [1, 0, 1]}
+    )
+
+
+class TestTrain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        self.addCleanup(os.chdir, cwd)
+
+        patches = {
+            "load_training_data": patch(
+                "ml.train.load_training_data", side_effect=lambda path: training_frame()
+            ),
+            "build_match_features": patch(
+                "ml.train.build_match_features", side_effect=lambda df: df
+            ),
+            "scale_match_features": patch(
+                "ml.train.scale_match_features", side_effect=lambda df, path: df
+            ),
+            "prepare_hero_pick_data": patch(
+                "ml.train.prepare_hero_pick_data", side_effect=lambda df: df
+            ),
+        }
+        self.mocks = {name: p.start() for name, p in patches.items()}
+        self.addCleanup(patch.stopall)
+
+    def test_datasets_are_loaded_once(self):
+        frames = load_frames(list(MODELS))
+
+        self.assertEqual(self.mocks["load_training_data"].call_count, 2)
+        self.mocks["build_match_features"].assert_called_once()
+        self.assertEqual(
+            [
+                call.args[1]
+                for call in self.mocks["scale_match_features"].call_args_list
+            ],
+            ["scaler.pkl", "scaler_dota_plus.pkl"],
+        )
+        # Only the Dota Plus model drops the columns Dota Plus data does not have
+        self.assertIn("radiant_sum_obs", frames["match_predict"].columns)
+        self.assertNotIn("radiant_sum_obs", frames["dota_plus"].columns)
+        self.assertIn("radiant_sum_obs", frames["hero_pick"].columns)
+
+    @patch("ml.train.MainML")
+    def test_unchanged_models_are_skipped(self, mock_main_ml):
+        def save(features, target, profile, n_jobs):
+            _, model_path = mock_main_ml.call_args.args
+            open(model_path, "w").close()
+
+        mock_main_ml.return_value.train_and_save_model.side_effect = save
+
+        self.assertCountEqual(train_models(), list(MODELS))
+        self.assertEqual(mock_main_ml.call_count, 3)
+        mock_main_ml.return_value.train_and_save_model.assert_called_with(
+            ["a", "radiant_sum_obs"],
+            "radiant_win",
+            profile="default",
+            n_jobs=ANY,
+        )
+
+        self.assertEqual(train_models(), [])
+        self.assertEqual(train_models(["hero_pick"], force=True), ["hero_pick"])
+        # Other parameters are a change
+        self.assertEqual(train_models(["dota_plus"], profile="fast"), ["dota_plus"])
+
+        # A deleted model is trained again
+        os.remove("xgb_model.pkl")
+        self.assertEqual(train_models(["match_predict"]), ["match_predict"])
+
+    @patch("ml.train.MainML")
+    def test_failed_models_are_not_recorded(self, mock_main_ml):
+        mock_main_ml.return_value.train_and_save_model.side_effect = ValueError("bad")
+        with self.assertLogs("ml.train", "ERROR"):
+            self.assertEqual(train_models(["hero_pick"]), [])
+        self.assertFalse(os.path.exists("training_manifest.json"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from ml.tune import candidates, report, search
+
+GRID = {"max_depth": [1, 3], "learning_rate": [0.3], "n_estimators": [5, 20]}
+
+
+def training_frame(rows=200):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(rows, 4)), columns=["a", "b", "c", "d"])
+    df["radiant_win"] = (df["a"] + df["b"] * df["c"] > 0).astype(int)
+    return df
+
+
+class TestTune(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.trials_path = os.path.join(self.directory.name, "model.jsonl")
+
+    def test_candidates(self):
+        self.assertEqual(
+            candidates({"a": [1, 2], "b": [3]}), [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+        )
+
+    def test_search_ranks_and_resumes(self):
+        df = training_frame()
+        trials = search(df, self.trials_path, grid=GRID, n_folds=3, workers=2)
+
+        self.assertEqual(len(trials), 4)
+        losses = [trial["log_loss"] for trial in trials]
+        self.assertEqual(losses, sorted(losses))
+        for trial in trials:
+            self.assertTrue(0 <= trial["accuracy"] <= 1)
+            self.assertGreater(trial["latency_ms"], 0)
+        # The shared DMatrix is removed afterwards
+        self.assertEqual(os.listdir(self.directory.name), ["model.jsonl"])
+
+        # Finished trials are read back instead of run again
+        with patch("ml.tune.ProcessPoolExecutor") as mock_pool:
+            again = search(df, self.trials_path, grid=GRID, n_folds=3, workers=2)
+        mock_pool.assert_not_called()
+        self.assertEqual(again, trials)
+
+        # Other data is a different search
+        with open(self.trials_path) as file:
+            self.assertEqual(len(file.readlines()), 4)
+        search(df.iloc[:150], self.trials_path, grid=GRID, n_folds=3, workers=2)
+        with open(self.trials_path) as file:
+            keys = {json.loads(line)["key"] for line in file}
+        self.assertEqual(len(keys), 8)
+
+    def test_report(self):
+        trial = {
+            "params": {"max_depth": 3},
+            "accuracy": 0.75,
+            "log_loss": 0.5,
+            "latency_ms": 0.1,
+        }
+        with self.assertLogs("ml.tune") as logs:
+            report("match_predict", [trial])
+        self.assertIn("0.5000    0.7500", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# © 2024 Viktor Hamretskyi <masterhood13@gmail.com>
+# All rights reserved.
+# This code is licensed under the MIT License. See LICENSE file for details.
+
+import unittest
+
+from dataset.warehouse import Warehouse
+
+
+def match_payload(
+    match_id, radiant_heroes=(1, 2, 3, 4, 5), dire_heroes=(6, 7, 8, 9, 10)
+):
+    players = [
+        {
+            "player_slot": slot,
+            "isRadiant": slot < 128,
+            "account_id": hero_id * 100,
+            "name": f"Player {hero_id}",
+            "hero_id": hero_id,
+            "kills": hero_id,
+            "gold_t": [0, 100],
+        }
+        # Dire players listed first, slots out of order
+        for slot, hero_id in list(zip((132, 131, 130, 129, 128), dire_heroes[::-1]))
+        + list(zip(range(5), radiant_heroes))
+    ]
+    return {
+        "match_id": match_id,
+        "radiant_team_id": 1,
+        "radiant_name": "Team A",
+        "dire_team_id": 2,
+        "dire_name": "Team B",
+        "radiant_win": True,
+        "players": players,
+    }
+
+
+class TestWarehouse(unittest.TestCase):
+    def setUp(self):
+        self.warehouse = Warehouse(":memory:")
+        self.addCleanup(self.warehouse.close)
+        self.warehouse.add_league(1, "League A", [{"match_id": 10}, {"match_id": 11}])
+        self.warehouse.add_league(2, "League B", [{"match_id": 20}])
+        self.warehouse.add_match(match_payload(10))
+        self.warehouse.add_hero_stats(
+            [
+                {"id": 1, "localized_name": "Anti-Mage", "pro_win": 3, "pro_pick": 4},
+                {"id": 6, "localized_name": "Drow Ranger", "pro_pick": 0},
+            ]
+        )
+        self.warehouse.add_hero_matchups(
+            1,
+            [
+                {"hero_id": 9, "games_played": 4, "wins": 1},
+                {"hero_id": 2, "games_played": 4, "wins": 4},  # An ally
+                {"hero_id": 6, "games_played": 0, "wins": 0},
+                {"hero_id": 7, "games_played": 2, "wins": 1},
+            ],
+        )
+
+    def test_missing_data(self):
+        self.assertTrue(self.warehouse.has_league(1))
+        self.assertFalse(self.warehouse.has_league(3))
+        self.assertEqual(self.warehouse.missing_matches(), [11, 20])
+        self.assertEqual(self.warehouse.missing_matchups(), list(range(2, 11)))
+
+    def test_matches(self):
+        self.warehouse.add_match(match_payload(11, dire_heroes=(6, 7, 8, 9)))  # 5v4
+
+        ((league, match, players),) = self.warehouse.matches(["League A"])
+
+        self.assertEqual(league, "League A")
+        self.assertEqual(
+            match,
+            {
+                "match_id": 10,
+                "radiant_team_id": 1,
+                "radiant_team_name": "Team A",
+                "dire_team_id": 2,
+                "dire_team_name": "Team B",
+                "radiant_win": True,
+            },
+        )
+        self.assertEqual([player["hero_id"] for player in players], list(range(1, 11)))
+        self.assertEqual(players[0]["id"], 100)
+        self.assertEqual(players[0]["name"], "Player 1")
+        self.assertEqual(players[0]["hero_name"], "Anti-Mage")
+        self.assertEqual(players[0]["hero_winrate"], 0.75)
+        self.assertEqual(players[0]["kills"], 1)
+        self.assertEqual(players[0]["deaths"], 0)  # Missing stats are zero
+        self.assertEqual(players[1]["hero_name"], "Unknown Hero")
+        self.assertEqual(players[5]["hero_winrate"], 0)
+        self.assertNotIn("counter_picks", players[0])
+
+        self.assertEqual(list(self.warehouse.matches(["League B"])), [])
+
+    def test_counter_picks(self):
+        ((_, _, players),) = self.warehouse.matches(["League A"], counter_picks=True)
+
+        # Enemy heroes only, in the order of the matchups
+        self.assertEqual(players[0]["counter_picks"], [0.25, 0, 0.5])
+        self.assertEqual(players[1]["counter_picks"], [])
+
+    def test_payloads(self):
+        (payload,) = self.warehouse.payloads()
+        self.assertEqual(payload, match_payload(10))
+
+
+if __name__ == "__main__":
+    unittest.main()